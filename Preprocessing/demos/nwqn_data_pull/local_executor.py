@@ -0,0 +1,142 @@
+# Run the NWQN retrievals on a local process pool instead of lithops
+
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from random import randint
+from time import sleep
+
+import pandas as pd
+
+STATUS_FILE = "_retrieval_status.csv"
+STATUS_COLUMNS = ["site", "status", "message", "seconds"]
+# sites with these statuses are not retrieved again when a run is resumed
+FINISHED_STATUSES = ["done", "empty"]
+
+# shared by the worker processes of a local run; None when running on lithops
+_next_start = None
+_start_lock = None
+_start_interval = None
+
+
+def _init_worker(next_start, start_lock, start_interval):
+    global _next_start, _start_lock, _start_interval
+    _next_start = next_start
+    _start_lock = start_lock
+    _start_interval = start_interval
+
+
+def throttle():
+    """Wait for the next retrieval slot before querying NLDI and NWIS.
+
+    In a local run, retrievals start at most once every `1 / rate` seconds
+    across all worker processes. On lithops, where workers cannot share a
+    limiter, wait a random 0-5 seconds instead.
+    """
+    if _start_lock is None:
+        sleep(randint(0, 5))
+        return
+    if _start_interval == 0:
+        return
+    with _start_lock:
+        now = time.time()
+        start = max(now, _next_start.value)
+        _next_start.value = start + _start_interval
+    if start > now:
+        sleep(start - now)
+
+
+def destination(name):
+    """Location of an output dataset: a local directory in a local run, else the S3 bucket."""
+    local_path = os.environ.get("DESTINATION_PATH")
+    if local_path:
+        return os.path.join(local_path, name)
+    return f"s3://{os.environ.get('DESTINATION_BUCKET')}/{name}"
+
+
+def read_status(output_dir):
+    """Read the status of each site from earlier local runs."""
+    path = os.path.join(output_dir, STATUS_FILE)
+    if not os.path.isfile(path):
+        return pd.DataFrame(columns=STATUS_COLUMNS)
+    status = pd.read_csv(path, dtype={"site": str, "message": str}, keep_default_na=False)
+    # keep the latest status of each site
+    return status.drop_duplicates("site", keep="last")
+
+
+def _append_status(output_dir, record):
+    path = os.path.join(output_dir, STATUS_FILE)
+    pd.DataFrame([record], columns=STATUS_COLUMNS).to_csv(
+        path, mode="a", header=not os.path.isfile(path), index=False)
+
+
+def _timed(map_function, site):
+    start = time.perf_counter()
+    status = map_function(site)
+    return status, time.perf_counter() - start
+
+
+def run_local(map_function, sites, output_dir, max_workers=None, rate=1.0, retry_all=False):
+    """Run a retrieval for many sites on a local process pool.
+
+    The results are written by `map_function` to local Parquet datasets in
+    `output_dir` (see `destination`). The status of each site is appended to
+    `_retrieval_status.csv` as soon as it finishes, so an interrupted run can
+    be resumed: sites that are done or have no data are skipped, and sites
+    that failed are retried.
+
+    Parameters
+    ----------
+    map_function : callable
+        The retrieval function, e.g. `map_retrieval`. It is called with a
+        site number and returns "done", "empty", or "failed"; exceptions are
+        recorded as failures.
+    sites : list of str
+        Site numbers.
+    output_dir : str
+        The local directory of the output datasets.
+    max_workers : int, optional
+        The number of worker processes. Defaults to the number of CPUs.
+    rate : float, optional
+        The maximum number of retrievals started per second, shared by all
+        workers, to keep the load on NLDI and NWIS low. 0 or None starts
+        retrievals without waiting.
+    retry_all : bool, optional
+        Retrieve all sites again, including finished sites.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The status of each site retrieved in this run.
+    """
+    if rate is not None and rate < 0:
+        raise ValueError(f"The rate must be positive, or 0 for no limit, not {rate}")
+    start_interval = 1.0 / rate if rate else 0.0
+
+    os.makedirs(output_dir, exist_ok=True)
+    os.environ["DESTINATION_PATH"] = os.path.abspath(output_dir)
+
+    previous = read_status(output_dir)
+    finished = set(previous.loc[previous["status"].isin(FINISHED_STATUSES), "site"])
+    pending = [site for site in sites if retry_all or site not in finished]
+    print(f"{len(sites) - len(pending)} sites already retrieved, {len(pending)} to retrieve")
+
+    next_start = multiprocessing.Value("d", 0.0)
+    start_lock = multiprocessing.Lock()
+    records = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(next_start, start_lock, start_interval)) as executor:
+        futures = {executor.submit(_timed, map_function, site): site for site in pending}
+        for future in as_completed(futures):
+            site = futures[future]
+            try:
+                status, seconds = future.result()
+                record = [site, status or "done", "", round(seconds, 1)]
+            except Exception as e:
+                record = [site, "failed", str(e), None]
+            print(f"{site}: {record[1]} {record[2]}")
+            _append_status(output_dir, record)
+            records.append(record)
+
+    return pd.DataFrame(records, columns=STATUS_COLUMNS)
@@ -0,0 +1,125 @@
+# Local cache of the NLDI neighbor graph and the NWIS drainage areas of the NWQN sites
+
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+CACHE_DIR = os.environ.get("NLDI_CACHE_DIR", ".nldi_cache")
+# entries older than this are retrieved again
+CACHE_TTL_DAYS = float(os.environ.get("NLDI_CACHE_TTL_DAYS", 30))
+NEIGHBORS_FILE = "neighbors.json"
+DRAINAGE_AREAS_FILE = "drainage_areas.json"
+NAVIGATION_MODES = ["UM", "DM"]  # upstream and downstream
+
+
+class NeighborCache:
+    """Cache of the upstream and downstream neighbors and the drainage areas of sites.
+
+    The neighbors of a site are stored with the search distance of the NLDI
+    navigation, so that they are retrieved again if the distance changes.
+    Each entry records when it was retrieved and expires after `ttl_days`.
+
+    The cache is kept in two JSON files in `cache_dir`. `save` merges the
+    entries with those written by other processes since the cache was loaded
+    and replaces the files atomically; if two processes save at the same time,
+    the entries of one may be lost and are simply retrieved again later.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        The cache directory. Defaults to `NLDI_CACHE_DIR` or `.nldi_cache`.
+    ttl_days : float, optional
+        The time to live of the entries, in days. Defaults to
+        `NLDI_CACHE_TTL_DAYS` or 30 days.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, ttl_days=CACHE_TTL_DAYS):
+        self.cache_dir = cache_dir
+        self.ttl = timedelta(days=ttl_days)
+        self._neighbors = self._read(NEIGHBORS_FILE)
+        self._drainage_areas = self._read(DRAINAGE_AREAS_FILE)
+
+    def _read(self, name):
+        path = os.path.join(self.cache_dir, name)
+        if not os.path.isfile(path):
+            return {}
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable cache file {path}: {e}")
+            return {}
+
+    def _write(self, name, entries):
+        path = os.path.join(self.cache_dir, name)
+        merged = self._read(name)
+        for key, entry in entries.items():
+            if key not in merged or merged[key]["fetched"] <= entry["fetched"]:
+                merged[key] = entry
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(merged, f, indent=1, sort_keys=True)
+        os.replace(temp_path, path)
+        return merged
+
+    def _is_fresh(self, entry):
+        fetched = datetime.fromisoformat(entry["fetched"])
+        return datetime.now(timezone.utc) - fetched < self.ttl
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+    def drainage_areas(self, sites):
+        """Cached drainage areas of sites, in square miles.
+
+        Returns
+        -------
+        dict
+            The drainage area of each site with a current entry. The area is
+            NaN for sites that NWIS returned without a drainage area.
+        """
+        areas = {}
+        for site in sites:
+            entry = self._drainage_areas.get(site)
+            if entry is not None and self._is_fresh(entry):
+                area = entry["drain_area_va"]
+                areas[site] = np.nan if area is None else area
+        return areas
+
+    def set_drainage_areas(self, areas):
+        """Store the drainage areas of sites, given as {site: square miles}."""
+        fetched = self._now()
+        for site, area in areas.items():
+            area = None if area is None or np.isnan(area) else float(area)
+            self._drainage_areas[site] = {"drain_area_va": area, "fetched": fetched}
+
+    def neighbors(self, site, search_distance):
+        """Cached neighbors of a site, or None if they were not retrieved with this search distance.
+
+        Returns
+        -------
+        dict or None
+            The site numbers of the upstream (UM) and downstream (DM) neighbors.
+        """
+        entry = self._neighbors.get(site)
+        if (entry is None or not self._is_fresh(entry)
+                or not np.isclose(entry["search_distance"], search_distance)):
+            return None
+        return {mode: entry[mode] for mode in NAVIGATION_MODES}
+
+    def set_neighbors(self, site, search_distance, neighbors):
+        """Store the upstream (UM) and downstream (DM) neighbors of a site."""
+        entry = {mode: list(neighbors[mode]) for mode in NAVIGATION_MODES}
+        entry["search_distance"] = float(search_distance)
+        entry["fetched"] = self._now()
+        self._neighbors[site] = entry
+
+    def save(self):
+        """Write the cache, merged with entries saved by other processes."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._neighbors = self._write(NEIGHBORS_FILE, self._neighbors)
+        self._drainage_areas = self._write(DRAINAGE_AREAS_FILE, self._drainage_areas)
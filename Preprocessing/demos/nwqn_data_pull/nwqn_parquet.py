@@ -0,0 +1,190 @@
+# Typed Parquet datasets of the NWQN retrievals
+
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs
+
+COMPRESSION = "zstd"
+# strings with few distinct values, such as site numbers and codes, are dictionary encoded
+STRING = pa.dictionary(pa.int32(), pa.string())
+
+STREAMFLOW_SCHEMA = pa.schema([
+    ("datetime", pa.timestamp("ms", tz="UTC")),
+    ("site_no", STRING),
+    ("fill_site_no", STRING),
+    ("00060_Mean", pa.float32()),
+    ("00060_Mean_cd", STRING),
+])
+
+# WQP result columns that are not strings; the other columns are stored as dictionary-encoded strings
+SAMPLE_COLUMN_TYPES = {
+    "ActivityStartDate": pa.date32(),
+    "ActivityEndDate": pa.date32(),
+    "AnalysisStartDate": pa.date32(),
+    "ActivityStartDateTime": pa.timestamp("ms", tz="UTC"),
+    "ActivityEndDateTime": pa.timestamp("ms", tz="UTC"),
+    "ActivityDepthHeightMeasure/MeasureValue": pa.float64(),
+    "ActivityTopDepthHeightMeasure/MeasureValue": pa.float64(),
+    "ActivityBottomDepthHeightMeasure/MeasureValue": pa.float64(),
+    "ResultMeasureValue": pa.float64(),
+    "ResultDepthHeightMeasure/MeasureValue": pa.float64(),
+    "DetectionQuantitationLimitMeasure/MeasureValue": pa.float64(),
+}
+
+
+def _column_array(values, data_type):
+    """Convert a column to an Arrow array of the given type, coercing unparseable values to null."""
+    if pa.types.is_dictionary(data_type):
+        values = values.where(values.isna(), values.astype(str))
+        return pa.array(values.astype(object), type=pa.string(), from_pandas=True).dictionary_encode()
+    if pa.types.is_floating(data_type) or pa.types.is_integer(data_type):
+        values = pd.to_numeric(values, errors="coerce")
+    elif pa.types.is_timestamp(data_type):
+        values = pd.to_datetime(values, errors="coerce", utc=data_type.tz is not None)
+    elif pa.types.is_date(data_type):
+        values = pd.to_datetime(values, errors="coerce").dt.date
+    return pa.array(values, from_pandas=True).cast(data_type)
+
+
+def to_table(df, schema):
+    """Convert a DataFrame to an Arrow table with the given schema.
+
+    Columns of the schema that are missing from `df` are null; columns of
+    `df` that are not in the schema are dropped.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The data. Named index levels are treated as columns.
+    schema : pyarrow.Schema
+        The schema of the table.
+
+    Returns
+    -------
+    pyarrow.Table
+    """
+    df = df.reset_index(drop=all(name is None for name in df.index.names))
+    arrays = []
+    for field in schema:
+        if field.name in df.columns:
+            arrays.append(_column_array(df[field.name], field.type))
+        else:
+            arrays.append(pa.nulls(len(df), type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def samples_schema(df):
+    """The schema of the samples of a site: typed measures and dates, and dictionary-encoded strings."""
+    columns = df.reset_index().columns if any(df.index.names) else df.columns
+    return pa.schema([(name, SAMPLE_COLUMN_TYPES.get(name, STRING)) for name in columns])
+
+
+def _filesystem(path):
+    if "://" in path:
+        return pyarrow.fs.FileSystem.from_uri(path)
+    return pyarrow.fs.LocalFileSystem(), path
+
+
+def write_partition(table, dataset, partition_column):
+    """Append a table to a partitioned Parquet dataset.
+
+    The dataset is partitioned by the values of `partition_column` in
+    Hive-style directories, e.g. `site_no=01234567/`. The partitions written
+    are replaced, so a site that is retrieved again is not written twice;
+    the other partitions are kept.
+
+    Parameters
+    ----------
+    table : pyarrow.Table
+        The data, as returned by `to_table`.
+    dataset : str
+        The local path or URI (e.g. s3://bucket/name.parquet) of the dataset.
+    partition_column : str
+        The column to partition by.
+    """
+    filesystem, path = _filesystem(dataset)
+    partitioning = ds.partitioning(pa.schema([(partition_column, pa.string())]), flavor="hive")
+    # the partition values are stored in the directory names
+    table = table.set_column(
+        table.schema.get_field_index(partition_column),
+        partition_column,
+        table[partition_column].cast(pa.string()),
+    )
+    ds.write_dataset(
+        table,
+        path,
+        filesystem=filesystem,
+        format="parquet",
+        partitioning=partitioning,
+        basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet",
+        existing_data_behavior="delete_matching",
+        file_options=ds.ParquetFileFormat().make_write_options(compression=COMPRESSION),
+    )
+
+
+def _scalar(value, data_type):
+    """Convert a date to an Arrow scalar comparable with a column of the given type."""
+    timestamp = pd.Timestamp(value)
+    if pa.types.is_date(data_type):
+        return pa.scalar(timestamp.date(), type=data_type)
+    if data_type.tz is not None and timestamp.tz is None:
+        timestamp = timestamp.tz_localize(data_type.tz)
+    return pa.scalar(timestamp, type=data_type)
+
+
+def read_dataset(dataset, sites=None, start=None, end=None, columns=None,
+                 partition_column="site_no", date_column="datetime"):
+    """Read a partitioned NWQN dataset, loading only the requested sites and dates.
+
+    The site filter selects partition directories, and the date filter is
+    pushed down to the Parquet row-group statistics, so other sites and dates
+    are not read.
+
+    Parameters
+    ----------
+    dataset : str
+        The local path or URI of the dataset, e.g. nwqn-streamflow.parquet.
+    sites : list of str, optional
+        The site numbers (streamflow) or monitoring location identifiers
+        (samples) to read. Defaults to all sites.
+    start, end : str or datetime-like, optional
+        The first and last date to read, inclusive.
+    columns : list of str, optional
+        The columns to read. Defaults to all columns.
+    partition_column : str, optional
+        The partition column, "site_no" for streamflow and
+        "MonitoringLocationIdentifier" for samples.
+    date_column : str, optional
+        The date column, "datetime" for streamflow and "ActivityStartDate"
+        for samples.
+
+    Returns
+    -------
+    pandas.DataFrame
+    """
+    filesystem, path = _filesystem(dataset)
+    partitioning = ds.partitioning(pa.schema([(partition_column, pa.string())]), flavor="hive")
+    data = ds.dataset(path, filesystem=filesystem, format="parquet", partitioning=partitioning)
+
+    expression = None
+    if sites is not None:
+        expression = ds.field(partition_column).isin(list(sites))
+    date_type = data.schema.field(date_column).type
+    if start is not None:
+        condition = ds.field(date_column) >= _scalar(start, date_type)
+        expression = condition if expression is None else expression & condition
+    if end is not None:
+        end = pd.Timestamp(end)
+        if pa.types.is_timestamp(date_type) and end == end.normalize():
+            # a date includes the whole day
+            condition = ds.field(date_column) < _scalar(end + pd.Timedelta(days=1), date_type)
+        else:
+            condition = ds.field(date_column) <= _scalar(end, date_type)
+        expression = condition if expression is None else expression & condition
+
+    table = data.to_table(columns=columns, filter=expression)
+    # decode the dictionaries into pandas categoricals
+    return table.to_pandas()
@@ -1,15 +1,17 @@
 # Retrieve data from the National Water Quality Assessment Program (NAWQA)
 
-import lithops
+import argparse
 import math
-import os
+import numpy as np
 import pandas as pd
 
-from random import randint
 from time import sleep
 from dataretrieval import nldi, nwis, wqp
 
-DESTINATION_BUCKET = os.environ.get('DESTINATION_BUCKET')
+from local_executor import destination, run_local, throttle
+from neighbor_cache import NeighborCache, NAVIGATION_MODES
+from nwqn_parquet import samples_schema, to_table, write_partition
+
 PROJECT = "National Water Quality Assessment Program (NAWQA)"
 # some sites are not found in NLDI, avoid them for now
 NOT_FOUND_SITES = [
@@ -22,17 +24,24 @@ BAD_GEOMETRY_SITES = [
 ]
 
 BAD_NLDI_SITES = NOT_FOUND_SITES + BAD_GEOMETRY_SITES
+# number of sites per NWIS site service request
+NWIS_BATCH_SIZE = 100
+
+_neighbor_cache = None
 
 
 def map_retrieval(site):
-    """Map function to pull data from NWIS and WQP"""
+    """Map function to pull data from NWIS and WQP
+
+    Returns "done", "empty" if the site has no samples, or "failed".
+    """
     print(f"Retrieving samples from site {site}")
     # skip bad sites
     if site in BAD_NLDI_SITES:
         site_list = [site]
     # else query slowly
     else:
-        sleep(randint(0, 5))
+        throttle()
         site_list = find_neighboring_sites(site)
 
     # reformat for wqp
@@ -42,17 +51,21 @@ def map_retrieval(site):
                             project=PROJECT,
                             )
 
+    if df.empty:
+        print(f"No samples returned from site {site}")
+        return "empty"
+
     try:
         # merge sites
         df['MonitoringLocationIdentifier'] = f"USGS-{site}"
-        df.astype(str).to_parquet(f's3://{DESTINATION_BUCKET}/nwqn-samples.parquet',
-                                  engine='pyarrow',
-                                  partition_cols=['MonitoringLocationIdentifier'],
-                                  compression='zstd')
+        table = to_table(df, samples_schema(df))
+        write_partition(table, destination('nwqn-samples.parquet'), 'MonitoringLocationIdentifier')
         # optionally, `return df` for further processing
+        return "done"
 
     except Exception as e:
-        print(f"No samples returned from site {site}: {e}")
+        print(f"Failed to write samples from site {site}: {e}")
+        return "failed"
 
 
 def exponential_backoff(max_retries=5, base_delay=1):
@@ -84,10 +97,82 @@ def wqp_get_results(*args, **kwargs):
     return wqp.get_results(*args, **kwargs)
 
 
+def _get_neighbor_cache():
+    global _neighbor_cache
+    if _neighbor_cache is None:
+        _neighbor_cache = NeighborCache()
+    return _neighbor_cache
+
+
+def get_drainage_areas(sites):
+    """Get the drainage areas of sites from the cache, retrieving the others from NWIS.
+
+    Sites that are not cached are retrieved together, in batches of
+    `NWIS_BATCH_SIZE` sites per request.
+
+    Parameters
+    ----------
+    sites : list of str
+        8-digit site numbers.
+
+    Returns
+    -------
+    pandas.Series
+        The drainage area in square miles, indexed by site number. Where
+        USACE sites have the same site number, the USGS site is used.
+    """
+    cache = _get_neighbor_cache()
+    sites = list(dict.fromkeys(sites))
+    areas = cache.drainage_areas(sites)
+    missing = [site for site in sites if site not in areas]
+    for i in range(0, len(missing), NWIS_BATCH_SIZE):
+        batch = missing[i:i + NWIS_BATCH_SIZE]
+        df, _ = nwis_get_info(sites=batch)
+        df = df.sort_values("agency_cd", key=lambda agency: agency != "USGS", kind="stable")
+        df = df.drop_duplicates("site_no")
+        fetched = dict(zip(df["site_no"], df["drain_area_va"].astype(float)))
+        # remember sites without information too, to avoid requesting them again
+        fetched = {site: fetched.get(site, np.nan) for site in batch}
+        cache.set_drainage_areas(fetched)
+        areas.update(fetched)
+    if missing:
+        cache.save()
+
+    areas = pd.Series([areas[site] for site in sites], index=sites, name="drain_area_va", dtype=float)
+    areas.index.name = "site_no"
+    return areas
+
+
 @exponential_backoff(max_retries=3, base_delay=1)
+def _navigate_nldi(site, search_distance):
+    """Get the site numbers of the NWIS sites upstream and downstream of a site."""
+    neighbors = {}
+    for mode in NAVIGATION_MODES:
+        gdf = nldi.get_features(
+            feature_source="WQP",
+            feature_id=f"USGS-{site}",
+            navigation_mode=mode,
+            distance=search_distance,
+            data_source="nwissite",
+            )
+        neighbors[mode] = list(gdf.identifier.str.strip('USGS-'))
+    return neighbors
+
+
+def _search_distance(drain_area_sq_mi, search_factor, fudge_factor):
+    length = _estimate_watershed_length_km(drain_area_sq_mi)
+    search_distance = length * search_factor * fudge_factor
+    # clip between 1 and 9999km
+    return max(1.0, min(9999.0, search_distance))
+
+
 def find_neighboring_sites(site, search_factor=0.1, fudge_factor=3.0):
     """Find sites upstream and downstream of the given site within a certain distance.
 
+    The neighbors and drainage areas are read from the local neighbor cache
+    (see `neighbor_cache.py`) and retrieved from NLDI and NWIS only if they
+    are not cached or have expired.
+
     TODO Use geoconnex to determine mainstem length
 
     Parameters
@@ -101,34 +186,20 @@ def find_neighboring_sites(site, search_factor=0.1, fudge_factor=3.0):
         An additional fudge factor to apply to the search distance, because
         watersheds are not circular.
     """
-    site_df, _ = nwis_get_info(sites=site)
-    drain_area_sq_mi = site_df["drain_area_va"].values[0]
-    length = _estimate_watershed_length_km(drain_area_sq_mi)
-    search_distance = length * search_factor * fudge_factor
-    # clip between 1 and 9999km
-    search_distance = max(1.0, min(9999.0, search_distance))
+    cache = _get_neighbor_cache()
+    drain_area_sq_mi = get_drainage_areas([site])[site]
+    search_distance = _search_distance(drain_area_sq_mi, search_factor, fudge_factor)
 
     # get upstream and downstream sites
-    gdfs = [
-        nldi.get_features(
-            feature_source="WQP",
-            feature_id=f"USGS-{site}",
-            navigation_mode=mode,
-            distance=search_distance,
-            data_source="nwissite",
-            )
-        for mode in ["UM", "DM"]  # upstream and downstream
-    ]
+    neighbors = cache.neighbors(site, search_distance)
+    if neighbors is None:
+        neighbors = _navigate_nldi(site, search_distance)
+        cache.set_neighbors(site, search_distance, neighbors)
+        cache.save()
 
-    features = pd.concat(gdfs, ignore_index=True)
-
-    df, _ = nwis_get_info(sites=list(features.identifier.str.strip('USGS-')))
+    areas = get_drainage_areas(neighbors["UM"] + neighbors["DM"])
     # drop sites with disimilar different drainage areas
-    df = df.where(
-        (df["drain_area_va"] / drain_area_sq_mi) > search_factor,
-        ).dropna(how="all")
-
-    site_list = df["site_no"].to_list()
+    site_list = areas.index[(areas / drain_area_sq_mi) > search_factor].to_list()
 
     # include the original search site among the neighbors
     if site not in site_list:
@@ -137,6 +208,46 @@ def find_neighboring_sites(site, search_factor=0.1, fudge_factor=3.0):
     return site_list
 
 
+def prefetch_neighbors(sites, search_factor=0.1, fudge_factor=3.0):
+    """Fill the neighbor cache for many sites before a retrieval.
+
+    The drainage areas of all uncached sites are retrieved in batches, then
+    the neighbors of each uncached site, then the drainage areas of all
+    their uncached neighbors in batches. Sites whose navigation fails are
+    left for `find_neighboring_sites` to retry.
+
+    Parameters
+    ----------
+    sites : list of str
+        8-digit site numbers. Sites in `BAD_NLDI_SITES` are skipped.
+    search_factor, fudge_factor : float, optional
+        See `find_neighboring_sites`.
+    """
+    cache = _get_neighbor_cache()
+    sites = [site for site in sites if site not in BAD_NLDI_SITES]
+    areas = get_drainage_areas(sites)
+    distances = {site: _search_distance(areas[site], search_factor, fudge_factor) for site in sites}
+
+    uncached = [site for site in sites if cache.neighbors(site, distances[site]) is None]
+    print(f"Finding the neighbors of {len(uncached)} sites ({len(sites) - len(uncached)} cached)")
+    for i, site in enumerate(uncached, start=1):
+        try:
+            cache.set_neighbors(site, distances[site], _navigate_nldi(site, distances[site]))
+        except Exception as e:
+            print(f"Failed to find the neighbors of site {site}: {e}")
+        # save now and then, so that an interrupted search is not lost
+        if i % 10 == 0:
+            cache.save()
+    cache.save()
+
+    neighbors = []
+    for site in sites:
+        site_neighbors = cache.neighbors(site, distances[site])
+        if site_neighbors is not None:
+            neighbors += site_neighbors["UM"] + site_neighbors["DM"]
+    get_drainage_areas(neighbors)
+
+
 def _estimate_watershed_length_km(drain_area_sq_mi):
     """Estimate the diameter assuming a circular watershed.
 
@@ -156,8 +267,42 @@ def _estimate_watershed_length_km(drain_area_sq_mi):
     return length_miles * 1.60934
 
 
+def parse_args(description):
+    """Command line options shared by the NWQN retrievals"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--local', metavar='DIR', default=None,
+                        help='run on a local process pool and write the Parquet datasets to DIR '
+                             '(default: run on lithops and write to s3://$DESTINATION_BUCKET)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of local worker processes (default: number of CPUs)')
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='maximum number of sites started per second in a local run (0 for no limit)')
+    parser.add_argument('--retry-all', action='store_true',
+                        help='retrieve sites that were already retrieved in an earlier local run')
+    parser.add_argument('--limit', type=int, default=None,
+                        help='retrieve only the first LIMIT sites, for testing')
+    return parser.parse_args()
+
+
+def run(map_function, site_list, args):
+    """Run a retrieval locally or on lithops"""
+    if args.limit is not None:
+        site_list = site_list[:args.limit]
+
+    if args.local:
+        prefetch_neighbors(site_list)
+        run_local(map_function, site_list, args.local, max_workers=args.workers,
+                  rate=args.rate, retry_all=args.retry_all)
+    else:
+        import lithops
+        fexec = lithops.FunctionExecutor(config_file="lithops.yaml")
+        futures = fexec.map(map_function, site_list)
+        futures.get_result()
+
+
 if __name__ == "__main__":
     project = "National Water Quality Assessment Program (NAWQA)"
+    args = parse_args(f"Retrieve samples of the {project}")
 
     site_df = pd.read_csv(
         'NWQN_sites.csv',
@@ -166,9 +311,5 @@ if __name__ == "__main__":
         )
 
     site_list = site_df['SITE_QW_ID'].to_list()
-    #site_list = site_list[:2]  # prune for testing
-
-    fexec = lithops.FunctionExecutor(config_file="lithops.yaml")
-    futures = fexec.map(map_retrieval, site_list)
 
-    futures.get_result()
+    run(map_retrieval, site_list, args)
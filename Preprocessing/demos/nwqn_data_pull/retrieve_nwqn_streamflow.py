@@ -1,30 +1,30 @@
 # Retrieve data from the National Water Quality Assessment Program (NAWQA)
 
-import lithops
-import os
 import numpy as np
 import pandas as pd
 
 
 from dataretrieval import nwis
-from random import randint
-from time import sleep
 
-from retrieve_nwqn_samples import find_neighboring_sites, BAD_NLDI_SITES
+from local_executor import destination, throttle
+from nwqn_parquet import STREAMFLOW_SCHEMA, to_table, write_partition
+from retrieve_nwqn_samples import find_neighboring_sites, get_drainage_areas, parse_args, run, BAD_NLDI_SITES
 
-DESTINATION_BUCKET = os.environ.get('DESTINATION_BUCKET')
 START_DATE = "1991-01-01"
 END_DATE = "2023-12-31"
 
 def map_retrieval(site):
-    """Map function to pull data from NWIS and WQP"""
+    """Map function to pull data from NWIS and WQP
+
+    Returns "done", "empty" if the site has no streamflow, or "failed".
+    """
     print(f"Retrieving daily streamflow from site {site}")
 
     if site in BAD_NLDI_SITES:
         site_list = [site]
     # else query slowly
     else:
-        sleep(randint(0, 5))
+        throttle()
         site_list = find_neighboring_sites(site)
 
     df, _ = nwis.get_dv(
@@ -43,17 +43,16 @@ def map_retrieval(site):
     print(len(df), "records retrieved")
     # process the results
     if not df.empty:
-        # drop rows with missing values; neglect other 00060_* columns
+        # treat the -999999 sentinel as missing before dropping rows with missing values;
+        # neglect other 00060_* columns
+        df["00060_Mean"] = df["00060_Mean"].mask(df["00060_Mean"] == -999999)
         df = df.dropna(subset=["00060_Mean"])
         # fill missing codes to enable string operations
         df["00060_Mean_cd"] = df["00060_Mean_cd"].fillna("M")
         df = df[df["00060_Mean_cd"].str.contains("A")]
-        df['00060_Mean'] = df['00060_Mean'].replace(-999999, np.nan)
 
-        site_info, _ = nwis.get_info(sites=site_list)
-        # USACE sites may have same site_no, which creates index conflicts later
-        site_info = site_info[site_info["agency_cd"] == "USGS"]  # keep only USGS sites
-        site_info = site_info.set_index("site_no")
+        # USACE sites may have same site_no; the drainage areas are those of the USGS sites
+        site_info = get_drainage_areas(site_list).to_frame()
 
         main_site = site_info.loc[site]
         main_site_drainage_area = main_site["drain_area_va"]
@@ -64,63 +63,73 @@ def map_retrieval(site):
         site_info["fraction_diff"] = np.abs(1 - site_info["drain_fraction"])
 
         # apply drainage area fraction
-        df = pd.merge(df, site_info, left_index=True, right_index=True)
+        flow_sites = df.index.get_level_values("site_no")
+        df = df[flow_sites.isin(site_info.index)]
         df["00060_Mean"] *= site_info.loc[df.index.get_level_values("site_no"), "drain_fraction"].values
 
         # order sites by the difference in drainage area fraction
-        fill_order = site_info.sort_values("fraction_diff", ascending=True)
+        fill_order = site_info.sort_values("fraction_diff", ascending=True, kind="stable")
         fill_order = fill_order.index.values
 
-        flow_sites = df.index.get_level_values("site_no").values
-        fill_order = set(fill_order).intersection(flow_sites)
-
-        output = pd.DataFrame()
-
-        # loop through sites and fill in missing flow values
-        # going from most to least-similar drainage areas.
-        for fill_site in fill_order:
-            fill_data = df.loc[fill_site]
-            output = update_dataframe(output, fill_data)
-
-        output = output.drop(columns=["drain_area_va", "drain_fraction", "fraction_diff"])
+        # fill in missing flow values going from most to least-similar drainage areas
+        output = fill_from_neighbors(df, fill_order)
         output["site_no"] = site
 
     else:
         print(f"No data retrieved for site {site}")
-        return
+        return "empty"
 
     try:
         # merge sites
-        output.astype(str).to_parquet(f's3://{DESTINATION_BUCKET}/nwqn-streamflow.parquet',
-                                  engine='pyarrow',
-                                  partition_cols=['site_no'],
-                                  compression='zstd')
+        table = to_table(output, STREAMFLOW_SCHEMA)
+        write_partition(table, destination('nwqn-streamflow.parquet'), 'site_no')
         # optionally, `return df` for further processing
+        return "done"
 
     except Exception as e:
         print(f"Failed to write parquet: {e}")
+        return "failed"
+
 
+def fill_from_neighbors(df: pd.DataFrame, fill_order) -> pd.DataFrame:
+    """Merge the records of several sites into one record, in order of priority.
 
-def update_dataframe(
-        original_df: pd.DataFrame,
-        new_df: pd.DataFrame,
-        overwrite: bool = False,
-) -> pd.DataFrame:
-    """Update a DataFrame with values from another DataFrame.
+    Each date is taken from the first site in `fill_order` with a record on
+    that date. The merge is done in one pass over a site x date array of row
+    positions, instead of concatenating the sites one at a time.
 
-    NOTE: this fuction does not handle MultiIndex DataFrames.
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The records, with a (site_no, datetime) MultiIndex.
+    fill_order : list of str
+        The site numbers, from the highest to the lowest priority. Sites that
+        are not in the list are ignored.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The merged record, indexed and sorted by date, with the columns of `df`
+        and a `fill_site_no` column with the site that supplied each value.
     """
-    # Identify new rows in new_df that are not in original_df
-    new_rows = new_df[~new_df.index.isin(original_df.index)]
+    sites = df.index.get_level_values("site_no")
+    site_codes = pd.Index(fill_order).get_indexer(sites)
+    rows = np.flatnonzero(site_codes >= 0)
+    date_codes, dates = pd.factorize(df.index.get_level_values(1)[rows], sort=True)
 
-    # Concatenate new rows to original_df
-    original_df = pd.concat([original_df, new_rows]).sort_index()
+    # position of the row of each site (by priority) and date, or -1 if there is none
+    positions = np.full((len(fill_order), len(dates)), -1)
+    positions[site_codes[rows], date_codes] = rows
+    first = (positions >= 0).argmax(axis=0)
+    selected = positions[first, np.arange(len(dates))]
 
-    return original_df
+    output = df.iloc[selected].reset_index(level="site_no")
+    return output.rename(columns={"site_no": "fill_site_no"})
 
 
 if __name__ == "__main__":
     project = "National Water Quality Assessment Program (NAWQA)"
+    args = parse_args(f"Retrieve daily streamflow at the sites of the {project}")
 
     site_df = pd.read_csv(
         'NWQN_sites.csv',
@@ -129,9 +138,5 @@ if __name__ == "__main__":
         )
 
     site_list = site_df['SITE_QW_ID'].to_list()
-    # site_list = site_list[:4]  # prune for testing
-
-    fexec = lithops.FunctionExecutor(config_file="lithops.yaml")
-    futures = fexec.map(map_retrieval, site_list)
 
-    futures.get_result()
+    run(map_retrieval, site_list, args)
@@ -0,0 +1,72 @@
+# Tests of the local process-pool mode of the NWQN retrievals, with a stub map function
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_executor import STATUS_FILE, destination, read_status, run_local, throttle  # noqa: E402
+
+SITES = ["01", "02", "03", "04"]
+
+
+def stub_map(site):
+    """Record the start time of a site and return its status, like map_retrieval.
+
+    Site 03 has no data. Site 04 fails until the file `04.fixed` exists.
+    """
+    throttle()
+    with open(destination(f"{site}.start"), "a") as f:
+        f.write(f"{time.time()}\n")
+    if site == "03":
+        return "empty"
+    if site == "04" and not os.path.exists(destination("04.fixed")):
+        raise RuntimeError("service unavailable")
+    return "done"
+
+
+def _starts(output_dir):
+    starts = {}
+    for site in SITES:
+        with open(os.path.join(output_dir, f"{site}.start")) as f:
+            starts[site] = [float(line) for line in f]
+    return starts
+
+
+def test_run_local_records_statuses_and_throttles(tmp_path):
+    status = run_local(stub_map, SITES, str(tmp_path), max_workers=4, rate=10.0)
+
+    assert dict(zip(status["site"], status["status"])) == {
+        "01": "done", "02": "done", "03": "empty", "04": "failed"}
+    assert "service unavailable" in status.set_index("site").loc["04", "message"]
+    assert os.path.isfile(tmp_path / STATUS_FILE)
+
+    # the starts are spaced by at least 1 / rate across all workers
+    starts = sorted(t for times in _starts(tmp_path).values() for t in times)
+    assert min(b - a for a, b in zip(starts, starts[1:])) >= 0.09
+
+
+def test_run_local_resumes_failed_sites(tmp_path):
+    run_local(stub_map, SITES, str(tmp_path), max_workers=2, rate=0)
+    (tmp_path / "04.fixed").touch()
+
+    status = run_local(stub_map, SITES, str(tmp_path), max_workers=2, rate=0)
+
+    # only the failed site is retrieved again
+    assert status["site"].tolist() == ["04"]
+    assert {site: len(times) for site, times in _starts(tmp_path).items()} == {
+        "01": 1, "02": 1, "03": 1, "04": 2}
+    latest = read_status(str(tmp_path)).set_index("site")["status"]
+    assert latest.to_dict() == {"01": "done", "02": "done", "03": "empty", "04": "done"}
+
+    # retry_all retrieves the finished sites too
+    status = run_local(stub_map, SITES, str(tmp_path), max_workers=2, rate=None, retry_all=True)
+    assert sorted(status["site"]) == SITES
+
+
+def test_run_local_rejects_negative_rate(tmp_path):
+    with pytest.raises(ValueError):
+        run_local(stub_map, SITES, str(tmp_path), rate=-1)
@@ -0,0 +1,156 @@
+# Tests of the cached NWIS retrieval against a local stub of the NWIS services
+
+import http.server
+import os
+import sys
+import threading
+import urllib.parse
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import usgs_retrieval  # noqa: E402
+
+SITE = "12193400"
+# the stub has no records of this parameter or site, and answers 404 like NWIS
+MISSING_PARAMETER = "00010"
+MISSING_SITE = "99999999"
+
+
+class StubNWISHandler(http.server.BaseHTTPRequestHandler):
+    """Answer NWIS instantaneous value requests with one value every 15 minutes of the requested days."""
+
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        self.requests.append((url.path, query))
+        if url.path.endswith("/site/"):
+            self.send_site(query["sites"].split(","))
+            return
+        parameter = query["parameterCd"]
+        if parameter == MISSING_PARAMETER:
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        times = pd.date_range(query["startDT"], pd.Timestamp(query["endDT"]) + pd.Timedelta("23h45min"),
+                              freq="15min")
+        lines = [
+            "# stub NWIS response",
+            f"agency_cd\tsite_no\tdatetime\ttz_cd\t1234_{parameter}\t1234_{parameter}_cd",
+            "5s\t15s\t20d\t6s\t14n\t10s",
+        ]
+        lines += [f"USGS\t{query['sites']}\t{time:%Y-%m-%d %H:%M}\tPST\t{time.dayofyear}\tA" for time in times]
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(("\n".join(lines) + "\n").encode())
+
+    def send_site(self, sites):
+        sites = [site for site in sites if site != MISSING_SITE]
+        if not sites:
+            self.send_response(404)
+            self.end_headers()
+            return
+        lines = ["agency_cd\tsite_no\tstation_nm\tdec_lat_va", "5s\t15s\t50s\t16s"]
+        lines += [f"USGS\t{site}\tSTUB RIVER\t48.5" for site in sites]
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(("\n".join(lines) + "\n").encode())
+
+
+@pytest.fixture
+def nwis():
+    """Start the stub NWIS server and return its base URL and the log of its requests."""
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubNWISHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    StubNWISHandler.requests = []
+    yield f"http://127.0.0.1:{server.server_address[1]}/nwis", StubNWISHandler.requests
+    server.shutdown()
+    server.server_close()
+
+
+def test_repeated_pull_is_served_from_cache(nwis, tmp_path):
+    base_url, requests = nwis
+    first = usgs_retrieval.get_records(SITE, "00060", "2021-01-01", "2021-01-31",
+                                       cache_dir=str(tmp_path), base_url=base_url)
+    assert len(requests) == 1
+
+    second = usgs_retrieval.get_records(SITE, "00060", "2021-01-01", "2021-01-31",
+                                        cache_dir=str(tmp_path), base_url=base_url)
+    assert len(requests) == 1
+    pd.testing.assert_frame_equal(first[SITE], second[SITE])
+    assert second[SITE].index.is_unique
+
+
+def test_extended_range_fetches_only_missing_dates(nwis, tmp_path):
+    base_url, requests = nwis
+    usgs_retrieval.get_records(SITE, "00060", "2021-01-01", "2021-01-31",
+                               cache_dir=str(tmp_path), base_url=base_url)
+    records = usgs_retrieval.get_records(SITE, "00060", "2021-01-15", "2021-02-28",
+                                         cache_dir=str(tmp_path), base_url=base_url)
+
+    assert len(requests) == 2
+    _, query = requests[-1]
+    assert (query["startDT"], query["endDT"]) == ("2021-02-01", "2021-02-28")
+    # 15-minute values, converted from PST to UTC
+    assert records[SITE].index.max() == pd.Timestamp("2021-03-01 07:45", tz="UTC")
+    assert records[SITE].index.is_unique
+
+
+def test_not_found_is_cached_as_empty(nwis, tmp_path):
+    base_url, requests = nwis
+    for _ in range(2):
+        records = usgs_retrieval.get_records(SITE, MISSING_PARAMETER, "2021-01-01", "2021-01-31",
+                                             cache_dir=str(tmp_path), base_url=base_url)
+        assert records == {}
+
+    assert len(requests) == 1
+    cache = usgs_retrieval.ResponseCache(str(tmp_path))
+    key = cache.key("iv", SITE, MISSING_PARAMETER)
+    assert cache.missing_ranges(key, "2021-01-01", "2021-01-31") == []
+
+
+def test_cached_range_matches_fresh_range(nwis, tmp_path):
+    base_url, _ = nwis
+    fresh = usgs_retrieval.get_records(SITE, "00060", "2021-01-10", "2021-01-20",
+                                       cache_dir=str(tmp_path / "fresh"), base_url=base_url)[SITE]
+    usgs_retrieval.get_records(SITE, "00060", "2021-01-01", "2021-01-31",
+                               cache_dir=str(tmp_path / "wide"), base_url=base_url)
+    cached = usgs_retrieval.get_records(SITE, "00060", "2021-01-10", "2021-01-20",
+                                        cache_dir=str(tmp_path / "wide"), base_url=base_url)[SITE]
+
+    # 11 local days of 15-minute values, in PST
+    assert len(fresh) == 11 * 96
+    assert fresh.index[0] == pd.Timestamp("2021-01-10 08:00", tz="UTC")
+    pd.testing.assert_frame_equal(fresh, cached)
+
+
+def test_get_info_caches_unknown_sites(nwis, tmp_path):
+    base_url, requests = nwis
+    for _ in range(2):
+        info = usgs_retrieval.get_info(MISSING_SITE, cache_dir=str(tmp_path), base_url=base_url)
+        assert info.empty
+    assert len(requests) == 1
+
+    info = usgs_retrieval.get_info([SITE, MISSING_SITE], cache_dir=str(tmp_path), base_url=base_url)
+    assert info["site_no"].tolist() == [SITE]
+    assert info["dec_lat_va"].tolist() == [48.5]
+
+
+def test_get_info_refetches_empty_cache_files(nwis, tmp_path):
+    base_url, requests = nwis
+    site_file = tmp_path / "site" / f"{SITE}.csv"
+    site_file.parent.mkdir()
+    site_file.write_text("\n")
+
+    info = usgs_retrieval.get_info(SITE, cache_dir=str(tmp_path), base_url=base_url)
+    assert info["site_no"].tolist() == [SITE]
+    assert len(requests) == 1
@@ -0,0 +1,397 @@
+# Retrieve USGS NWIS site information and time series with a local response cache
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from time import sleep
+
+import pandas as pd
+import requests
+
+# Base URL of the NWIS web services; point it to a local stub server for testing
+NWIS_URL = os.environ.get("NWIS_URL", "https://waterservices.usgs.gov/nwis")
+CACHE_DIR = os.environ.get(
+    "USGS_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".usgs_cache")
+)
+CATALOG_FILE = "catalog.json"
+
+# keep the number of simultaneous requests to NWIS small
+MAX_WORKERS = 4
+MAX_RETRIES = 3
+TIMEOUT = 120
+
+# recent data are provisional and may still arrive; do not mark them as cached
+RECENT_DAYS = 7
+
+SERVICES = ["iv", "dv"]
+STATISTIC_NAMES = {"00001": "Maximum", "00002": "Minimum", "00003": "Mean", "00008": "Median"}
+
+# UTC offsets of the time zone codes in NWIS instantaneous values
+TIME_ZONE_OFFSETS = {
+    "UTC": 0, "GMT": 0,
+    "EST": -5, "EDT": -4, "CST": -6, "CDT": -5, "MST": -7, "MDT": -6,
+    "PST": -8, "PDT": -7, "AKST": -9, "AKDT": -8, "HST": -10,
+}
+
+
+def parse_rdb(text):
+    """Parse a tab-delimited USGS RDB response.
+
+    Parameters
+    ----------
+    text : str
+        The response text. Comment lines start with '#', and the line after
+        the header line gives the field formats.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The records, with all fields as strings.
+    """
+    lines = [line for line in text.splitlines() if line and not line.startswith("#")]
+    if len(lines) < 2:
+        return pd.DataFrame()
+    # drop the format line, e.g. 5s 15s 20d
+    body = "\n".join([lines[0]] + lines[2:])
+    return pd.read_csv(StringIO(body), sep="\t", dtype=str, keep_default_na=False)
+
+
+def _fetch(service, params, base_url=None):
+    """Request an NWIS service, retrying with exponential backoff.
+
+    Returns the response text, or None if NWIS found no data (HTTP 404).
+    """
+    url = f"{(base_url or NWIS_URL).rstrip('/')}/{service}/"
+    params = {"format": "rdb", **params}
+    attempts = 0
+    while True:
+        try:
+            response = requests.get(url, params=params, timeout=TIMEOUT)
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+            return response.text
+        except requests.RequestException as e:
+            attempts += 1
+            if attempts > MAX_RETRIES:
+                raise e
+            wait_time = 2 ** attempts
+            print(f"Retrying {service} request in {wait_time} seconds...")
+            sleep(wait_time)
+
+
+def _to_day(date):
+    """Convert a date to a day number (days since 1970-01-01)."""
+    return int(pd.Timestamp(date).normalize().value // 86_400_000_000_000)
+
+
+def _from_day(day):
+    """Convert a day number to an ISO date string."""
+    return (pd.Timestamp(0) + pd.Timedelta(days=day)).strftime("%Y-%m-%d")
+
+
+def _subtract_ranges(start, end, covered):
+    """Return the parts of the day range [start, end] that are not covered."""
+    missing = []
+    for covered_start, covered_end in sorted(covered):
+        if covered_end < start or covered_start > end:
+            continue
+        if covered_start > start:
+            missing.append((start, covered_start - 1))
+        start = max(start, covered_end + 1)
+        if start > end:
+            break
+    if start <= end:
+        missing.append((start, end))
+    return missing
+
+
+def _merge_ranges(ranges):
+    """Merge overlapping and adjacent day ranges."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class ResponseCache:
+    """On-disk cache of NWIS time series, keyed by service, site, and parameter.
+
+    Each time series is stored in one CSV file, and the catalog (catalog.json)
+    records the date ranges that have been retrieved, including ranges without
+    data, so that only missing ranges are requested again.
+
+    Parameters
+    ----------
+    cache_dir : str, optional
+        The cache directory. Defaults to CACHE_DIR.
+    """
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def __repr__(self):
+        return f"ResponseCache({self.cache_dir!r})"
+
+    def _catalog_path(self):
+        return os.path.join(self.cache_dir, CATALOG_FILE)
+
+    def _read_catalog(self):
+        try:
+            with open(self._catalog_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_atomic(self, path, write):
+        """Write a file under a temporary name and rename it, so readers never see a partial file."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_")
+        try:
+            with os.fdopen(handle, "w", encoding="utf-8", newline="") as f:
+                write(f)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    @staticmethod
+    def key(service, site, parameter):
+        return f"{service}/{site}/{parameter}"
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, *key.split("/")) + ".csv"
+
+    def missing_ranges(self, key, start, end):
+        """Return the date ranges between start and end (inclusive) that are not cached."""
+        covered = [(_to_day(first), _to_day(last)) for first, last in self._read_catalog().get(key, [])]
+        missing = _subtract_ranges(_to_day(start), _to_day(end), covered)
+        return [(_from_day(first), _from_day(last)) for first, last in missing]
+
+    def read(self, key, start=None, end=None):
+        """Read a cached time series, optionally limited to a date range.
+
+        NWIS dates are in the local time of the site, so the range is applied
+        to the local times, from the UTC offsets stored with the records. The
+        result is the same whether the range was retrieved alone or as part
+        of a longer range.
+        """
+        path = self.path(key)
+        if not os.path.isfile(path):
+            return _empty_series()
+        df = pd.read_csv(path, index_col="datetime", dtype={"cd": str}, keep_default_na=False,
+                         na_values={"value": [""], "offset": [""]})
+        df.index = pd.to_datetime(df.index, utc=True)
+        if "offset" not in df.columns:
+            df["offset"] = 0.0
+        if start is not None or end is not None:
+            local = df.index.tz_localize(None) + pd.to_timedelta(df["offset"].fillna(0).to_numpy(), unit="h")
+            after_start = local >= pd.Timestamp(start).normalize() if start is not None else True
+            before_end = local < pd.Timestamp(end).normalize() + pd.Timedelta(days=1) if end is not None else True
+            df = df[after_start & before_end]
+        return df
+
+    def write(self, key, df, ranges):
+        """Merge retrieved records into a cached time series and mark the date ranges as cached.
+
+        Ranges that end within RECENT_DAYS of today are only cached up to that limit.
+        """
+        with self._lock:
+            if not df.empty:
+                cached = self.read(key)
+                merged = pd.concat([cached, df]) if not cached.empty else df
+                merged = merged[~merged.index.duplicated(keep="last")].sort_index()
+                self._write_atomic(
+                    self.path(key),
+                    lambda f: merged.to_csv(f, date_format="%Y-%m-%dT%H:%M:%SZ"),
+                )
+
+            latest = _to_day(pd.Timestamp.now(tz="UTC").tz_localize(None)) - RECENT_DAYS
+            days = [(_to_day(start), min(_to_day(end), latest)) for start, end in ranges]
+            days = [[start, end] for start, end in days if start <= end]
+
+            # re-read the catalog, which another process may have updated
+            catalog = self._read_catalog()
+            covered = [[_to_day(first), _to_day(last)] for first, last in catalog.get(key, [])]
+            catalog[key] = [[_from_day(first), _from_day(last)] for first, last in _merge_ranges(covered + days)]
+            self._write_atomic(self._catalog_path(), lambda f: json.dump(catalog, f, indent=1))
+
+    def clear(self):
+        """Delete all cached responses."""
+        with self._lock:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+
+def _empty_series():
+    """An empty cached time series."""
+    return pd.DataFrame(columns=["value", "cd", "offset"], index=pd.DatetimeIndex([], tz="UTC", name="datetime"))
+
+
+def _parse_series(text, service, parameter, statistic=None):
+    """Extract the values, qualification codes, and UTC offsets (hours) of one parameter from an RDB response."""
+    empty = _empty_series()
+    if text is None:
+        return empty
+    df = parse_rdb(text)
+    suffix = f"_{parameter}" if service == "iv" else f"_{parameter}_{statistic}"
+    # several time series of the same parameter (e.g. two sensors); use the first one
+    value_columns = [c for c in df.columns if c.endswith(suffix)]
+    if df.empty or not value_columns:
+        return empty
+
+    values = pd.to_numeric(df[value_columns[0]], errors="coerce")
+    codes = df.get(value_columns[0] + "_cd", pd.Series("", index=df.index))
+    times = pd.to_datetime(df["datetime"])
+    offsets = [0.0] * len(df)
+    if "tz_cd" in df.columns:
+        offsets = df["tz_cd"].map(TIME_ZONE_OFFSETS).fillna(0).to_numpy(dtype=float)
+        times = times - pd.to_timedelta(offsets, unit="h")
+    index = pd.DatetimeIndex(times, name="datetime").tz_localize("UTC")
+    return pd.DataFrame({"value": values.to_numpy(), "cd": codes.to_numpy(), "offset": offsets}, index=index)
+
+
+def _retrieve_series(cache, service, site, parameter, start, end, statistic, base_url):
+    """Fetch the missing date ranges of one time series and return the cached series."""
+    cache_parameter = parameter if service == "iv" else f"{parameter}_{statistic}"
+    key = cache.key(service, site, cache_parameter)
+    missing = cache.missing_ranges(key, start, end)
+    frames = []
+    for range_start, range_end in missing:
+        params = {"sites": site, "parameterCd": parameter, "startDT": range_start, "endDT": range_end}
+        if service == "dv":
+            params["statCd"] = statistic
+        text = _fetch(service, params, base_url)
+        frames.append(_parse_series(text, service, parameter, statistic))
+    if missing:
+        cache.write(key, pd.concat(frames), missing)
+    return cache.read(key, start, end), len(missing)
+
+
+def get_records(sites, parameters, start, end, service="iv", statistic="00003",
+                max_workers=MAX_WORKERS, cache_dir=None, base_url=None):
+    """Retrieve NWIS time series for many sites, using the local response cache.
+
+    Each site and parameter is one task on a bounded thread pool. Only the
+    date ranges that are not in the cache are requested from NWIS.
+
+    Parameters
+    ----------
+    sites : list of str
+        Site numbers.
+    parameters : list of str
+        Parameter codes, e.g. ["00060", "00065"].
+    start, end : str
+        First and last date, e.g. "2021-01-01".
+    service : str, optional
+        "iv" (instantaneous values) or "dv" (daily values).
+    statistic : str, optional
+        Statistic code of daily values. Defaults to "00003" (mean).
+    max_workers : int, optional
+        The number of simultaneous requests.
+    cache_dir : str, optional
+        The cache directory. Defaults to CACHE_DIR.
+    base_url : str, optional
+        The NWIS base URL. Defaults to NWIS_URL.
+
+    Returns
+    -------
+    dict
+        {site: DataFrame} with a UTC datetime index and the columns used by
+        dataretrieval, e.g. "00060" and "00060_cd" for instantaneous values
+        or "00060_Mean" and "00060_Mean_cd" for daily values.
+    """
+    if service not in SERVICES:
+        raise ValueError(f"Unknown service {service}. Valid services are {', '.join(SERVICES)}.")
+    if isinstance(sites, str):
+        sites = [sites]
+    if isinstance(parameters, str):
+        parameters = [parameters]
+
+    cache = ResponseCache(cache_dir)
+    tasks = [(site, parameter) for site in sites for parameter in parameters]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(
+            lambda task: _retrieve_series(cache, service, *task, start, end, statistic, base_url), tasks))
+
+    fetched = sum(count for _, count in results)
+    print(f"{sum(count == 0 for _, count in results)} of {len(tasks)} series fully cached, "
+          f"{fetched} missing date ranges requested")
+
+    records = {}
+    for (site, parameter), (df, _) in zip(tasks, results):
+        name = parameter if service == "iv" else f"{parameter}_{STATISTIC_NAMES.get(statistic, statistic)}"
+        if df.empty:
+            continue
+        columns = df.drop(columns="offset").rename(columns={"value": name, "cd": f"{name}_cd"})
+        records[site] = columns if site not in records else records[site].join(columns, how="outer")
+    for site in sites:
+        if site in records:
+            records[site]["site_no"] = site
+    return records
+
+
+def _read_site_info(path):
+    """Read the cached information of a site, or None if it is not cached or the file is empty."""
+    try:
+        return pd.read_csv(path, dtype=str, keep_default_na=False)
+    except (OSError, pd.errors.EmptyDataError):
+        return None
+
+
+def get_info(sites, cache_dir=None, base_url=None, refresh=False):
+    """Retrieve NWIS site information (expanded site output), using the local response cache.
+
+    All sites that are not cached are requested together.
+
+    Parameters
+    ----------
+    sites : list of str
+        Site numbers.
+    cache_dir : str, optional
+        The cache directory. Defaults to CACHE_DIR.
+    base_url : str, optional
+        The NWIS base URL. Defaults to NWIS_URL.
+    refresh : bool, optional
+        Request all sites again.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per site, with the fields of the NWIS site service.
+    """
+    if isinstance(sites, str):
+        sites = [sites]
+    cache = ResponseCache(cache_dir)
+    paths = {site: os.path.join(cache.cache_dir, "site", f"{site}.csv") for site in sites}
+    cached = {} if refresh else {site: _read_site_info(paths[site]) for site in sites}
+    missing = [site for site in sites if cached.get(site) is None]
+
+    if missing:
+        text = _fetch("site", {"sites": ",".join(missing), "siteOutput": "expanded", "siteStatus": "all"},
+                      base_url)
+        info = parse_rdb(text) if text is not None else pd.DataFrame()
+        for site in missing:
+            # sites that NWIS does not know are cached as a header without rows
+            rows = info[info["site_no"] == site] if "site_no" in info.columns else pd.DataFrame(columns=["site_no"])
+            cache._write_atomic(paths[site], lambda f: rows.to_csv(f, index=False))
+            cached[site] = _read_site_info(paths[site])
+        not_found = [site for site in missing if cached[site].empty]
+        if not_found:
+            print(f"No site information for {', '.join(not_found)}")
+
+    frames = [cached[site] for site in sites]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    for column in ["dec_lat_va", "dec_long_va", "alt_va", "drain_area_va", "contrib_drain_area_va"]:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+    return df
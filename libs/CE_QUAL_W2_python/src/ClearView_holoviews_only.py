@@ -1,6 +1,4 @@
 # Built-in modules
-import csv
-import glob
 import os
 import sqlite3
 import threading
@@ -238,7 +236,7 @@ class ClearView:
         ''' Create the stats table using a Tabulator widget '''
 
         # Compute summary statistics
-        self.df_stats = self.df.describe()
+        self.df_stats = w2.summary_statistics(self.df).to_frame()
         self.df_stats.index.name = 'Statistic'
 
         # Specify column formatters
@@ -300,83 +298,18 @@ class ClearView:
         self.df_processed = self.time_series_methods[selected_analysis](self.df)
         self.processed_data_table.value = self.df_processed
 
-    def parse_year_csv(self, w2_control_file_path):
-        """
-        Parses the year from a CSV file and sets it as the year attribute.
-
-        This method reads a CSV file specified by `w2_control_file_path` and searches for a row where the first column (index 0)
-        contains the value 'TMSTRT'. The year value is extracted from the subsequent row in the third column (index 2) and set
-        as the year attribute of the class. Additionally, the extracted year is displayed in a QLineEdit widget with the object name
-        'start_year_input'.
-
-        Args:
-            w2_control_file_path (str): The file path to the CSV file.
-        """
-        rows = []
-        with open(w2_control_file_path, 'r') as f:
-            csv_reader = csv.reader(f)
-            for row in csv_reader:
-                rows.append(row)
-        for i, row in enumerate(rows):
-            if row[0].upper() == 'TMSTRT':
-                self.start_year = int(rows[i + 1][2])
-
-    def parse_year_npt(self, w2_control_file_path):
-        """
-        Parses the year from an NPT file and sets it as the year attribute.
-
-        This method reads an NPT file specified by `w2_control_file_path` and searches for a line that starts with 'TMSTR' or 'TIME'.
-        The subsequent line is then extracted, and the year value is obtained by removing the first 24 characters from the line
-        and stripping any leading or trailing whitespace. The extracted year is then converted to an integer and set as the year
-        attribute of the class. Additionally, the extracted year is displayed in a QLineEdit widget with the object name
-        'start_year_input'.
-
-        Args:
-            w2_control_file_path (str): The file path to the NPT file.
-        """
-        with open(w2_control_file_path, 'r') as f:
-            lines = f.readlines()
-        for i, line in enumerate(lines):
-            line = line.strip().upper()
-            if line.startswith('TMSTR') or line.startswith('TIME'):
-                data_line = lines[i + 1]
-                year_str = data_line[24:].strip()
-                self.start_year = int(year_str)
-                self.start_year_input.setText(str(self.start_year))
-
     def get_model_year(self):
         """
         Retrieves the model year from the CE-QUAL-W2 control file.
 
-        This method locates the CE-QUAL-W2 control file in the specified directory by searching for specific filenames:
-        - 'w2_con.csv'
-        - '../w2_con.csv'
-        - 'w2_con.npt'
-        - '../w2_con.npt'
-
-        Once the control file is found, its path and file type are stored in variables. The method then determines the file type
-        (either CSV or NPT) and calls the appropriate parsing method (`parse_year_csv` or `parse_year_npt`) to extract the model year.
-        The extracted year is then set as the year attribute of the class.
+        The control file (w2_con.csv or w2_con.npt, in the model directory or its parent) is located with
+        `w2.find_w2_control()` and parsed with `w2.read_w2_control()`, which caches the parsed file by path and
+        modification time, so reopening files from the same model does not re-read the control file.
 
         Note:
             If no control file is found, a message is printed to indicate the absence of the file.
         """
-        control_file_paths = [
-            os.path.join(self.directory, 'w2_con.csv'),
-            os.path.join(self.directory, '../w2_con.csv'),
-            os.path.join(self.directory, 'w2_con.npt'),
-            os.path.join(self.directory, '../w2_con.npt')
-        ]
-
-        w2_control_file_path = None
-        w2_file_type = None
-
-        for path in control_file_paths:
-            if glob.glob(path):
-                w2_control_file_path = path
-                _, extension = os.path.splitext(path)
-                w2_file_type = extension[1:].upper()
-                break
+        w2_control_file_path = w2.find_w2_control(self.directory)
 
         if w2_control_file_path is None:
             print('No control file found!')
@@ -384,10 +317,7 @@ class ClearView:
 
         print('w2_control_file_path =', w2_control_file_path)
 
-        if w2_file_type == 'CSV':
-            self.parse_year_csv(w2_control_file_path)
-        elif w2_file_type == 'NPT':
-            self.parse_year_npt(w2_control_file_path)
+        self.start_year = w2.read_w2_control(w2_control_file_path).year
 
     def update_year(self, text):
         """
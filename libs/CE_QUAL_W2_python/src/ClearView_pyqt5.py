@@ -1,7 +1,5 @@
 import os
 import sys
-import csv
-import glob
 import sqlite3
 import numpy as np
 import pandas as pd
@@ -317,10 +315,10 @@ class ClearView(qtw.QMainWindow):
 
         The statistics table is set up with the appropriate number of rows and columns based on the number of statistics and data columns.
         The header labels are set to display the column names, and the table cells are populated with the computed statistics.
-        The formatting of the statistics values depends on their type:
+        The statistics are computed and formatted in one vectorized pass by `w2.summary_statistics`:
         - The "count" statistic is displayed as an integer.
         - Other statistics are displayed as floating-point numbers with two decimal places.
-        - If a value cannot be converted to a number, it is displayed as a string.
+        - Missing values are displayed as empty cells.
 
         Note:
             - The number of columns in the statistics table is equal to the number of data columns plus one, accounting for the index column that lists the statistics names.
@@ -329,27 +327,19 @@ class ClearView(qtw.QMainWindow):
         if self.data is None:
             return
 
-        self.stats = self.data.describe().reset_index()
-        self.stats_table.setRowCount(len(self.stats))
-        self.stats_table.setColumnCount(len(self.data.columns) + 1)
+        summary = w2.summary_statistics(self.data)
+        self.stats = summary.to_frame().reset_index()
+        cell_text = summary.format_values(precision=2)
+        self.stats_table.setRowCount(len(summary))
+        self.stats_table.setColumnCount(len(summary.columns) + 1)
 
         header = ['']
-        for col in self.data.columns:
+        for col in summary.columns:
             header.append(col)
         self.stats_table.setHorizontalHeaderLabels(header)
 
-        for row in range(len(self.stats)):
-            for col in range(len(self.data.columns) + 1):
-                value = self.stats.iloc[row, col]
-                try:
-                    if col == 0:
-                        value_text = str(value)
-                    elif row == 0:
-                        value_text = f'{int(value):d}'
-                    else:
-                        value_text = f'{value:.2f}'
-                except ValueError:
-                    value_text = str(value)
+        for row, statistic in enumerate(summary.statistics):
+            for col, value_text in enumerate([statistic, *cell_text[row]]):
                 item = qtw.QTableWidgetItem(value_text)
                 item.setTextAlignment(0x0082)
                 self.stats_table.setItem(row, col, item)
@@ -400,95 +390,27 @@ class ClearView(qtw.QMainWindow):
         # Autofit the column widths
         self.data_table.resizeColumnsToContents()
 
-    def parse_year_csv(self, w2_control_file_path):
-        """
-        Parses the year from a CSV file and sets it as the year attribute.
-
-        This method reads a CSV file specified by `w2_control_file_path` and searches for a row where the first column (index 0)
-        contains the value 'TMSTRT'. The year value is extracted from the subsequent row in the third column (index 2) and set
-        as the year attribute of the class. Additionally, the extracted year is displayed in a QLineEdit widget with the object name
-        'start_year_input'.
-
-        Args:
-            w2_control_file_path (str): The file path to the CSV file.
-        """
-        rows = []
-        with open(w2_control_file_path, 'r') as f:
-            csv_reader = csv.reader(f)
-            for row in csv_reader:
-                rows.append(row)
-        for i, row in enumerate(rows):
-            if row[0].upper() == 'TMSTRT':
-                self.year = int(rows[i + 1][2])
-                self.start_year_input.setText(str(self.year))
-
-    def parse_year_npt(self, w2_control_file_path):
-        """
-        Parses the year from an NPT file and sets it as the year attribute.
-
-        This method reads an NPT file specified by `w2_control_file_path` and searches for a line that starts with 'TMSTR' or 'TIME'.
-        The subsequent line is then extracted, and the year value is obtained by removing the first 24 characters from the line
-        and stripping any leading or trailing whitespace. The extracted year is then converted to an integer and set as the year
-        attribute of the class. Additionally, the extracted year is displayed in a QLineEdit widget with the object name
-        'start_year_input'.
-
-        Args:
-            w2_control_file_path (str): The file path to the NPT file.
-        """
-        with open(w2_control_file_path, 'r') as f:
-            lines = f.readlines()
-        for i, line in enumerate(lines):
-            line = line.strip().upper()
-            if line.startswith('TMSTR') or line.startswith('TIME'):
-                data_line = lines[i + 1]
-                year_str = data_line[24:].strip()
-                self.year = int(year_str)
-                self.start_year_input.setText(str(self.year))
-
     def get_model_year(self):
         """
         Retrieves the model year from the CE-QUAL-W2 control file.
 
-        This method locates the CE-QUAL-W2 control file in the specified directory by searching for specific filenames:
-        - 'w2_con.csv'
-        - '../w2_con.csv'
-        - 'w2_con.npt'
-        - '../w2_con.npt'
-
-        Once the control file is found, its path and file type are stored in variables. The method then determines the file type
-        (either CSV or NPT) and calls the appropriate parsing method (`parse_year_csv` or `parse_year_npt`) to extract the model year.
-        The extracted year is then set as the year attribute of the class.
+        The control file (w2_con.csv or w2_con.npt, in the model directory or its parent) is located with
+        `w2.find_w2_control()` and parsed with `w2.read_w2_control()`, which caches the parsed file by path and
+        modification time, so reopening files from the same model does not re-read the control file.
 
         Note:
             If no control file is found, a message is printed to indicate the absence of the file.
         """
-        control_file_paths = [
-            os.path.join(self.directory, 'w2_con.csv'),
-            os.path.join(self.directory, '../w2_con.csv'),
-            os.path.join(self.directory, 'w2_con.npt'),
-            os.path.join(self.directory, '../w2_con.npt')
-        ]
-
-        w2_control_file_path = None
-        w2_file_type = None
-
-        for path in control_file_paths:
-            if glob.glob(path):
-                w2_control_file_path = path
-                _, extension = os.path.splitext(path)
-                w2_file_type = extension[1:].upper()
-                break
+        w2_control_file_path = w2.find_w2_control(self.directory)
 
         if w2_control_file_path is None:
             print('No control file found!')
             return
 
-        print("w2_control_file_path =", w2_control_file_path)
+        print('w2_control_file_path =', w2_control_file_path)
 
-        if w2_file_type == "CSV":
-            self.parse_year_csv(w2_control_file_path)
-        elif w2_file_type == "NPT":
-            self.parse_year_npt(w2_control_file_path)
+        self.year = w2.read_w2_control(w2_control_file_path).year
+        self.start_year_input.setText(str(self.year))
 
     def update_year(self, text):
         """
@@ -47,7 +47,20 @@ Please refer to the CE-QUAL-W2 model documentation and publications for detailed
 input data requirements, and model applications.
 """
 
+from .w2_bathymetry import *
+from .w2_cache import *
+from .w2_compare import *
+from .w2_control import *
 from .w2_datetime import *
+from .w2_diagnostics import *
+from .w2_ensemble import *
+from .w2_geometry import *
 from .w2_io import *
+from .w2_preprocessing import *
 from .w2_reports import *
+from .w2_scenario import *
+from .w2_scoring import *
+from .w2_shared import *
+from .w2_snapshot import *
+from .w2_statistics import *
 from .w2_visualization import *
\ No newline at end of file
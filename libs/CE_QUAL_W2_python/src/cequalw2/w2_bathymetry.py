@@ -0,0 +1,371 @@
+import os
+import re
+import functools
+from typing import List
+import numpy as np
+import pandas as pd
+from . import w2_io
+from . import w2_control
+
+FIELD_WIDTH = 8
+
+# Section titles of the bathymetry file and the attribute that stores each section
+SECTIONS = [
+    ('Segment lengths', 'dlx'),
+    ('Water surface elevation', 'elws'),
+    ('Segment orientation', 'phi0'),
+    ('Bottom friction', 'fric'),
+    ('Layer heights', 'h'),
+]
+
+# Width profile headers, e.g. 'Segment  2', 'Segment  1 (56)', or 'Segment  40  Br2-2'
+SEGMENT_HEADER_PATTERN = re.compile(r'^Segment\s+(\d+)(?:\s*\((\d+)\))?(?:\s|$)')
+
+
+def _parse_values(line: str) -> List[float]:
+    """Parse a line of bathymetry values, either fixed-width (8 characters) or comma-delimited."""
+    line = line.rstrip('\r\n')
+    if ',' in line:
+        fields = line.split(',')
+    else:
+        fields = w2_io.split_fixed_width_line(line, FIELD_WIDTH)
+    return [float(field) for field in fields if field.strip()]
+
+
+class Bathymetry:
+    """
+    CE-QUAL-W2 bathymetry of one water body
+
+    The segment lengths (DLX), initial water surface elevations (ELWS), orientations (PHI0), bottom
+    friction (FRIC), and layer heights (H) are stored as NumPy arrays, and the cell widths (B) as
+    a 2-D array with one row per layer and one column per segment. Layer and segment positions
+    are 0-based; the model segment numbers are in `segments`.
+
+    The layer elevations, cell areas and volumes, and the volume-elevation and area-elevation
+    curves are computed once, when the object is created.
+    """
+
+    def __init__(self, dlx: np.ndarray, elws: np.ndarray, phi0: np.ndarray, fric: np.ndarray,
+                 h: np.ndarray, widths: np.ndarray, segments: np.ndarray, ebot: float = 0.0,
+                 title: str = '', infile: str = None):
+        self.title = title
+        self.infile = infile
+        self.dlx = dlx
+        self.elws = elws
+        self.phi0 = phi0
+        self.fric = fric
+        self.h = h
+        self.widths = widths
+        self.segments = segments
+        self.ebot = ebot
+
+        # Elevation of the top of each layer. The bottom boundary layer (KMX) has its top at EBOT.
+        heights_above = np.concatenate([np.cumsum(h[:-1][::-1])[::-1], [0.0]])
+        self.layer_elevations = ebot + heights_above
+
+        # Plan area and volume of each cell (layers x segments)
+        self.cell_areas = widths * dlx[np.newaxis, :]
+        self.cell_volumes = self.cell_areas * h[:, np.newaxis]
+
+        # Curves at the layer boundaries, from EBOT upward. The volume is exact between the
+        # boundaries with linear interpolation, because the width is constant within a layer.
+        # The area at each boundary is the area of the layer above it.
+        self.curve_elevations = self.layer_elevations[::-1].copy()
+        layer_volumes = self.cell_volumes.sum(axis=1)
+        layer_areas = self.cell_areas.sum(axis=1)
+        self.curve_volumes = np.concatenate([[0.0], np.cumsum(layer_volumes[:-1][::-1])])
+        self.curve_areas = np.concatenate([layer_areas[:-1][::-1], [layer_areas[0]]])
+
+        # Volume-elevation curve of each segment (boundaries x segments)
+        self.segment_curve_volumes = np.vstack([np.zeros(len(dlx)),
+                                                np.cumsum(self.cell_volumes[:-1][::-1], axis=0)])
+
+    def __repr__(self):
+        return (f'Bathymetry({self.title!r}, {self.num_layers} layers, {self.num_segments} segments, '
+                f'EBOT={self.ebot})')
+
+    @property
+    def num_layers(self) -> int:
+        """The number of layers, including the top and bottom boundary layers (KMX)."""
+        return len(self.h)
+
+    @property
+    def num_segments(self) -> int:
+        """The number of segments, including the boundary segments."""
+        return len(self.dlx)
+
+    @property
+    def active_segments(self) -> np.ndarray:
+        """The model segment numbers of the segments with nonzero length and width."""
+        return self.segments[(self.dlx > 0) & (self.widths.sum(axis=0) > 0)]
+
+    def curves(self) -> pd.DataFrame:
+        """
+        Get the volume-elevation and area-elevation curves of the water body.
+
+        :return: DataFrame with the columns Elevation, Area, and Volume, one row per layer
+                 boundary, from EBOT upward.
+        :rtype: pd.DataFrame
+        """
+        return pd.DataFrame({
+            'Elevation': self.curve_elevations,
+            'Area': self.curve_areas,
+            'Volume': self.curve_volumes,
+        })
+
+    def volume(self, elevation) -> np.ndarray:
+        """
+        Interpolate the water body volume at one or more water surface elevations.
+
+        Elevations that are missing (NaN), below the bottom (EBOT), or above the top of the grid
+        are not valid water levels, and their volume is NaN, as in `storage()`.
+
+        :param elevation: Water surface elevation(s).
+        :type elevation: float or array-like
+        :return: The volume(s), in cubic meters.
+        :rtype: np.ndarray
+        """
+        elevation = np.asarray(elevation, dtype=float)
+        volume = np.interp(elevation, self.curve_elevations, self.curve_volumes)
+        return np.where(self.in_range(elevation), volume, np.nan)
+
+    def area(self, elevation) -> np.ndarray:
+        """
+        Look up the water body surface area at one or more water surface elevations.
+
+        The area is the plan area of the layer that contains each elevation, which is constant
+        within a layer. Elevations that are missing (NaN), below the bottom (EBOT), or above the
+        top of the grid are not valid water levels, and their area is NaN, as in `storage()`.
+
+        :param elevation: Water surface elevation(s).
+        :type elevation: float or array-like
+        :return: The surface area(s), in square meters.
+        :rtype: np.ndarray
+        """
+        elevation = np.asarray(elevation, dtype=float)
+        index = np.searchsorted(self.curve_elevations, elevation, side='right') - 1
+        area = self.curve_areas[np.clip(index, 0, len(self.curve_areas) - 1)]
+        return np.where(self.in_range(elevation), area, np.nan)
+
+    def in_range(self, elevation) -> np.ndarray:
+        """
+        Check whether water surface elevations are within the grid, from the bottom (EBOT) to the
+        top of the top layer. Missing elevations (NaN) are not.
+
+        :param elevation: Water surface elevation(s).
+        :type elevation: float or array-like
+        :return: True for each elevation within the grid.
+        :rtype: np.ndarray
+        """
+        elevation = np.asarray(elevation, dtype=float)
+        return (elevation >= self.curve_elevations[0]) & (elevation <= self.curve_elevations[-1])
+
+    def width_frame(self) -> pd.DataFrame:
+        """
+        Get the cell widths as a DataFrame.
+
+        :return: DataFrame indexed by layer number (from 1), with one column per model segment.
+        :rtype: pd.DataFrame
+        """
+        return pd.DataFrame(self.widths, index=pd.Index(np.arange(1, self.num_layers + 1), name='Layer'),
+                            columns=self.segments)
+
+
+def _parse_bathymetry(infile: str, ebot: float) -> Bathymetry:
+    """Parse a bathymetry file into a Bathymetry object."""
+    with open(infile, 'r', encoding='latin-1') as f:
+        lines = f.readlines()
+
+    # The first non-blank line is the title
+    lines = [line for line in lines if line.strip()]
+    title = lines[0].strip() if lines else ''
+    sections = {attribute: [] for _, attribute in SECTIONS}
+    width_columns = []
+    segments = []
+    current = None
+
+    for line in lines[1:]:
+        stripped = line.strip()
+        segment_header = SEGMENT_HEADER_PATTERN.match(stripped)
+        if segment_header:
+            local, model = segment_header.groups()
+            segments.append(int(model) if model else int(local))
+            current = []
+            width_columns.append(current)
+            continue
+        section = [attribute for name, attribute in SECTIONS if stripped.startswith(name)]
+        if section:
+            current = sections[section[0]]
+            continue
+        if current is None:
+            raise ValueError(f'Unrecognized line in {infile}: {stripped}')
+        current.extend(_parse_values(line))
+
+    dlx = np.array(sections['dlx'])
+    h = np.array(sections['h'])
+    if len(dlx) == 0 or len(h) == 0:
+        raise ValueError(f'{infile} does not contain segment lengths and layer heights.')
+    if len(width_columns) != len(dlx):
+        raise ValueError(f'{infile} has {len(dlx)} segment lengths but {len(width_columns)} width profiles.')
+    if any(len(column) != len(h) for column in width_columns):
+        raise ValueError(f'{infile} has width profiles that do not match the {len(h)} layer heights.')
+
+    def optional(attribute):
+        values = np.array(sections[attribute])
+        return values if len(values) == len(dlx) else np.full(len(dlx), np.nan)
+
+    widths = np.array(width_columns).T
+    return Bathymetry(dlx, optional('elws'), optional('phi0'), optional('fric'), h, widths,
+                      np.array(segments), ebot=ebot, title=title, infile=infile)
+
+
+@functools.lru_cache(maxsize=32)
+def _read_bathymetry_cached(infile: str, mtime_ns: int, size: int, ebot: float) -> Bathymetry:
+    """Read a bathymetry file. The modification time and size are part of the cache key."""
+    return _parse_bathymetry(infile, ebot)
+
+
+def read_bathymetry(infile: str, ebot: float = 0.0) -> Bathymetry:
+    """
+    Read a CE-QUAL-W2 bathymetry file (bathym*.npt).
+
+    The layer elevations are measured from the bottom elevation of the water body (EBOT on the
+    LOCATION card of the control file). If EBOT is not given, elevations are relative to the
+    bottom. The result is cached by path, modification time, and EBOT; treat it as read-only.
+
+    :param infile: Path to the bathymetry file.
+    :type infile: str
+    :param ebot: Bottom elevation of the water body. Defaults to 0.
+    :type ebot: float, optional
+    :return: The bathymetry, with the volume-elevation and area-elevation curves.
+    :rtype: Bathymetry
+    """
+
+    infile = os.path.abspath(infile)
+    stat = os.stat(infile)
+    return _read_bathymetry_cached(infile, stat.st_mtime_ns, stat.st_size, float(ebot))
+
+
+def read_model_bathymetry(control_file: str) -> List[Bathymetry]:
+    """
+    Read the bathymetry of every water body of a model.
+
+    The bathymetry file names (BTHFN) and bottom elevations (EBOT) are taken from the control file.
+
+    :param control_file: Path to the control file (w2_con.npt or w2_con.csv).
+    :type control_file: str
+    :return: One Bathymetry per water body, in order.
+    :rtype: List[Bathymetry]
+    """
+
+    control = w2_control.read_w2_control(control_file)
+    model_path = os.path.dirname(control.path)
+    filenames = control.file_names('BTHFN')
+    ebots = control.values('EBOT')
+    return [read_bathymetry(os.path.join(model_path, filename), ebot)
+            for filename, ebot in zip(filenames, ebots)]
+
+
+def storage(bathymetry: Bathymetry, elevation) -> pd.DataFrame:
+    """
+    Compute the storage, surface area, and mean depth of a water body from a water surface
+    elevation time series, such as the ELWS column of a tsr file.
+
+    The computation is a single vectorized search into the cached curves of the bathymetry, so
+    series of any length are processed without a Python loop.
+
+    Elevations that are missing (NaN), below the bottom (EBOT), or above the top of the grid are
+    not valid water levels, and the Volume, Area, and MeanDepth are NaN for them.
+
+    :param bathymetry: The bathymetry of the water body.
+    :type bathymetry: Bathymetry
+    :param elevation: Water surface elevations. The index of a Series is kept.
+    :type elevation: pd.Series or array-like
+    :return: DataFrame with the columns Elevation, Volume (m^3), Area (m^2), and MeanDepth (m).
+    :rtype: pd.DataFrame
+    """
+
+    index = elevation.index if isinstance(elevation, pd.Series) else None
+    elevation = np.asarray(elevation, dtype=float)
+
+    # One search locates the layer of each elevation. Within a layer, the area is constant and
+    # the volume increases linearly with the area as the slope.
+    curve_elevations = bathymetry.curve_elevations
+    valid = bathymetry.in_range(elevation)
+    layer = np.clip(np.searchsorted(curve_elevations, elevation, side='right') - 1,
+                    0, len(curve_elevations) - 1)
+    area = np.where(valid, bathymetry.curve_areas[layer], np.nan)
+    volume = np.where(valid, bathymetry.curve_volumes[layer] + (elevation - curve_elevations[layer]) * area,
+                      np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_depth = np.where(area > 0, volume / area, np.where(valid, 0.0, np.nan))
+    return pd.DataFrame({
+        'Elevation': elevation,
+        'Volume': volume,
+        'Area': area,
+        'MeanDepth': mean_depth,
+    }, index=index)
+
+
+def segment_storage(bathymetry: Bathymetry, elevations: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compute the storage of a water body from water surface elevations by segment, such as the
+    contents of wl.opt.
+
+    Each segment volume is interpolated from the segment's own volume-elevation curve, one
+    vectorized call per segment, and the volumes are summed. Columns for segments that are not
+    in the bathymetry (for example, other water bodies) are ignored. Times at which any segment
+    has a missing elevation, or one below the bottom (EBOT) or above the top of the grid, are NaN.
+
+    :param bathymetry: The bathymetry of the water body.
+    :type bathymetry: Bathymetry
+    :param elevations: Water surface elevations, with one column per model segment. Columns may
+                       be segment numbers or labels such as 'SEG 37'.
+    :type elevations: pd.DataFrame
+    :return: DataFrame with the columns Volume (m^3), Area (m^2), and MeanDepth (m).
+    :rtype: pd.DataFrame
+    """
+
+    volume = np.zeros(len(elevations))
+    area = np.zeros(len(elevations))
+    curve_elevations = bathymetry.curve_elevations
+    for column in elevations.columns:
+        segment = int(re.sub(r'\D', '', str(column)) or -1)
+        positions = np.flatnonzero(bathymetry.segments == segment)
+        if len(positions) == 0:
+            continue
+        i = positions[0]
+        wse = elevations[column].to_numpy(dtype=float)
+        valid = bathymetry.in_range(wse)
+        volume += np.where(valid, np.interp(wse, curve_elevations, bathymetry.segment_curve_volumes[:, i]), np.nan)
+        layer = np.searchsorted(curve_elevations, wse, side='right') - 1
+        layer = np.clip(layer, 0, len(curve_elevations) - 2)
+        area += np.where(valid, bathymetry.cell_areas[-2::-1][layer, i], np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_depth = np.where(area > 0, volume / area, np.where(np.isnan(volume), np.nan, 0.0))
+    return pd.DataFrame({'Volume': volume, 'Area': area, 'MeanDepth': mean_depth}, index=elevations.index)
+
+
+def read_water_levels(infile: str, year: int = None) -> pd.DataFrame:
+    """
+    Read a CE-QUAL-W2 water level output file (wl.opt), which has one column per segment.
+
+    :param infile: Path to the water level file.
+    :type infile: str
+    :param year: The start year of the simulation. If given, the JDAY index is converted to
+                 dates.
+    :type year: int, optional
+    :return: DataFrame indexed by JDAY (or Date), with the segment numbers as columns.
+    :rtype: pd.DataFrame
+    """
+
+    df = pd.read_csv(infile, index_col=0)
+    # The trailing comma on each line adds an empty column without a segment number
+    df = df.loc[:, [bool(re.fullmatch(r'\s*SEG\s*\d+\s*', str(column))) for column in df.columns]]
+    df.columns = [int(re.sub(r'\D', '', str(column))) for column in df.columns]
+    df.index.name = 'JDAY'
+    if year is not None:
+        df = w2_io.dataframe_to_date_format(year, df)
+    df.attrs['Filename'] = infile
+    return df
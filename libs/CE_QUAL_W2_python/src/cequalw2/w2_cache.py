@@ -0,0 +1,216 @@
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from . import w2_io
+
+CACHE_DIRECTORY_NAME = '.w2cache'
+CATALOG_FILE = 'catalog.json'
+INDEX_FILE = 'index.npy'
+METADATA_FILE = 'columns.json'
+
+
+def default_cache_directory(infile: str) -> str:
+    """
+    Get the default cache directory of a file, a '.w2cache' directory next to the file.
+
+    :param infile: Path to the source file.
+    :type infile: str
+    :return: Path to the cache directory.
+    :rtype: str
+    """
+
+    return os.path.join(os.path.dirname(os.path.abspath(infile)), CACHE_DIRECTORY_NAME)
+
+
+def _column_file(position: int) -> str:
+    """Name of the .npy file of a data column; column names are not valid file names in general."""
+    return f'column_{position:04d}.npy'
+
+
+def write_column_cache(df: pd.DataFrame, cache_path: str):
+    """
+    Write a time series DataFrame as a directory of .npy arrays that can be memory-mapped.
+
+    Each data column is saved as one raw array. The index is saved as a shared int64 array of
+    ticks since the epoch, in the unit of the index, for datetime indexes, or as float64 for
+    Julian days. The column names and index name are stored in columns.json. The directory is
+    written under a temporary name and then renamed, so that readers never see a partial cache.
+
+    :param df: The time series, with a datetime or Julian day index.
+    :type df: pd.DataFrame
+    :param cache_path: Path to the cache directory of this time series.
+    :type cache_path: str
+    """
+
+    parent = os.path.dirname(os.path.abspath(cache_path))
+    os.makedirs(parent, exist_ok=True)
+    temp_path = tempfile.mkdtemp(dir=parent, prefix='.tmp_')
+    try:
+        if isinstance(df.index, pd.DatetimeIndex):
+            index_kind = f'datetime64[{df.index.unit}]'
+            index = df.index.asi8
+        else:
+            index_kind = 'float'
+            index = df.index.to_numpy(dtype=np.float64)
+        np.save(os.path.join(temp_path, INDEX_FILE), index)
+
+        for position, column in enumerate(df.columns):
+            np.save(os.path.join(temp_path, _column_file(position)), df[column].to_numpy())
+
+        metadata = {
+            'columns': [str(column) for column in df.columns],
+            'index_name': df.index.name,
+            'index_kind': index_kind,
+        }
+        with open(os.path.join(temp_path, METADATA_FILE), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f)
+
+        if os.path.isdir(cache_path):
+            shutil.rmtree(cache_path)
+        os.replace(temp_path, cache_path)
+    except BaseException:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        raise
+
+
+def read_column_cache(cache_path: str) -> pd.DataFrame:
+    """
+    Open a column cache written by `write_column_cache()` without copying the data.
+
+    The arrays are opened with `np.load(mmap_mode='r')` and wrapped in a DataFrame, one block per
+    column, so that processes reading the same cache share one copy of the data through the
+    operating system's page cache. The columns are read-only; operations that modify the data
+    must work on a copy.
+
+    :param cache_path: Path to the cache directory of the time series.
+    :type cache_path: str
+    :return: The time series, backed by read-only memory maps.
+    :rtype: pd.DataFrame
+    """
+
+    with open(os.path.join(cache_path, METADATA_FILE), 'r', encoding='utf-8') as f:
+        metadata = json.load(f)
+
+    index = np.load(os.path.join(cache_path, INDEX_FILE), mmap_mode='r')
+    if metadata['index_kind'].startswith('datetime64'):
+        index = pd.DatetimeIndex(index.view(metadata['index_kind']), name=metadata['index_name'])
+    else:
+        index = pd.Index(index, name=metadata['index_name'])
+
+    columns = {column: np.load(os.path.join(cache_path, _column_file(position)), mmap_mode='r')
+               for position, column in enumerate(metadata['columns'])}
+    df = pd.DataFrame(columns, index=index, copy=False)
+    df.attrs['Filename'] = cache_path
+    return df
+
+
+def _read_catalog(cache_dir: str) -> dict:
+    """Read the catalog of a cache directory, which maps cache entries to their source files and keys."""
+    catalog_file = os.path.join(cache_dir, CATALOG_FILE)
+    if not os.path.isfile(catalog_file):
+        return {}
+    try:
+        with open(catalog_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (ValueError, OSError):
+        return {}
+
+
+def _write_catalog(cache_dir: str, catalog: dict):
+    """Replace the catalog of a cache directory atomically."""
+    handle, temp_file = tempfile.mkstemp(dir=cache_dir, prefix='.tmp_', suffix='.json')
+    with os.fdopen(handle, 'w', encoding='utf-8') as f:
+        json.dump(catalog, f, indent=1)
+    os.replace(temp_file, os.path.join(cache_dir, CATALOG_FILE))
+
+
+def _catalog_key(infile: str, year, data_columns, read_options: dict) -> dict:
+    """Describe a source file and the read options; a cache entry is valid only if these match."""
+    stat = os.stat(infile)
+    skiprows, file_type = read_options.get('skiprows'), read_options.get('file_type')
+    dtype, na_values = read_options.get('dtype'), read_options.get('na_values')
+    return {
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'year': year,
+        'data_columns': None if data_columns is None else [str(column) for column in data_columns],
+        'skiprows': None if skiprows is None else int(skiprows),
+        'file_type': None if file_type is None else str(file_type),
+        'dtype': None if dtype is None else np.dtype(dtype).name,
+        'na_values': None if na_values is None else [float(value) for value in na_values],
+    }
+
+
+def cached_read(infile: str, year: int, data_columns=None, cache_dir: str = None, **kwargs) -> pd.DataFrame:
+    """
+    Read a CE-QUAL-W2 time series through the memory-mapped column cache.
+
+    On the first call, the file is read with `w2_io.read()`, or `w2_io.read_wdo()` for withdrawal
+    output files, and written to the cache. Later calls open the cached arrays with
+    `read_column_cache()` as long as the source file's modification time and size, and the year,
+    data_columns, and read options, are unchanged. Each source file and set of read options has
+    its own entry, so reads of one file with different options (e.g., dtype) do not replace each
+    other. The cached entries are listed in a catalog (catalog.json) in the cache directory.
+
+    :param infile: Path to the time series file (*.csv, *.npt, or *.opt).
+    :type infile: str
+    :param year: The start year of the simulation. If None, the index is the Julian day (JDAY).
+    :type year: int, optional
+    :param data_columns: The names of the data columns. Defaults to the names in the file header.
+    :type data_columns: List[str], optional
+    :param cache_dir: The cache directory. Defaults to a '.w2cache' directory next to the file.
+    :type cache_dir: str, optional
+    :param kwargs: Keyword arguments of `w2_io.read()`, such as skiprows, na_values, and dtype.
+                   Withdrawal output files use only na_values and dtype.
+    :return: The time series, backed by read-only memory maps.
+    :rtype: pd.DataFrame
+    """
+
+    if cache_dir is None:
+        cache_dir = default_cache_directory(infile)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    source = os.path.abspath(infile)
+    key = _catalog_key(infile, year, data_columns, kwargs)
+    # Files with the same name in different model directories may share one cache directory, and a
+    # file may be read with several sets of options; a changed file replaces its entry
+    options = {name: value for name, value in key.items() if name not in ['mtime_ns', 'size']}
+    digest = hashlib.sha1(json.dumps([source, options], sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    entry_name = f'{os.path.basename(infile)}.{digest}'
+    cache_path = os.path.join(cache_dir, entry_name)
+    entry = _read_catalog(cache_dir).get(entry_name)
+
+    if entry is not None and entry['key'] == key and os.path.isdir(entry['path']):
+        return read_column_cache(entry['path'])
+
+    if w2_io.WDO_FILE_PATTERN.match(os.path.basename(infile)):
+        wdo_kwargs = {name: kwargs[name] for name in ['na_values', 'dtype'] if kwargs.get(name) is not None}
+        df = w2_io.read_wdo(infile, year, **wdo_kwargs)
+    else:
+        if data_columns is None:
+            data_columns = w2_io.get_data_columns(infile)
+            kwargs.setdefault('skiprows', w2_io.get_header_row_number(infile) + 1)
+        df = w2_io.read(infile, year, data_columns, **kwargs)
+    write_column_cache(df, cache_path)
+
+    # Re-read the catalog, which another process may have updated in the meantime
+    catalog = _read_catalog(cache_dir)
+    catalog[entry_name] = {'source': source, 'key': key, 'path': cache_path}
+    _write_catalog(cache_dir, catalog)
+    return read_column_cache(cache_path)
+
+
+def clear_cache(cache_dir: str):
+    """
+    Delete a cache directory and all the cached time series in it.
+
+    :param cache_dir: The cache directory.
+    :type cache_dir: str
+    """
+
+    if os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
@@ -0,0 +1,239 @@
+import os
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import numpy as np
+import pandas as pd
+from . import w2_io
+from . import w2_cache
+from . import w2_control
+
+DEFAULT_PERCENTILES = [5, 25, 50, 75, 95]
+
+
+def parse_selector(selector: str):
+    """
+    Split a variable selector, such as 'tsr_1_seg37.csv:T2(C)', into the file name and column.
+
+    :param selector: The file name and the column name, separated by the first colon.
+    :type selector: str
+    :raises ValueError: If the selector has no column name.
+    :return: The file name and the column name.
+    :rtype: tuple
+    """
+
+    filename, separator, column = selector.partition(':')
+    if not separator or not filename or not column:
+        raise ValueError(f'Invalid variable selector {selector}. Use <file name>:<column>, '
+                         f'e.g. tsr_1_seg37.csv:T2(C).')
+    return filename.strip(), column.strip()
+
+
+def _read_column(infile: str, column: str, year: int, dtype) -> pd.Series:
+    """Read one column of a model output file, parsing only the day column and that column."""
+    if w2_io.WDO_FILE_PATTERN.match(os.path.basename(infile)):
+        df = w2_io.read_wdo(infile, year, dtype=dtype)
+        if column not in df.columns:
+            raise ValueError(f'Column {column} not found in {infile}. '
+                             f'The columns are {", ".join(map(str, df.columns))}.')
+        return df[column]
+
+    data_columns = w2_io.get_data_columns(infile)
+    if column not in data_columns:
+        raise ValueError(f'Column {column} not found in {infile}. The columns are {", ".join(data_columns)}.')
+    position = data_columns.index(column) + 1
+    skiprows = w2_io.get_header_row_number(infile) + 1
+    names = ['JDAY', column]
+    try:
+        if infile.lower().endswith('.csv'):
+            df = pd.read_csv(infile, skiprows=skiprows, header=None, usecols=[0, position], names=names,
+                             index_col=0, dtype={column: dtype})
+        else:
+            width = w2_io.NPT_FIELD_WIDTH
+            df = pd.read_fwf(infile, skiprows=skiprows, header=None, names=names, index_col=0,
+                             colspecs=[(0, width), (position * width, (position + 1) * width)],
+                             dtype={column: dtype})
+    except (ValueError, pd.errors.ParserError) as error:
+        raise IOError(f'Error reading {infile}') from error
+    if year is not None:
+        df = w2_io.dataframe_to_date_format(year, df)
+    return df[column]
+
+
+def load_run_column(run_path: str, selector: str, year: int = None, use_cache: bool = True,
+                    cache_dir: str = None, dtype=np.float64) -> pd.Series:
+    """
+    Load one variable of one run.
+
+    With `use_cache`, the file is read through the column cache of `w2_cache.cached_read()`:
+    the first call caches all the columns of the file, and later calls memory-map only the
+    requested column. Otherwise, only the day column and the requested column are parsed.
+
+    :param run_path: Path to the run directory.
+    :type run_path: str
+    :param selector: The variable, as <file name>:<column>, e.g. 'tsr_1_seg37.csv:T2(C)'.
+    :type selector: str
+    :param year: The start year of the simulation. If None, the index is the Julian day (JDAY).
+    :type year: int, optional
+    :param use_cache: Read through the column cache. Defaults to True.
+    :type use_cache: bool, optional
+    :param cache_dir: The cache directory. Defaults to a '.w2cache' directory in the run directory.
+    :type cache_dir: str, optional
+    :param dtype: The dtype of the values, such as np.float32. Defaults to float64.
+    :type dtype: np.dtype, optional
+    :raises ValueError: If the column is not in the file.
+    :return: The time series, named after the run directory.
+    :rtype: pd.Series
+    """
+
+    filename, column = parse_selector(selector)
+    infile = os.path.join(run_path, filename)
+    if use_cache:
+        df = w2_cache.cached_read(infile, year, cache_dir=cache_dir, dtype=dtype)
+        if column not in df.columns:
+            raise ValueError(f'Column {column} not found in {infile}. '
+                             f'The columns are {", ".join(map(str, df.columns))}.')
+        series = df[column]
+    else:
+        series = _read_column(infile, column, year, dtype)
+
+    # The model repeats an output time when it restarts a step; keep the last value
+    series = series[~series.index.duplicated(keep='last')]
+    return series.rename(os.path.basename(os.path.normpath(run_path)))
+
+
+def load_runs(run_paths, selector: str, year: int = None, max_workers: int = None, use_cache: bool = True,
+              cache_dir: str = None, dtype=np.float64) -> pd.DataFrame:
+    """
+    Load one variable from many runs of the same model into one aligned table.
+
+    The runs are read in parallel threads with `load_run_column()`. The series are aligned on
+    the union of their output times, with NaN where a run has no value, and copied once into a
+    single (time x run) array.
+
+    :param run_paths: The run directories, as a list, or as a dictionary of {run name: path}.
+    :type run_paths: list or dict
+    :param selector: The variable, as <file name>:<column>, e.g. 'tsr_1_seg37.csv:T2(C)'.
+    :type selector: str
+    :param year: The start year of the simulation. Defaults to the year in the control file of
+                 the first run, or the Julian day if there is no control file.
+    :type year: int, optional
+    :param max_workers: The number of threads. Defaults to the ThreadPoolExecutor default.
+    :type max_workers: int, optional
+    :param use_cache: Read through the column cache. Defaults to True.
+    :type use_cache: bool, optional
+    :param cache_dir: The cache directory shared by all the runs. Defaults to a '.w2cache'
+                      directory in each run directory.
+    :type cache_dir: str, optional
+    :param dtype: The dtype of the values, such as np.float32. Defaults to float64.
+    :type dtype: np.dtype, optional
+    :raises ValueError: If no run directories are given.
+    :return: DataFrame with one column per run.
+    :rtype: pd.DataFrame
+    """
+
+    if isinstance(run_paths, dict):
+        names, paths = list(run_paths.keys()), list(run_paths.values())
+    else:
+        paths = list(run_paths)
+        names = [os.path.basename(os.path.normpath(path)) for path in paths]
+    if not paths:
+        raise ValueError('No run directories were given')
+    if year is None:
+        year = w2_control.get_model_year(paths[0])
+
+    read = functools.partial(load_run_column, selector=selector, year=year, use_cache=use_cache,
+                             cache_dir=cache_dir, dtype=dtype)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        series = list(executor.map(read, paths))
+
+    index = series[0].index
+    for s in series[1:]:
+        if not s.index.equals(index):
+            index = index.union(s.index)
+
+    values = np.full((len(index), len(series)), np.nan, dtype=dtype)
+    for j, s in enumerate(series):
+        if s.index.equals(index):
+            values[:, j] = s.to_numpy()
+        else:
+            values[index.get_indexer(s.index), j] = s.to_numpy()
+
+    df = pd.DataFrame(values, index=index, columns=pd.Index(names, name='Run'), copy=False)
+    df.attrs['Selector'] = selector
+    return df
+
+
+def envelope_statistics(runs: pd.DataFrame, percentiles: List[float] = None) -> pd.DataFrame:
+    """
+    Compute the envelope of an ensemble at each time.
+
+    :param runs: The aligned runs, as returned by `load_runs()`, with one column per run.
+    :type runs: pd.DataFrame
+    :param percentiles: The percentiles to compute, from 0 to 100. Defaults to 5, 25, 50, 75, and 95.
+    :type percentiles: List[float], optional
+    :return: DataFrame with the same index and the columns Count (the number of runs with a
+             value), Min, Max, Mean, Std, and P<percentile>, e.g. P5 and P95. Times without any
+             value are NaN, and so is Std at times with one value.
+    :rtype: pd.DataFrame
+    """
+
+    if percentiles is None:
+        percentiles = DEFAULT_PERCENTILES
+    values = runs.to_numpy(dtype=np.float64)
+    count = np.isfinite(values).sum(axis=1)
+    statistics = {'Count': count}
+
+    # Rows without values would raise all-NaN warnings, and rows with one value degrees of
+    # freedom warnings for the standard deviation; compute the statistics of the others only
+    rows = count > 0
+    valid = values[rows]
+    for name, function in [('Min', np.nanmin), ('Max', np.nanmax), ('Mean', np.nanmean)]:
+        statistics[name] = np.full(len(values), np.nan)
+        statistics[name][rows] = function(valid, axis=1)
+    statistics['Std'] = np.full(len(values), np.nan)
+    spread = count > 1
+    statistics['Std'][spread] = np.nanstd(values[spread], axis=1, ddof=1)
+    if len(percentiles) > 0:
+        quantiles = np.full((len(values), len(percentiles)), np.nan)
+        quantiles[rows] = np.nanpercentile(valid, percentiles, axis=1).T
+        for j, percentile in enumerate(percentiles):
+            statistics[f'P{percentile:g}'] = quantiles[:, j]
+
+    envelope = pd.DataFrame(statistics, index=runs.index)
+    envelope.attrs.update(runs.attrs)
+    return envelope
+
+
+def compare_runs(run_paths, selector: str, year: int = None, percentiles: List[float] = None,
+                 max_workers: int = None, use_cache: bool = True, cache_dir: str = None, dtype=np.float64):
+    """
+    Compare one variable across many runs of the same model.
+
+    For example, `compare_runs(glob.glob('runs/*'), 'tsr_1_seg37.csv:T2(C)')` returns the
+    temperature of every run in segment 37 and the envelope of the ensemble.
+
+    :param run_paths: The run directories, as a list, or as a dictionary of {run name: path}.
+    :type run_paths: list or dict
+    :param selector: The variable, as <file name>:<column>.
+    :type selector: str
+    :param year: The start year of the simulation. Defaults to the year in the control file.
+    :type year: int, optional
+    :param percentiles: The envelope percentiles. Defaults to 5, 25, 50, 75, and 95.
+    :type percentiles: List[float], optional
+    :param max_workers: The number of threads used to read the runs.
+    :type max_workers: int, optional
+    :param use_cache: Read through the column cache. Defaults to True.
+    :type use_cache: bool, optional
+    :param cache_dir: The cache directory shared by all the runs.
+    :type cache_dir: str, optional
+    :param dtype: The dtype of the values, such as np.float32. Defaults to float64.
+    :type dtype: np.dtype, optional
+    :return: The aligned runs (time x run), as returned by `load_runs()`, and their envelope, as
+             returned by `envelope_statistics()`.
+    :rtype: tuple
+    """
+
+    runs = load_runs(run_paths, selector, year=year, max_workers=max_workers, use_cache=use_cache,
+                     cache_dir=cache_dir, dtype=dtype)
+    return runs, envelope_statistics(runs, percentiles)
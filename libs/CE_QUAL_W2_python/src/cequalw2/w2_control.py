@@ -0,0 +1,523 @@
+import os
+import csv
+import functools
+from typing import List
+import pandas as pd
+from . import w2_io
+
+CONTROL_FILE_NAMES = ['w2_con.csv', '../w2_con.csv', 'w2_con.npt', '../w2_con.npt']
+NUM_TITLE_LINES = 10
+
+# Time series input files: file name variable, item prefix, column name, and units.
+# Files without a column name (constituents) take their column names from the file header.
+INPUT_FILE_TYPES = [
+    ('METFN', 'MET', None, None),
+    ('QINFN', 'QIN', 'Inflow', '$m^3/s$'),
+    ('TINFN', 'TIN', 'Inflow Temperature', '$^oC$'),
+    ('CINFN', 'CIN', None, 'mg/L'),
+    ('QOTFN', 'QOT', 'Outflow', '$m^3/s$'),
+    ('QTRFN', 'QTR', 'Tributary Inflow', '$m^3/s$'),
+    ('TTRFN', 'TTR', 'Tributary Temperature', '$^oC$'),
+    ('CTRFN', 'CTR', None, 'mg/L'),
+    ('QDTFN', 'QDT', 'Distributed Tributary Inflow', '$m^3/s$'),
+    ('TDTFN', 'TDT', 'Distributed Tributary Temperature', '$^oC$'),
+    ('CDTFN', 'CDT', None, 'mg/L'),
+    ('PREFN', 'PRE', 'Precipitation', 'm/s'),
+    ('TPRFN', 'TPR', 'Precipitation Temperature', '$^oC$'),
+    ('CPRFN', 'CPR', None, 'mg/L'),
+    ('EUHFN', 'EUH', 'Upstream Head Elevation', 'm'),
+    ('TUHFN', 'TUH', 'Upstream Head Temperature', '$^oC$'),
+    ('CUHFN', 'CUH', None, 'mg/L'),
+    ('EDHFN', 'EDH', 'Downstream Head Elevation', 'm'),
+    ('TDHFN', 'TDH', 'Downstream Head Temperature', '$^oC$'),
+    ('CDHFN', 'CDH', None, 'mg/L'),
+]
+
+MET_COLUMNS = ['Air Temperature', 'Dew Point Temperature', 'Wind Speed', 'Wind Direction',
+               'Cloudiness', 'Solar Radiation']
+MET_LABELS = ['Air Temperature ($^oC$)', 'Dew Point Temperature ($^oC$)', 'Wind Speed (m/s)',
+              'Wind Direction (radians)', 'Cloudiness (fraction)', 'Solar Radiation ($W/m^2$)']
+
+
+def _convert(value: str):
+    """Convert a control file value to int or float, leaving other strings unchanged."""
+    value = value.strip()
+    if value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+class ControlCard:
+    """
+    One card of a CE-QUAL-W2 control file
+
+    A card has a title line with the variable names, followed by data lines. Each data line has
+    a label (such as 'WB 1', 'BR3', or a constituent name), which may be blank, followed by the
+    values of the variables.
+    """
+
+    def __init__(self, name: str, variables: List[str]):
+        self.name = name
+        self.variables = variables
+        self.labels = []
+        self.rows = []
+
+    def add_row(self, label: str, values: List[str]):
+        """
+        Add a data line to the card.
+
+        :param label: The label of the data line.
+        :type label: str
+        :param values: The values of the data line, as strings.
+        :type values: List[str]
+        """
+        self.labels.append(label)
+        self.rows.append([_convert(value) for value in values])
+
+    def values(self, variable: str) -> list:
+        """
+        Get all values of a variable on this card, in the order in which they appear.
+
+        :param variable: The variable name.
+        :type variable: str
+        :return: The values of the variable. Blank fields are skipped.
+        :rtype: list
+        """
+        variable = variable.upper()
+        columns = [j for j, name in enumerate(self.variables) if name == variable]
+        return [row[j] for row in self.rows for j in columns if j < len(row) and row[j] is not None]
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Convert the card to a DataFrame with one row per data line.
+
+        Repeated variable names, such as DLTD on the DLT DATE card, are numbered from 1.
+
+        :return: DataFrame with the data line labels as the index and the variables as the columns.
+        :rtype: pd.DataFrame
+        """
+        columns = []
+        for j, name in enumerate(self.variables):
+            if self.variables.count(name) > 1:
+                name = f'{name}{self.variables[:j + 1].count(name)}'
+            columns.append(name)
+        rows = [row[:len(columns)] + [None] * (len(columns) - len(row)) for row in self.rows]
+        df = pd.DataFrame(rows, index=self.labels, columns=columns)
+        df.index.name = 'Label'
+        return df
+
+
+class W2Control:
+    """
+    CE-QUAL-W2 control file (w2_con.npt or w2_con.csv)
+
+    The control file is parsed once into cards. The timing, grid, branch, and file name settings
+    are available as properties, and any other variable can be retrieved with `get()` or
+    `values()`.
+    """
+
+    def __init__(self, path: str, title: List[str], cards: List[ControlCard], files: pd.DataFrame):
+        self.path = path
+        self.title = title
+        self.cards = {}
+        for card in cards:
+            name = card.name
+            count = 2
+            while name in self.cards:
+                name = f'{card.name} {count}'
+                count += 1
+            self.cards[name] = card
+        self.files = files
+
+    def __repr__(self):
+        return f'W2Control({self.path!r})'
+
+    def card(self, name: str) -> ControlCard:
+        """
+        Get a card by name, for example 'BRANCH G' or 'CST ACTIVE'.
+
+        :param name: The card name. Only the first eight characters are significant, as in the
+                     title line of the card.
+        :type name: str
+        :return: The card.
+        :rtype: ControlCard
+        """
+        return self.cards[name.upper()[:8].strip()]
+
+    def values(self, variable: str) -> list:
+        """
+        Get all values of a variable, searching the cards in order.
+
+        :param variable: The variable name, for example 'US' or 'TSRF'.
+        :type variable: str
+        :return: The values of the variable from the first card that defines it.
+        :rtype: list
+        """
+        variable = variable.upper()
+        for card in self.cards.values():
+            if variable in card.variables:
+                return card.values(variable)
+        raise KeyError(variable)
+
+    def get(self, variable: str, default=None):
+        """
+        Get the first value of a variable.
+
+        :param variable: The variable name, for example 'YEAR' or 'KMX'.
+        :type variable: str
+        :param default: The value to return if the variable is not defined or is blank.
+        :return: The first value of the variable, converted to int or float where possible.
+        """
+        try:
+            values = self.values(variable)
+        except KeyError:
+            return default
+        return values[0] if values else default
+
+    @property
+    def year(self) -> int:
+        """The start year of the simulation (YEAR)."""
+        return self.get('YEAR')
+
+    @property
+    def tmstrt(self) -> float:
+        """The start time of the simulation, in Julian days (TMSTRT)."""
+        return self.get('TMSTRT')
+
+    @property
+    def tmend(self) -> float:
+        """The end time of the simulation, in Julian days (TMEND)."""
+        return self.get('TMEND')
+
+    @property
+    def num_waterbodies(self) -> int:
+        """The number of water bodies (NWB)."""
+        return self.get('NWB')
+
+    @property
+    def num_branches(self) -> int:
+        """The number of branches (NBR)."""
+        return self.get('NBR')
+
+    @property
+    def num_segments(self) -> int:
+        """The number of segments (IMX)."""
+        return self.get('IMX')
+
+    @property
+    def num_layers(self) -> int:
+        """The number of layers (KMX)."""
+        return self.get('KMX')
+
+    @property
+    def branches(self) -> pd.DataFrame:
+        """The branch geometry (BRANCH G card), with one row per branch."""
+        return self.card('BRANCH G').to_frame()
+
+    @property
+    def waterbodies(self) -> pd.DataFrame:
+        """The water body locations and branch ranges (LOCATION card), with one row per water body."""
+        return self.card('LOCATION').to_frame()
+
+    @property
+    def active_constituents(self) -> List[str]:
+        """The names of the constituents that are turned on (CST ACTIVE card)."""
+        card = self.card('CST ACTIVE')
+        return [label for label, row in zip(card.labels, card.rows) if row and row[0] == 'ON']
+
+    def file_names(self, variable: str, used_only: bool = True) -> List[str]:
+        """
+        Get the file names of a file card, for example 'QINFN' or 'BTHFN'.
+
+        :param variable: The file name variable.
+        :type variable: str
+        :param used_only: If True, skip blank entries and entries marked as not used.
+        :type used_only: bool
+        :return: The file names, in the order in which they appear.
+        :rtype: List[str]
+        """
+        files = self.files[self.files['Variable'] == variable.upper()]
+        if used_only:
+            files = files[files['Used']]
+        return list(files['Filename'])
+
+
+def _is_file_card(line: str) -> bool:
+    """Check whether a title line belongs to a file name card, e.g. 'QIN FILE.....QINFN.....'"""
+    return '....' in line
+
+
+def _parse_npt(path: str):
+    """Parse a fixed-width (*.npt) control file into a title, cards, and file name rows."""
+    with open(path, 'r', encoding='latin-1') as f:
+        lines = [line.rstrip('\r\n') for line in f]
+
+    title = []
+    cards = []
+    files = []
+    card = None
+    file_variable = None
+    i = 0
+
+    while i < len(lines):
+        line = lines[i]
+        if line.strip() == '':
+            card = None
+            file_variable = None
+        elif card is None and file_variable is None:
+            if line[0] == ' ':
+                pass
+            elif line.upper().startswith('TITLE'):
+                title = [title_line[8:].strip() for title_line in lines[i + 1:i + 1 + NUM_TITLE_LINES]]
+                i += NUM_TITLE_LINES
+            elif _is_file_card(line):
+                file_variable = line[8:].strip('. ').upper()
+            else:
+                fields = [line[j:j + 8] for j in range(8, len(line), 8)]
+                variables = [field.split()[-1].upper() if field.strip() else '' for field in fields]
+                card = ControlCard(line[:8].strip().upper(), variables)
+                cards.append(card)
+        elif file_variable is not None:
+            entry = line[8:].strip()
+            filename = entry.split()[0] if entry else ''
+            used = filename != '' and 'not used' not in entry.lower()
+            files.append([file_variable, line[:8].strip(), filename, used])
+        else:
+            values = [line[j:j + 8] for j in range(8, len(line), 8)]
+            card.add_row(line[:8].strip(), values)
+        i += 1
+
+    return title, cards, files
+
+
+def _parse_csv(path: str):
+    """
+    Parse a comma-delimited (*.csv) control file into a title, cards, and file name rows.
+
+    Cards are separated by blank rows. The first row of a card holds the variable names. If the
+    first field of that row is a card name (such as 'TIME CON'), the first field of each data row
+    is a label; otherwise, all fields are values.
+    """
+    with open(path, 'r', encoding='latin-1', newline='') as f:
+        rows = [[field.strip() for field in row] for row in csv.reader(f)]
+
+    title = []
+    cards = []
+    files = []
+    card = None
+    file_variable = None
+    has_label = False
+    i = 0
+
+    while i < len(rows):
+        row = rows[i]
+        if not any(row):
+            card = None
+            file_variable = None
+        elif card is None and file_variable is None:
+            first = row[0].upper()
+            if first.startswith('TITLE'):
+                title = [title_row[0] if title_row else '' for title_row in rows[i + 1:i + 1 + NUM_TITLE_LINES]]
+                i += NUM_TITLE_LINES
+            else:
+                has_label = ' ' in first or first == ''
+                variables = [field.upper() for field in (row[1:] if has_label else row)]
+                named = [variable for variable in variables if variable]
+                if len(named) == 1 and named[0].endswith('FN'):
+                    file_variable = named[0]
+                else:
+                    card = ControlCard(first if has_label else variables[0], variables)
+                    cards.append(card)
+        elif file_variable is not None:
+            label, filename = (row[0], row[1]) if len(row) > 1 else ('', row[0])
+            used = filename != '' and 'not used' not in ' '.join(row).lower()
+            files.append([file_variable, label, filename.split()[0] if filename else '', used])
+        else:
+            card.add_row(row[0] if has_label else '', row[1:] if has_label else row)
+        i += 1
+
+    return title, cards, files
+
+
+@functools.lru_cache(maxsize=32)
+def _read_w2_control_cached(path: str, mtime_ns: int, size: int) -> W2Control:
+    """Parse a control file. The modification time and size are part of the cache key."""
+    if path.lower().endswith('.csv'):
+        title, cards, files = _parse_csv(path)
+    else:
+        title, cards, files = _parse_npt(path)
+    files_df = pd.DataFrame(files, columns=['Variable', 'Label', 'Filename', 'Used'])
+    return W2Control(path, title, cards, files_df)
+
+
+def read_w2_control(path: str) -> W2Control:
+    """
+    Read a CE-QUAL-W2 control file (w2_con.npt or w2_con.csv).
+
+    The parsed control file is cached by path and modification time, so repeated calls return
+    the same object instantly until the file changes on disk. Treat the returned object as
+    read-only.
+
+    :param path: Path to the control file.
+    :type path: str
+    :return: The parsed control file.
+    :rtype: W2Control
+    """
+
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return _read_w2_control_cached(path, stat.st_mtime_ns, stat.st_size)
+
+
+def find_w2_control(directory: str) -> str:
+    """
+    Find the CE-QUAL-W2 control file for a model directory.
+
+    The control file is searched for in the directory and its parent, preferring w2_con.csv
+    over w2_con.npt.
+
+    :param directory: The model directory, or the directory of a model output file.
+    :type directory: str
+    :return: Path to the control file, or None if no control file is found.
+    :rtype: str
+    """
+
+    for name in CONTROL_FILE_NAMES:
+        path = os.path.normpath(os.path.join(directory, name))
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def get_model_year(directory: str) -> int:
+    """
+    Get the start year of the simulation from the control file of a model directory.
+
+    :param directory: The model directory, or the directory of a model output file.
+    :type directory: str
+    :return: The start year, or None if no control file is found.
+    :rtype: int
+    """
+
+    path = find_w2_control(directory)
+    if path is None:
+        return None
+    return read_w2_control(path).year
+
+
+def _count_data_columns(path: str) -> int:
+    """Count the data columns (excluding the day column) on the first data line of an input file."""
+    skiprows = w2_io.get_header_row_number(path) + 1
+    with open(path, 'r', encoding='latin-1') as f:
+        for _ in range(skiprows):
+            f.readline()
+        line = f.readline().rstrip('\r\n')
+    if path.lower().endswith('.csv') or ',' in line:
+        fields = line.strip().strip(',').split(',')
+    else:
+        fields = [field for field in w2_io.split_fixed_width_line(line, 8) if field.strip()]
+    return len(fields) - 1
+
+
+def _input_file_columns(path: str, prefix: str, name: str, units: str):
+    """Derive the column names and plot labels of an input file from its type and header."""
+    num_columns = _count_data_columns(path)
+    if prefix == 'MET' and num_columns <= len(MET_COLUMNS):
+        return MET_COLUMNS[:num_columns], MET_LABELS[:num_columns]
+    if name is not None:
+        if num_columns == 1:
+            columns = [f'{name} ({prefix})']
+        else:
+            columns = [f'{name} {j + 1} ({prefix})' for j in range(num_columns)]
+        return columns, [f'{name} ({units})'] * num_columns
+    header_columns = w2_io.get_data_columns(path)
+    if len(header_columns) == num_columns and all(header_columns):
+        columns = header_columns
+    else:
+        columns = [f'{prefix} {j + 1}' for j in range(num_columns)]
+    return columns, [f'{column} ({units})' for column in columns]
+
+
+def _input_file_stats(control: W2Control) -> tuple:
+    """Get the modification time and size of the input files of a plot control table, for the cache key."""
+    model_path = os.path.dirname(control.path)
+    stats = []
+    for variable, _, _, _ in INPUT_FILE_TYPES:
+        files = control.files[(control.files['Variable'] == variable) & control.files['Used']]
+        for filename in files['Filename']:
+            try:
+                stat = os.stat(os.path.join(model_path, filename))
+                stats.append((filename, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stats.append((filename, None, None))
+    return tuple(stats)
+
+
+@functools.lru_cache(maxsize=32)
+def _plot_control_cached(path: str, mtime_ns: int, size: int, input_stats: tuple) -> pd.DataFrame:
+    """
+    Build the plot control table of a control file. The modification times and sizes of the control
+    file and the input files are part of the cache key.
+    """
+    control = _read_w2_control_cached(path, mtime_ns, size)
+    model_path = os.path.dirname(path)
+    records = []
+
+    for variable, prefix, name, units in INPUT_FILE_TYPES:
+        files = control.files[(control.files['Variable'] == variable) & control.files['Used']]
+        for label, filename in zip(files['Label'], files['Filename']):
+            infile = os.path.join(model_path, filename)
+            if not os.path.isfile(infile):
+                print(f'Skipping {filename}: file not found')
+                continue
+            try:
+                columns, labels = _input_file_columns(infile, prefix, name, units)
+            except (IOError, IndexError, UnicodeDecodeError):
+                print(f'Skipping {filename}: could not read the header')
+                continue
+            item = f'{prefix}_{label.replace(" ", "")}' if label else prefix
+            plot_type = 'combined' if len(columns) == 1 else 'subplots'
+            records.append([item, filename, columns, labels, plot_type])
+
+    control_df = pd.DataFrame(records, columns=['item', 'Filename', 'Columns', 'Labels', 'PlotType'])
+    control_df.set_index('item', inplace=True)
+    return control_df
+
+
+def generate_plot_control(path: str) -> pd.DataFrame:
+    """
+    Generate a plot control table from a CE-QUAL-W2 control file.
+
+    The meteorology, inflow, outflow, tributary, distributed tributary, precipitation, and head
+    boundary files listed in the control file are included, with their column names and plot
+    labels. The number of columns is read from the first data line of each file. Constituent
+    files take their column names from the file header. Input file paths are relative to the
+    directory of the control file.
+
+    The table has the same layout as the result of `read_plot_control()` and can be saved with
+    `write_plot_control()`. It is cached by the path and modification time of the control file
+    and the modification times of the input files, so editing an input file header rebuilds the
+    table. Each call returns a deep copy, including the lists of columns and labels.
+
+    :param path: Path to the control file (w2_con.npt or w2_con.csv).
+    :type path: str
+    :return: DataFrame with one row per input file and the columns Filename, Columns, Labels,
+             and PlotType.
+    :rtype: pd.DataFrame
+    """
+
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    input_stats = _input_file_stats(_read_w2_control_cached(path, stat.st_mtime_ns, stat.st_size))
+    control_df = _plot_control_cached(path, stat.st_mtime_ns, stat.st_size, input_stats).copy(deep=True)
+    # copy(deep=True) does not copy the lists in the cells
+    for column in ['Columns', 'Labels']:
+        control_df[column] = [list(values) for values in control_df[column]]
+    return control_df
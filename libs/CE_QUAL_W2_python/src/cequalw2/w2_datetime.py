@@ -1,5 +1,7 @@
 import datetime
 from typing import List
+import numpy as np
+import pandas as pd
 
 
 def round_time(date_time: datetime.datetime = None, round_to: int = 60) -> datetime.datetime:
@@ -64,4 +66,21 @@ def convert_to_datetime(year: int, days: List[int]) -> List[datetime.datetime]:
 
     start_date = datetime.datetime(year, 1, 1)
     datetime_objects = [start_date + datetime.timedelta(days=day - 1) for day in days]
-    return datetime_objects
\ No newline at end of file
+    return datetime_objects
+
+def datetime_to_day_of_year(year: int, datetimes) -> np.ndarray:
+    """
+    Convert date-times to CE-QUAL-W2 Julian days (day of year, starting at 1.0 on January 1).
+
+    This is the inverse of `day_of_year_to_datetime()`, computed for the whole array at once.
+
+    :param year: The start year of the simulation.
+    :type year: int
+    :param datetimes: The date-times, such as the index of a time series DataFrame.
+    :type datetimes: pd.DatetimeIndex or array-like
+    :return: The Julian days.
+    :rtype: np.ndarray
+    """
+
+    datetimes = pd.DatetimeIndex(datetimes)
+    return ((datetimes - pd.Timestamp(year, 1, 1)) / pd.Timedelta(days=1)).to_numpy(dtype=np.float64) + 1.0
@@ -0,0 +1,207 @@
+import os
+import re
+import functools
+import numpy as np
+import pandas as pd
+
+DIAGNOSTIC_FILES = ['pre.wrn', 'w2.wrn', 'w2.err']
+DIAGNOSTIC_COLUMNS = ['Line', 'Category', 'JDAY', 'Segment', 'Value', 'Message']
+
+# Context lines that start a group of messages, e.g.
+# 'Computational warning at Julian day = 1.108 at segment 11'
+CONTEXT_PATTERN = re.compile(
+    r'(?:Computational warning|Computational error|Error|Warning)\s+at\s+Julian day\s*=\s*(?P<jday>-?[\d.]+)'
+    r'(?:\s+at\s+segment\s+(?P<segment>\d+))?', re.IGNORECASE)
+
+# Message categories, tested in order. Each pattern may capture the Julian day (jday), the
+# segment (segment), and a numeric value (value) of the message.
+MESSAGE_PATTERNS = [
+    ('timestep', re.compile(r'time\s*step\s*=\s*[\d.]+\s*sec:\s*DLT<DLTMIN|time step reduced to\s+(?P<value>[\d.]+)\s*s'
+                            r'(?:\s+on day\s+(?P<jday>[\d.]+))?', re.IGNORECASE)),
+    ('negative_depth', re.compile(r'Negative surface layer thickness in segment\s+(?P<segment>\d+)'
+                                  r'|water surface deviation.*layer thickness\s*=\s*(?P<value>-?[\d.]+)'
+                                  r'|Water surface elevation is (?:below|close to) bottom elevation'
+                                  r'(?: at segment\s+(?P<segment2>\d+))?', re.IGNORECASE)),
+    ('layer_addition', re.compile(r'Add layer\s+(?P<value>\d+)\s+at Julian day\s*=\s*(?P<jday>[\d.]+)'
+                                  r'|Add segments\s+(?P<segment>\d+)', re.IGNORECASE)),
+    ('layer_subtraction', re.compile(r'Subtract layer\s+(?P<value>\d+)\s+at Julian day\s*=\s*(?P<jday>[\d.]+)'
+                                     r'|Subtract segments\s+(?P<segment>\d+)', re.IGNORECASE)),
+    ('ice', re.compile(r'\bice\b', re.IGNORECASE)),
+    ('withdrawal', re.compile(r'\b(?:withdrawal|outlet|structure|spillway|pump|gate)', re.IGNORECASE)),
+    ('constituent', re.compile(r'Constituent\s+(?P<value>\d+)\s+is', re.IGNORECASE)),
+    ('geometry', re.compile(r'Cell width|bottom elevation|layer height|segment length', re.IGNORECASE)),
+    ('kinetics', re.compile(r'\brate\b|\[\w+\s*=', re.IGNORECASE)),
+]
+
+
+def _group(match, *names):
+    """Return the first named group of a regex match that participated in the match."""
+    groupdict = match.groupdict()
+    for name in names:
+        value = groupdict.get(name)
+        if value is not None:
+            return value
+    return None
+
+
+def _parse_diagnostics(infile: str) -> pd.DataFrame:
+    """Stream a diagnostic log and classify each message."""
+    lines = []
+    categories = []
+    jdays = []
+    segments = []
+    values = []
+    messages = []
+
+    context_jday = np.nan
+    context_segment = None
+    negative_depth = False
+    with open(infile, 'r', encoding='latin-1') as f:
+        for line_number, line in enumerate(f, start=1):
+            message = line.strip().strip('*').strip()
+            if not message:
+                continue
+
+            # Context lines carry the day and segment of the messages that follow them
+            context = CONTEXT_PATTERN.match(message)
+            if context is not None:
+                context_jday = float(context.group('jday'))
+                context_segment = context.group('segment')
+                negative_depth = False
+                continue
+
+            category = 'other'
+            jday = None
+            segment = None
+            value = None
+            for name, pattern in MESSAGE_PATTERNS:
+                match = pattern.search(message)
+                if match is not None:
+                    category = name
+                    jday = _group(match, 'jday')
+                    segment = _group(match, 'segment', 'segment2')
+                    value = _group(match, 'value')
+                    break
+
+            if jday is not None:
+                context_jday = float(jday)
+            if segment is None:
+                segment = context_segment
+
+            # A negative depth is reported on several lines (the layer thickness, the segment, and
+            # the reduced time step), which are joined into one negative_depth message
+            if negative_depth and category in ['negative_depth', 'timestep']:
+                messages[-1] = f'{messages[-1]}; {message}'
+                if pd.isna(segments[-1]) and segment is not None:
+                    segments[-1] = int(segment)
+                if np.isnan(values[-1]) and category == 'negative_depth' and value is not None:
+                    values[-1] = float(value)
+                jdays[-1] = context_jday
+                continue
+            negative_depth = category == 'negative_depth'
+
+            lines.append(line_number)
+            categories.append(category)
+            jdays.append(context_jday)
+            segments.append(np.nan if segment is None else int(segment))
+            values.append(np.nan if value is None else float(value))
+            messages.append(message)
+
+    df = pd.DataFrame({
+        'Line': np.array(lines, dtype=int),
+        'Category': pd.Categorical(categories),
+        'JDAY': np.array(jdays, dtype=float),
+        'Segment': pd.array(segments, dtype='Int64'),
+        'Value': np.array(values, dtype=float),
+        'Message': messages,
+    }, columns=DIAGNOSTIC_COLUMNS)
+    df.attrs['Filename'] = infile
+    return df
+
+
+@functools.lru_cache(maxsize=32)
+def _read_diagnostics_cached(infile: str, mtime_ns: int, size: int) -> pd.DataFrame:
+    """Parse a diagnostic log; the file's modification time and size are part of the cache key."""
+    return _parse_diagnostics(infile)
+
+
+def read_diagnostics(infile: str) -> pd.DataFrame:
+    """
+    Read a CE-QUAL-W2 warning or error log (w2.wrn, w2.err, or pre.wrn).
+
+    The log is read line by line and each message is classified with a fixed list of compiled
+    regular expressions: timestep, negative_depth, layer_addition, layer_subtraction, ice,
+    withdrawal, constituent, geometry, kinetics, or other. Context lines such as
+    'Computational warning at Julian day = 1.108 at segment 11' are not returned; their day and
+    segment are assigned to the messages that follow them. The lines of a negative depth report
+    (the layer thickness, the segment, and the reduced time step) are joined into one
+    negative_depth message, so that each event is counted once.
+
+    :param infile: Path to the log file.
+    :type infile: str
+    :return: DataFrame with one row per message and the columns Line, Category, JDAY, Segment
+             (nullable integer), Value (the time step, layer thickness, layer, or constituent
+             number of the message, if any), and Message.
+    :rtype: pd.DataFrame
+    """
+
+    stat = os.stat(infile)
+    df = _read_diagnostics_cached(infile, stat.st_mtime_ns, stat.st_size)
+    return df.copy()
+
+
+def read_model_diagnostics(model_path: str) -> pd.DataFrame:
+    """
+    Read all the warning and error logs of a model run (pre.wrn, w2.wrn, and w2.err).
+
+    :param model_path: Path to the model directory.
+    :type model_path: str
+    :return: The messages of all the logs, as returned by `read_diagnostics()`, with the log
+             file name in the first column (File).
+    :rtype: pd.DataFrame
+    """
+
+    dfs = []
+    for filename in DIAGNOSTIC_FILES:
+        infile = os.path.join(model_path, filename)
+        if os.path.isfile(infile):
+            df = read_diagnostics(infile)
+            df.insert(0, 'File', filename)
+            dfs.append(df)
+
+    if not dfs:
+        return pd.DataFrame(columns=['File'] + DIAGNOSTIC_COLUMNS)
+    df = pd.concat(dfs, ignore_index=True)
+    df['Category'] = df['Category'].astype('category')
+    return df
+
+
+def summarize_diagnostics(diagnostics: pd.DataFrame, interval: float = 1.0) -> pd.DataFrame:
+    """
+    Summarize diagnostic messages by category, segment, and time.
+
+    :param diagnostics: Messages, as returned by `read_diagnostics()` or `read_model_diagnostics()`.
+    :type diagnostics: pd.DataFrame
+    :param interval: Length of the time bins, in days. If None, messages are not binned by time.
+    :type interval: float, optional
+    :return: DataFrame with one row per category, segment, and time bin (Period, the Julian day
+             at the start of the bin), and the columns Count, FirstJDAY, LastJDAY, MinValue,
+             and MaxValue.
+    :rtype: pd.DataFrame
+    """
+
+    df = diagnostics[['Category', 'Segment', 'JDAY', 'Value']].copy()
+    df['Category'] = df['Category'].astype(str)
+    keys = ['Category', 'Segment']
+    if interval is not None:
+        df['Period'] = np.floor(df['JDAY'] / interval) * interval
+        keys.append('Period')
+
+    summary = df.groupby(keys, dropna=False, sort=True).agg(
+        Count=('JDAY', 'size'),
+        FirstJDAY=('JDAY', 'min'),
+        LastJDAY=('JDAY', 'max'),
+        MinValue=('Value', 'min'),
+        MaxValue=('Value', 'max'),
+    )
+    return summary.reset_index()
@@ -0,0 +1,395 @@
+import os
+import sys
+import time
+import shlex
+import shutil
+import fnmatch
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List
+import h5py
+import pandas as pd
+from . import w2_io
+from . import w2_control
+from . import w2_diagnostics
+from . import w2_scenario
+from . import w2_scoring
+
+# Default model executable; any command that runs the model in the current directory can be used
+W2_EXECUTABLE = 'w2_v45_64.exe'
+
+CLONE_MODES = ['auto', 'reflink', 'hardlink', 'copy']
+
+# Files written by the model. They are not cloned into the run directories, so that a run never
+# writes through a hard link into the base model directory.
+OUTPUT_FILE_PATTERNS = ['*.opt', 'tsr*.csv', '*_wdo.csv', 'spr*.csv', 'cpl*.csv', 'flx*.csv', 'rso*',
+                        '*.wrn', '*.err', 'w2_run.log']
+
+# Output files loaded into the results store when a run finishes
+RESULT_FILE_PATTERNS = ['tsr*.csv', '*_wdo.csv']
+
+RUN_LOG_FILE = 'w2_run.log'
+RUN_STATUS_FILE = 'runs.csv'
+RESULTS_STORE_FILE = 'results.h5'
+RUN_STATUS_COLUMNS = ['Run', 'Path', 'Status', 'ReturnCode', 'Errors', 'Warnings', 'Seconds', 'Message']
+
+# Linux ioctl that clones a file's extents (copy-on-write) on Btrfs, XFS, and other file systems
+_FICLONE = 0x40049409
+
+
+def _reflink(source: str, target: str):
+    """Clone a file with copy-on-write. Raises OSError if the file system does not support it."""
+    if not sys.platform.startswith('linux'):
+        raise OSError('Copy-on-write clones are only supported on Linux')
+    import fcntl
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(target)
+            raise
+    shutil.copystat(source, target)
+
+
+def _clone_file(source: str, target: str, mode: str) -> str:
+    """Clone one file; return how it was cloned (reflink, hardlink, or copy)."""
+    if mode in ['auto', 'reflink']:
+        try:
+            _reflink(source, target)
+            return 'reflink'
+        except OSError:
+            if mode == 'reflink':
+                raise
+    if mode in ['auto', 'hardlink']:
+        try:
+            os.link(source, target)
+            return 'hardlink'
+        except OSError:
+            if mode == 'hardlink':
+                raise
+    shutil.copy2(source, target)
+    return 'copy'
+
+
+def clone_model(model_path: str, run_path: str, mode: str = 'auto', overrides: dict = None) -> dict:
+    """
+    Clone a model directory into a run directory.
+
+    The files in the top level of the model directory are cloned, except model output files
+    (OUTPUT_FILE_PATTERNS). With mode 'auto', each file is cloned with copy-on-write where the
+    file system supports it, and otherwise hard linked, or copied if the run directory is on
+    another device. Hard linked files share their data with the base model, so they must not be
+    edited in place; files that differ between runs are given in `overrides` and are always
+    copied.
+
+    :param model_path: Path to the base model directory.
+    :type model_path: str
+    :param run_path: Path to the run directory. Existing files in it are replaced.
+    :type run_path: str
+    :param mode: How to clone the unchanged files: auto, reflink, hardlink, or copy.
+    :type mode: str, optional
+    :param overrides: Files that replace model files in the run, as {filename: source path}.
+    :type overrides: dict, optional
+    :raises ValueError: If the mode is not valid.
+    :return: The number of files cloned in each way, e.g. {'hardlink': 40, 'copy': 2}.
+    :rtype: dict
+    """
+
+    if mode not in CLONE_MODES:
+        raise ValueError(f'Invalid clone mode {mode}. Valid modes are {", ".join(CLONE_MODES)}.')
+    overrides = overrides or {}
+    os.makedirs(run_path, exist_ok=True)
+
+    counts = {}
+    filenames = [filename for filename in sorted(os.listdir(model_path))
+                 if os.path.isfile(os.path.join(model_path, filename))
+                 and not any(fnmatch.fnmatch(filename.lower(), pattern) for pattern in OUTPUT_FILE_PATTERNS)]
+    for filename in sorted(set(filenames) | set(overrides)):
+        target = os.path.join(run_path, filename)
+        if os.path.lexists(target):
+            os.remove(target)
+        if filename in overrides:
+            shutil.copy2(overrides[filename], target)
+            how = 'copy'
+        else:
+            how = _clone_file(os.path.join(model_path, filename), target, mode)
+        counts[how] = counts.get(how, 0) + 1
+    return counts
+
+
+def run_status(run_path: str, returncode: int = None):
+    """
+    Get the status of a finished run from its return code and its w2.err and w2.wrn files.
+
+    :param run_path: Path to the run directory.
+    :type run_path: str
+    :param returncode: The exit code of the model. Defaults to unknown.
+    :type returncode: int, optional
+    :return: The status (completed, warnings, or failed), the number of error messages, and
+             the number of warning messages.
+    :rtype: tuple
+    """
+
+    diagnostics = w2_diagnostics.read_model_diagnostics(run_path)
+    errors = int((diagnostics['File'] == 'w2.err').sum())
+    warnings = int((diagnostics['File'] == 'w2.wrn').sum())
+    if (returncode is not None and returncode != 0) or errors > 0:
+        status = 'failed'
+    elif warnings > 0:
+        status = 'warnings'
+    else:
+        status = 'completed'
+    return status, errors, warnings
+
+
+def load_run_results(run_path: str, year: int, patterns: List[str] = None) -> dict:
+    """
+    Read the output files of a run.
+
+    :param run_path: Path to the run directory.
+    :type run_path: str
+    :param year: The start year of the simulation.
+    :type year: int
+    :param patterns: File name patterns of the output files. Defaults to RESULT_FILE_PATTERNS.
+    :type patterns: List[str], optional
+    :return: Dictionary of {filename: DataFrame}, with datetime indexes. Files that cannot be
+             read are skipped.
+    :rtype: dict
+    """
+
+    if patterns is None:
+        patterns = RESULT_FILE_PATTERNS
+    results = {}
+    for filename in sorted(os.listdir(run_path)):
+        if not any(fnmatch.fnmatch(filename.lower(), pattern) for pattern in patterns):
+            continue
+        infile = os.path.join(run_path, filename)
+        try:
+            if w2_io.WDO_FILE_PATTERN.match(filename):
+                results[filename] = w2_io.read_wdo(infile, year)
+            else:
+                results[filename] = w2_scoring.read_model_file(infile, year)
+        except (IOError, ValueError, IndexError) as error:
+            print(f'Skipping {infile}: {error}')
+    return results
+
+
+def write_run_results(results: dict, run: str, outfile: str):
+    """
+    Write the output files of a run to an HDF5 results store.
+
+    Each file is written with `w2_io.write_hdf()` to the group <run>/<file name without
+    extension>. Slashes in column names, as in U(m/s), are replaced with underscores. Results
+    written earlier for the same run are replaced.
+
+    :param results: The output files of the run, as returned by `load_run_results()`.
+    :type results: dict
+    :param run: The run name.
+    :type run: str
+    :param outfile: Path to the HDF5 results store.
+    :type outfile: str
+    """
+
+    with h5py.File(outfile, 'a') as f:
+        if run in f:
+            del f[run]
+    for filename, df in results.items():
+        df = df.rename(columns=lambda column: str(column).replace('/', '_'))
+        w2_io.write_hdf(df, f'{run}/{os.path.splitext(filename)[0]}', outfile)
+
+
+class EnsembleRun:
+    """One run of an ensemble: its name, directory, changed input files, and status"""
+
+    def __init__(self, name: str, path: str, overrides: dict = None):
+        self.name = name
+        self.path = path
+        self.overrides = overrides or {}
+        self.status = 'pending'
+        self.returncode = None
+        self.errors = None
+        self.warnings = None
+        self.seconds = None
+        self.message = ''
+
+    def __repr__(self):
+        return f'EnsembleRun({self.name!r}, {self.status})'
+
+    def to_record(self) -> list:
+        """The run as a row of the run status table (RUN_STATUS_COLUMNS)."""
+        return [self.name, self.path, self.status, self.returncode, self.errors, self.warnings,
+                self.seconds, self.message]
+
+
+class Ensemble:
+    """
+    A set of CE-QUAL-W2 runs of one model, executed locally in parallel
+
+    Each run is a clone of the base model directory (see `clone_model()`) with some input files
+    replaced. The runs are launched with `run()`, at most `max_concurrent` at a time. Each model
+    process runs in its own run directory with its output written to w2_run.log; the threads
+    that wait for the processes do no other work. When a run finishes, its status is set from
+    its exit code and its w2.err and w2.wrn files, its outputs are loaded into the results store
+    (results.h5), and the run status table (runs.csv) in the work directory is updated.
+
+    :param model_path: Path to the base model directory.
+    :type model_path: str
+    :param workdir: The work directory, which holds the run directories, the run status
+                    table, and the results store.
+    :type workdir: str
+    :param command: The command that runs the model in the current directory, as a string
+                    or a list of arguments. Defaults to W2_EXECUTABLE. A stand-in command,
+                    such as a Python script, can be used for testing.
+    :type command: str or List[str], optional
+    :param max_concurrent: The maximum number of runs at a time. Defaults to the number of CPUs.
+    :type max_concurrent: int, optional
+    :param clone_mode: How to clone the unchanged model files (see `clone_model()`).
+    :type clone_mode: str, optional
+    :param year: The start year of the simulation. Defaults to the year in the control file.
+    :type year: int, optional
+    :param result_patterns: File name patterns of the output files loaded into the results
+                            store. Defaults to RESULT_FILE_PATTERNS. Use [] to skip loading.
+    :type result_patterns: List[str], optional
+    :param timeout: The maximum duration of a run, in seconds. Defaults to no limit.
+    :type timeout: float, optional
+    """
+
+    def __init__(self, model_path: str, workdir: str, command=None, max_concurrent: int = None,
+                 clone_mode: str = 'auto', year: int = None, result_patterns: List[str] = None,
+                 timeout: float = None):
+        if command is None:
+            command = [W2_EXECUTABLE]
+        elif isinstance(command, str):
+            command = shlex.split(command)
+        if year is None:
+            year = w2_control.get_model_year(model_path)
+
+        self.model_path = model_path
+        self.workdir = workdir
+        self.command = list(command)
+        self.max_concurrent = max_concurrent or os.cpu_count()
+        self.clone_mode = clone_mode
+        self.year = year
+        self.result_patterns = RESULT_FILE_PATTERNS if result_patterns is None else result_patterns
+        self.timeout = timeout
+        self.runs = {}
+
+    def __repr__(self):
+        return f'Ensemble({self.model_path!r}, {len(self.runs)} runs)'
+
+    @property
+    def store(self) -> str:
+        """Path to the HDF5 results store."""
+        return os.path.join(self.workdir, RESULTS_STORE_FILE)
+
+    def add_run(self, name: str, overrides: dict = None) -> EnsembleRun:
+        """
+        Add a run to the ensemble.
+
+        :param name: The run name, which is also the name of its directory in the work directory.
+        :type name: str
+        :param overrides: Files that replace model files in this run, as {filename: source path}.
+        :type overrides: dict, optional
+        :raises ValueError: If a run with the same name was already added.
+        :return: The run.
+        :rtype: EnsembleRun
+        """
+
+        if name in self.runs:
+            raise ValueError(f'Run {name} was already added to the ensemble')
+        run = EnsembleRun(name, os.path.join(self.workdir, name), overrides)
+        self.runs[name] = run
+        return run
+
+    def add_scenarios(self, scenario_path: str) -> List[EnsembleRun]:
+        """
+        Add one run per scenario written by `w2_scenario.generate_scenarios()`.
+
+        The changed files of each scenario are taken from the scenario manifest, so the scenarios
+        may be generated with or without copies of the unchanged model files.
+
+        :param scenario_path: The output directory of `generate_scenarios()`.
+        :type scenario_path: str
+        :return: The runs.
+        :rtype: List[EnsembleRun]
+        """
+
+        manifest = pd.read_csv(os.path.join(scenario_path, w2_scenario.MANIFEST_FILE))
+        runs = []
+        for name, changes in manifest.groupby('Scenario', sort=False):
+            directory = os.path.join(scenario_path, str(name))
+            overrides = {filename: os.path.join(directory, filename) for filename in changes['Filename'].unique()}
+            runs.append(self.add_run(str(name), overrides))
+        return runs
+
+    def status(self) -> pd.DataFrame:
+        """
+        Get the run status table.
+
+        :return: DataFrame with one row per run and the columns Run, Path, Status (pending,
+                 running, completed, warnings, failed, or error), ReturnCode, Errors and Warnings
+                 (the number of messages in w2.err and w2.wrn), Seconds, and Message.
+        :rtype: pd.DataFrame
+        """
+
+        return pd.DataFrame([run.to_record() for run in self.runs.values()], columns=RUN_STATUS_COLUMNS)
+
+    def _write_status(self):
+        """Write the run status table, so that the progress of the ensemble can be followed."""
+        self.status().to_csv(os.path.join(self.workdir, RUN_STATUS_FILE), index=False)
+
+    def _execute(self, run: EnsembleRun) -> dict:
+        """Clone, run, and check one run; return its outputs. Called in a worker thread."""
+        start = time.perf_counter()
+        try:
+            clone_model(self.model_path, run.path, mode=self.clone_mode, overrides=run.overrides)
+            run.status = 'running'
+            with open(os.path.join(run.path, RUN_LOG_FILE), 'wb') as log:
+                process = subprocess.run(self.command, cwd=run.path, stdout=log, stderr=subprocess.STDOUT,
+                                         timeout=self.timeout)
+            run.returncode = process.returncode
+            run.status, run.errors, run.warnings = run_status(run.path, process.returncode)
+        except subprocess.TimeoutExpired:
+            run.status = 'failed'
+            run.message = f'Timed out after {self.timeout} s'
+        except OSError as error:
+            run.status = 'error'
+            run.message = str(error)
+        finally:
+            run.seconds = round(time.perf_counter() - start, 3)
+
+        if run.status in ['completed', 'warnings'] and self.result_patterns:
+            return load_run_results(run.path, self.year, self.result_patterns)
+        return {}
+
+    def run(self, names: List[str] = None) -> pd.DataFrame:
+        """
+        Run the ensemble.
+
+        :param names: The runs to execute. Defaults to all the runs that are not finished.
+        :type names: List[str], optional
+        :raises ValueError: If outputs are loaded and the start year is not known.
+        :return: The run status table (see `status()`).
+        :rtype: pd.DataFrame
+        """
+
+        if self.result_patterns and self.year is None:
+            raise ValueError(f'No control file found for {self.model_path}; specify the start year')
+        if names is None:
+            names = [name for name, run in self.runs.items() if run.status in ['pending', 'error']]
+        os.makedirs(self.workdir, exist_ok=True)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrent) as executor:
+            futures = {executor.submit(self._execute, self.runs[name]): self.runs[name] for name in names}
+            for future in as_completed(futures):
+                run = futures[future]
+                results = future.result()
+                # The store is written by this thread only
+                if results:
+                    write_run_results(results, run.name, self.store)
+                print(f'{run.name}: {run.status}')
+                self._write_status()
+
+        self._write_status()
+        return self.status()
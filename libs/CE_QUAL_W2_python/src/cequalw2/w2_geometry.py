@@ -0,0 +1,249 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+SEGMENT_CENTERS_FILE = 'Segment_centers.txt'
+POLYGON_FILE = 'Polygon.bln'
+SEGMENT_CENTER_COLUMNS = ['Segment', 'Branch', 'Distance', 'X', 'Y', 'UTMZone', 'BottomElevation']
+POLYGON_HEADER_PATTERN = re.compile(r'Segment:\s*(\d+)\s+Branch:\s*(\d+)')
+
+# Number of nearest segment centers whose polygons are tested for each point
+NUM_CANDIDATES = 8
+
+
+def read_segment_centers(infile: str) -> pd.DataFrame:
+    """
+    Read the segment center coordinates of a model (Segment_centers.txt).
+
+    :param infile: Path to the segment centers file.
+    :type infile: str
+    :return: DataFrame with the columns Segment, Branch, Distance, X, Y, UTMZone, and
+             BottomElevation. Distances and coordinates are in meters (UTM).
+    :rtype: pd.DataFrame
+    """
+
+    df = pd.read_csv(infile, skipinitialspace=True)
+    df = df.iloc[:, :len(SEGMENT_CENTER_COLUMNS)]
+    df.columns = SEGMENT_CENTER_COLUMNS
+    df.attrs['Filename'] = infile
+    return df
+
+
+def read_polygons(infile: str):
+    """
+    Read the segment polygons of a model (Polygon.bln, Golden Software blanking format).
+
+    Each polygon has a header line, such as '5,1  Segment:  2 Branch:  1 DX= 456.4 B= 0.0',
+    followed by one 'x, y, zone,' line per vertex.
+
+    :param infile: Path to the polygon file.
+    :type infile: str
+    :return: The segment numbers (M), the branch numbers (M), and the vertices (M x V x 2).
+             Polygons with fewer than V vertices are padded by repeating their last vertex.
+    :rtype: tuple
+    """
+
+    with open(infile, 'r', encoding='latin-1') as f:
+        lines = [line.strip() for line in f if line.strip()]
+
+    segments = []
+    branches = []
+    polygons = []
+    i = 0
+    while i < len(lines):
+        header = lines[i]
+        num_vertices = int(header.split(',')[0])
+        match = POLYGON_HEADER_PATTERN.search(header)
+        if match is None:
+            raise ValueError(f'Unrecognized polygon header in {infile}: {header}')
+        segments.append(int(match.group(1)))
+        branches.append(int(match.group(2)))
+        vertices = [[float(value) for value in line.split(',')[:2]]
+                    for line in lines[i + 1:i + 1 + num_vertices]]
+        polygons.append(vertices)
+        i += 1 + num_vertices
+
+    max_vertices = max((len(vertices) for vertices in polygons), default=0)
+    padded = np.array([vertices + [vertices[-1]] * (max_vertices - len(vertices)) for vertices in polygons])
+    return np.array(segments), np.array(branches), padded.reshape(len(polygons), max_vertices, 2)
+
+
+def _points_in_polygons(x: np.ndarray, y: np.ndarray, vertices: np.ndarray) -> np.ndarray:
+    """
+    Test points against polygons with the even-odd (ray casting) rule.
+
+    :param x: Point x coordinates (N).
+    :param y: Point y coordinates (N).
+    :param vertices: Polygon vertices for each point (N x K x V x 2), tested pairwise.
+    :return: Boolean array (N x K), True where the point is inside the polygon.
+    """
+    xi = vertices[..., :-1, 0]
+    yi = vertices[..., :-1, 1]
+    xj = vertices[..., 1:, 0]
+    yj = vertices[..., 1:, 1]
+    px = x[:, np.newaxis, np.newaxis]
+    py = y[:, np.newaxis, np.newaxis]
+    straddles = (yi > py) != (yj > py)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = xi + (py - yi) * (xj - xi) / (yj - yi)
+    crossings = straddles & (px < x_cross)
+    return (crossings.sum(axis=-1) % 2) == 1
+
+
+class SegmentIndex:
+    """
+    Spatial index of the segments of a model
+
+    The segment centers are stored in a KD-tree. A point is assigned to the segment whose polygon
+    contains it, testing the polygons of the nearest segment centers first. Points that are not
+    inside any of those polygons (for example, where the polygons have zero width) are assigned
+    to the segment with the nearest center.
+    """
+
+    def __init__(self, centers: pd.DataFrame, polygon_segments: np.ndarray = None,
+                 polygon_vertices: np.ndarray = None):
+        self.centers = centers.reset_index(drop=True)
+        self.segments = self.centers['Segment'].to_numpy()
+        self.branches = self.centers['Branch'].to_numpy()
+        self.tree = cKDTree(self.centers[['X', 'Y']].to_numpy())
+
+        # Polygon of each segment center, as a position in the vertex array (-1 if none)
+        self.polygon_vertices = polygon_vertices
+        self.polygon_positions = np.full(len(self.segments), -1)
+        if polygon_segments is not None:
+            positions = {segment: i for i, segment in enumerate(polygon_segments)}
+            self.polygon_positions = np.array([positions.get(segment, -1) for segment in self.segments])
+
+    def __repr__(self):
+        return f'SegmentIndex({len(self.segments)} segments)'
+
+    def locate(self, x, y, max_distance: float = None) -> pd.DataFrame:
+        """
+        Find the model segment and branch of many points in one call.
+
+        :param x: Easting(s), in the UTM zone of the model.
+        :type x: array-like
+        :param y: Northing(s), in the UTM zone of the model.
+        :type y: array-like
+        :param max_distance: Points that are outside the polygons and farther than this from
+                             the nearest segment center are not assigned to a segment.
+        :type max_distance: float, optional
+        :return: DataFrame with one row per point and the columns Segment, Branch (nullable
+                 integers), Distance (to the segment center, in meters), and InPolygon.
+        :rtype: pd.DataFrame
+        """
+
+        x = np.atleast_1d(np.asarray(x, dtype=float))
+        y = np.atleast_1d(np.asarray(y, dtype=float))
+        k = min(NUM_CANDIDATES, len(self.segments))
+        distances, candidates = self.tree.query(np.column_stack([x, y]), k=k)
+        distances = distances.reshape(len(x), k)
+        candidates = candidates.reshape(len(x), k)
+
+        inside = np.zeros(candidates.shape, dtype=bool)
+        if self.polygon_vertices is not None and len(self.polygon_vertices) > 0:
+            polygon_positions = self.polygon_positions[candidates]
+            has_polygon = polygon_positions >= 0
+            vertices = self.polygon_vertices[np.where(has_polygon, polygon_positions, 0)]
+            inside = _points_in_polygons(x, y, vertices) & has_polygon
+
+        # First candidate (in order of distance) whose polygon contains the point, else the nearest
+        in_polygon = inside.any(axis=1)
+        choice = np.where(in_polygon, inside.argmax(axis=1), 0)
+        rows = np.arange(len(x))
+        chosen = candidates[rows, choice]
+        distance = distances[rows, choice]
+
+        segment = pd.array(self.segments[chosen], dtype='Int64')
+        branch = pd.array(self.branches[chosen], dtype='Int64')
+        if max_distance is not None:
+            outside = ~in_polygon & (distance > max_distance)
+            segment[outside] = pd.NA
+            branch[outside] = pd.NA
+
+        return pd.DataFrame({
+            'Segment': segment,
+            'Branch': branch,
+            'Distance': distance,
+            'InPolygon': in_polygon,
+        })
+
+    def locate_lonlat(self, longitude, latitude, max_distance: float = None) -> pd.DataFrame:
+        """
+        Find the model segment and branch of many points given in longitude and latitude.
+
+        The points are projected to the UTM zone of the model (northern hemisphere, WGS 84) with
+        pyproj, which must be installed.
+
+        :param longitude: Longitude(s), in decimal degrees.
+        :type longitude: array-like
+        :param latitude: Latitude(s), in decimal degrees.
+        :type latitude: array-like
+        :param max_distance: See `locate()`.
+        :type max_distance: float, optional
+        :return: See `locate()`.
+        :rtype: pd.DataFrame
+        """
+
+        try:
+            from pyproj import Transformer
+        except ImportError as error:
+            raise ImportError('locate_lonlat() requires pyproj. Install it, or project the '
+                              'coordinates to UTM and call locate().') from error
+
+        zone = int(self.centers['UTMZone'].iloc[0])
+        transformer = Transformer.from_crs('EPSG:4326', f'EPSG:{32600 + zone}', always_xy=True)
+        x, y = transformer.transform(np.asarray(longitude, dtype=float), np.asarray(latitude, dtype=float))
+        return self.locate(x, y, max_distance=max_distance)
+
+
+def build_segment_index(model_path: str) -> SegmentIndex:
+    """
+    Build the spatial index of a model from Segment_centers.txt and, if present, Polygon.bln.
+
+    :param model_path: Path to the model directory.
+    :type model_path: str
+    :return: The spatial index.
+    :rtype: SegmentIndex
+    """
+
+    centers = read_segment_centers(os.path.join(model_path, SEGMENT_CENTERS_FILE))
+    polygon_file = os.path.join(model_path, POLYGON_FILE)
+    if os.path.isfile(polygon_file):
+        polygon_segments, _, polygon_vertices = read_polygons(polygon_file)
+        return SegmentIndex(centers, polygon_segments, polygon_vertices)
+    return SegmentIndex(centers)
+
+
+def locate_observations(observations: pd.DataFrame, index: SegmentIndex, x_column: str = 'X',
+                        y_column: str = 'Y', max_distance: float = None) -> pd.DataFrame:
+    """
+    Add the model segment and branch to a table of observation sites or samples.
+
+    :param observations: Table with one row per observation and coordinate columns.
+    :type observations: pd.DataFrame
+    :param index: The spatial index of the model.
+    :type index: SegmentIndex
+    :param x_column: Name of the easting (or longitude) column. Defaults to 'X'.
+    :type x_column: str
+    :param y_column: Name of the northing (or latitude) column. Defaults to 'Y'.
+    :type y_column: str
+    :param max_distance: See `SegmentIndex.locate()`.
+    :type max_distance: float, optional
+    :return: A copy of the table with the columns Segment, Branch, Distance, and InPolygon added.
+             If the coordinate columns are named like longitude and latitude, the points are
+             projected to UTM first.
+    :rtype: pd.DataFrame
+    """
+
+    x = observations[x_column].to_numpy()
+    y = observations[y_column].to_numpy()
+    if x_column.lower() in ['lon', 'long', 'longitude', 'dec_long_va'] or \
+            y_column.lower() in ['lat', 'latitude', 'dec_lat_va']:
+        located = index.locate_lonlat(x, y, max_distance=max_distance)
+    else:
+        located = index.locate(x, y, max_distance=max_distance)
+    located.index = observations.index
+    return pd.concat([observations, located], axis=1)
@@ -1,9 +1,16 @@
+import io
 import os
+import re
+import functools
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 from enum import Enum
+import numpy as np
 import pandas as pd
 import h5py
 import sqlite3
+import yaml
 from . import w2_datetime
 
 
@@ -20,6 +27,19 @@ class FileType(Enum):
     CSV = 2
 
 
+# Withdrawal output files: flow (qwo), temperature (two), constituents (cwo), and derived
+# constituents (dwo), e.g. two_75_wdo.csv or two_str1_seg75_wdo.csv
+WDO_KINDS = ['qwo', 'two', 'cwo', 'dwo']
+WDO_FILE_PATTERN = re.compile(r'^(qwo|two|cwo|dwo)_(.+)_wdo\.csv$', re.IGNORECASE)
+WDO_SENTINEL = -99.0
+
+# Sentinel used for missing values by the USGS water services
+USGS_SENTINEL = -999999.0
+
+# Withdrawal output kinds whose header names only the combined outflow column
+WDO_OUTLET_KINDS = ['qwo', 'two']
+
+
 def get_header_row_number(file_path):
     """Get the row number of the header in a file.
 
@@ -100,6 +120,35 @@ def get_data_columns_fixed_width(file_path):
         return data_columns
 
 
+def get_data_columns(file_path):
+    """
+    Get the data column names of a CE-QUAL-W2 file, using the file extension to select the format.
+
+    Repeated names, such as the algal limiting factors in the tsr files, are made unique by
+    appending _2, _3, etc. to the second and later occurrences.
+
+    Args:
+        file_path (str): The path to the file (*.csv, *.npt, or *.opt).
+
+    Returns:
+        list: A list of unique data column names.
+    """
+
+    if file_path.lower().endswith('.csv'):
+        data_columns = get_data_columns_csv(file_path)
+    else:
+        data_columns = get_data_columns_fixed_width(file_path)
+
+    counts = {}
+    unique_columns = []
+    for column in data_columns:
+        counts[column] = counts.get(column, 0) + 1
+        if counts[column] > 1:
+            column = f'{column}_{counts[column]}'
+        unique_columns.append(column)
+    return unique_columns
+
+
 def split_fixed_width_line(line, field_width):
     """
     Split a line into segments of fixed width.
@@ -121,6 +170,49 @@ def split_fixed_width_line(line, field_width):
     return [line[i:i + field_width] for i in range(0, len(line), field_width)]
 
 
+def _column_dtypes(data_columns: List[str], dtype):
+    """
+    Map the data columns to a float dtype for the parser.
+
+    The index (day or date) column is not included, so that Julian days keep full precision
+    when the data are read as float32.
+
+    :param data_columns: The names of the data columns.
+    :type data_columns: List[str]
+    :param dtype: The float dtype of the data columns, such as np.float32. If None, the parser
+                  chooses the dtype (float64 for numeric columns).
+    :return: Dictionary of {column: dtype}, or None.
+    :rtype: dict
+    """
+
+    if dtype is None:
+        return None
+    return {column: dtype for column in data_columns}
+
+
+def _mask_sentinels(values: np.ndarray, na_values) -> np.ndarray:
+    """
+    Set sentinel values to NaN.
+
+    The input array is not modified, so read-only arrays, such as the column arrays of a
+    copy-on-write DataFrame, can be masked.
+
+    :param values: A numeric array. Integer arrays are converted to float.
+    :type values: np.ndarray
+    :param na_values: The sentinel values, such as [-99, -999999]. If None, the array is returned
+                      unchanged.
+    :type na_values: list, optional
+    :return: A new array, with NaN in place of the sentinels.
+    :rtype: np.ndarray
+    """
+
+    if not na_values or values.dtype.kind not in 'iuf':
+        return values
+    if values.dtype.kind != 'f':
+        values = values.astype(float)
+    return np.where(np.isin(values, na_values), np.array(np.nan, dtype=values.dtype), values)
+
+
 def dataframe_to_date_format(year: int, data_frame: pd.DataFrame) -> pd.DataFrame:
     """
     Convert the day-of-year column in a CE-QUAL-W2 data frame to datetime objects.
@@ -139,7 +231,8 @@ def dataframe_to_date_format(year: int, data_frame: pd.DataFrame) -> pd.DataFram
     return data_frame
 
 
-def read_npt_opt(infile: str, data_columns: List[str], skiprows: int = 3) -> pd.DataFrame:
+def read_npt_opt(infile: str, data_columns: List[str], skiprows: int = 3, na_values=None,
+                 dtype=None) -> pd.DataFrame:
     """
     Read CE-QUAL-W2 time series (fixed-width format, *.npt files).
 
@@ -149,6 +242,10 @@ def read_npt_opt(infile: str, data_columns: List[str], skiprows: int = 3) -> pd.
     :type data_columns: List[str]
     :param skiprows: The number of header rows to skip. Defaults to 3.
     :type skiprows: int, optional
+    :param na_values: Sentinel values, such as [-99], that are read as NaN.
+    :type na_values: list, optional
+    :param dtype: The dtype of the data columns, such as np.float32. Defaults to float64.
+    :type dtype: np.dtype, optional
     :return: A DataFrame of the time series data read from the input file.
     :rtype: pd.DataFrame
     """
@@ -163,7 +260,8 @@ def read_npt_opt(infile: str, data_columns: List[str], skiprows: int = 3) -> pd.
         for _ in range(skiprows + 1):
             line = f.readline()
         if ',' in line:
-            return read_csv(infile, data_columns=data_columns, skiprows=skiprows)
+            return read_csv(infile, data_columns=data_columns, skiprows=skiprows, na_values=na_values,
+                            dtype=dtype)
 
     # Parse the fixed-width file
 
@@ -173,7 +271,8 @@ def read_npt_opt(infile: str, data_columns: List[str], skiprows: int = 3) -> pd.
     columns_to_read = ['DoY', *data_columns]
     try:
         df = pd.read_fwf(infile, skiprows=skiprows, widths=ncols_to_read*[8],
-                         names=columns_to_read, index_col=0)
+                         names=columns_to_read, index_col=0, na_values=na_values,
+                         dtype=_column_dtypes(data_columns, dtype))
     except:
         raise IOError(f'Error reading {infile}')
 
@@ -182,7 +281,8 @@ def read_npt_opt(infile: str, data_columns: List[str], skiprows: int = 3) -> pd.
     return df
 
 
-def read_csv(infile: str, data_columns: List[str], skiprows: int = 3) -> pd.DataFrame:
+def read_csv(infile: str, data_columns: List[str], skiprows: int = 3, na_values=None,
+             dtype=None) -> pd.DataFrame:
     """
     Read CE-QUAL-W2 time series in CSV format.
 
@@ -192,22 +292,29 @@ def read_csv(infile: str, data_columns: List[str], skiprows: int = 3) -> pd.Data
     :type data_columns: List[str]
     :param skiprows: The number of header rows to skip. Defaults to 3.
     :type skiprows: int, optional
+    :param na_values: Sentinel values, such as [-99], that are read as NaN.
+    :type na_values: list, optional
+    :param dtype: The dtype of the data columns, such as np.float32. Defaults to float64.
+    :type dtype: np.dtype, optional
     :return: A DataFrame of the time series data read from the input file.
     :rtype: pd.DataFrame
     """
 
+    dtypes = _column_dtypes(data_columns, dtype)
     try:
-        df = pd.read_csv(infile, skiprows=skiprows, names=data_columns, index_col=0)
-    except IndexError:
+        df = pd.read_csv(infile, skiprows=skiprows, names=data_columns, index_col=0, na_values=na_values,
+                         dtype=dtypes)
+    except (IndexError, pd.errors.ParserError):
         # Handle trailing comma, which adds an extra (empty) column
         try:
-            df = pd.read_csv(infile, skiprows=skiprows, names=[*data_columns, 'JUNK'], index_col=0)
+            df = pd.read_csv(infile, skiprows=skiprows, names=[*data_columns, 'JUNK'], index_col=0,
+                             na_values=na_values, dtype=dtypes)
             df = df.drop(axis=1, labels='JUNK')
-        except IndexError:
+        except (IndexError, pd.errors.ParserError):
             print('Error reading ' + infile)
             print('Trying again with an additional column')
             df = pd.read_csv(infile, skiprows=skiprows, names=[*data_columns, 'JUNK1', 'JUNK2'],
-                             index_col=0)
+                             index_col=0, na_values=na_values, dtype=dtypes)
             df = df.drop(axis=1, labels=['JUNK1', 'JUNK2'])
     except:
         raise IOError(f'Error reading {infile}')
@@ -217,12 +324,13 @@ def read_csv(infile: str, data_columns: List[str], skiprows: int = 3) -> pd.Data
     return df
 
 
-def read_sqlite(file_path: str) -> pd.DataFrame:
+def read_sqlite(file_path: str, na_values=None) -> pd.DataFrame:
     """
     Read an SQLite database file and return the contents of the first table as a Pandas DataFrame.
 
     Args:
         file_path (str): The path to the SQLite database file.
+        na_values (list, optional): Sentinel values, such as [-999999], that are set to NaN.
 
     Returns:
         pd.DataFrame: The contents of the first table in the SQLite database.
@@ -260,6 +368,11 @@ def read_sqlite(file_path: str) -> pd.DataFrame:
 
     # Convert the first column to Pandas date-time objects
     df[column_names[0]] = pd.to_datetime(df[column_names[0]])
+
+    # Set the sentinel values of the numeric columns to NaN
+    if na_values:
+        for column in column_names[1:]:
+            df[column] = _mask_sentinels(df[column].to_numpy(), na_values)
     
     # Set the index to the date-time column
     df.set_index(column_names[0], inplace=True)
@@ -284,12 +397,15 @@ def read(*args, **kwargs):
 
     :param args: Any number of positional arguments. The first argument should be the path to the
                  input time series file. The second argument should be the start year of the
-                 simulation. The third argument (optional) should be the list of names of the data
-                 columns.
+                 simulation, or None to keep the Julian day (JDAY) index. The third argument
+                 (optional) should be the list of names of the data columns.
     :param kwargs: Any number of keyword arguments.
                    - skiprows: The number of header rows to skip. Defaults to 3.
                    - file_type: The file type (CSV, npt, or opt). If not specified, it is
                                 determined from the file extension.
+                   - na_values: Sentinel values, such as [-99], that are read as NaN.
+                   - dtype: The dtype of the data columns, such as np.float32. Defaults to
+                            float64. The day column is always read as float64.
     :raises ValueError: If the file type was not specified and could not be determined from the
                         filename.
     :raises ValueError: If an unrecognized file type is encountered. Valid file types are CSV, npt,
@@ -308,6 +424,8 @@ def read(*args, **kwargs):
     # Assign keywords to variables
     skiprows = kwargs.get('skiprows', 3)
     file_type = kwargs.get('file_type', None)
+    na_values = kwargs.get('na_values', None)
+    dtype = kwargs.get('dtype', None)
 
     # If not defined, set the file type using the input filename
     if not file_type:
@@ -323,14 +441,15 @@ def read(*args, **kwargs):
 
     # Read the data
     if file_type == FileType.FIXED_WIDTH:
-        df = read_npt_opt(infile, data_columns, skiprows=skiprows)
+        df = read_npt_opt(infile, data_columns, skiprows=skiprows, na_values=na_values, dtype=dtype)
     elif file_type == FileType.CSV:
-        df = read_csv(infile, data_columns, skiprows=skiprows)
+        df = read_csv(infile, data_columns, skiprows=skiprows, na_values=na_values, dtype=dtype)
     else:
         raise ValueError('Unrecognized file type. Valid file types are CSV, npt, and opt.')
 
     # Convert day-of-year column of the data frames to date format
-    df = dataframe_to_date_format(year, df)
+    if year is not None:
+        df = dataframe_to_date_format(year, df)
     df.attrs['Filename'] = infile
 
     return df
@@ -347,6 +466,8 @@ def read_met(*args, **kwargs) -> pd.DataFrame:
                    - skiprows: The number of header rows to skip. Defaults to 3.
                    - file_type: The file type (CSV, npt, or opt). If not specified, it is
                                 determined from the file extension.
+                   - na_values: Sentinel values, such as [-99], that are read as NaN.
+                   - dtype: The dtype of the data columns, such as np.float32.
     :return: Dataframe of the time series in the input file.
     :rtype: pd.DataFrame
     """
@@ -377,13 +498,17 @@ def read_excel(file_path: str, **kwargs):
 
     :param file_path: The path to the Excel file.
     :type file_path: str
+    :param kwargs: Any number of keyword arguments.
+                   - skiprows: The number of header rows to skip. Defaults to 3.
+                   - na_values: Sentinel values, such as [-99], that are read as NaN.
     :return: Dataframe of the time series in the input file.
     :rtype: pd.DataFrame
     """
     # Get keyword arguments
     skiprows = kwargs.get('skiprows', 3)
+    na_values = kwargs.get('na_values', None)
 
-    df = pd.read_excel(file_path, skiprows=skiprows)
+    df = pd.read_excel(file_path, skiprows=skiprows, na_values=na_values)
     first_column_name = df.columns[0]
     df.rename(columns={f'{first_column_name}': 'Date'}, inplace=True)
     df['Date'] = pd.to_datetime(df['Date'], format='%m/%d/%Y %H:%M')
@@ -391,7 +516,7 @@ def read_excel(file_path: str, **kwargs):
     return df
 
 
-def write_hdf(df: pd.DataFrame, group: str, outfile: str, overwrite=True):
+def write_hdf(df: pd.DataFrame, group: str, outfile: str, overwrite=True, dtype=None):
     """
     Write CE-QUAL-W2 timeseries dataframe to HDF5
 
@@ -407,6 +532,9 @@ def write_hdf(df: pd.DataFrame, group: str, outfile: str, overwrite=True):
     :type outfile: str
     :param overwrite: Whether to overwrite existing data in HDF5. Defaults to True.
     :type overwrite: bool, optional
+    :param dtype: The dtype of the stored data columns, such as np.float32. Defaults to the dtype
+                  of each column.
+    :type dtype: np.dtype, optional
     """
 
     with h5py.File(outfile, 'a') as f:
@@ -421,10 +549,10 @@ def write_hdf(df: pd.DataFrame, group: str, outfile: str, overwrite=True):
             ts_path = f'{group}/{col}'
             if overwrite and (ts_path in f):
                 del f[ts_path]
-            f.create_dataset(ts_path, data=df[col])
+            f.create_dataset(ts_path, data=df[col], dtype=dtype)
 
 
-def read_hdf(group: str, infile: str, variables: List[str]) -> pd.DataFrame:
+def read_hdf(group: str, infile: str, variables: List[str], na_values=None, dtype=None) -> pd.DataFrame:
     """
     Read CE-QUAL-W2 timeseries from HDF5 and create a dataframe.
 
@@ -438,6 +566,11 @@ def read_hdf(group: str, infile: str, variables: List[str]) -> pd.DataFrame:
     :type infile: str
     :param variables: A list of variable names to read from the HDF5 file.
     :type variables: List[str]
+    :param na_values: Sentinel values, such as [-99], that are set to NaN as each variable is read.
+    :type na_values: list, optional
+    :param dtype: The dtype of the data columns, such as np.float32. The stored values are
+                  converted as they are read. Defaults to the stored dtype.
+    :type dtype: np.dtype, optional
 
     :return: Dataframe containing the time series data.
     :rtype: pd.DataFrame
@@ -452,7 +585,11 @@ def read_hdf(group: str, infile: str, variables: List[str]) -> pd.DataFrame:
         ts = {}
         for variable in variables:
             ts_path = f'{group}/{variable}'
-            ts[variable] = f.get(ts_path)
+            dataset = f.get(ts_path)
+            if dataset is not None:
+                dataset = dataset[()] if dtype is None else dataset.astype(dtype)[()]
+                dataset = _mask_sentinels(dataset, na_values)
+            ts[variable] = dataset
 
         dates = []
         for dstr in dates_str:
@@ -466,6 +603,383 @@ def read_hdf(group: str, infile: str, variables: List[str]) -> pd.DataFrame:
         return df
 
 
+def _wdo_rows(infile: str):
+    """
+    Get the data column names and the data lines of a withdrawal output file.
+
+    The header row starts with JDAY and may be preceded by any number of title lines, such as
+    '$Flow file for segment 75'. The headers of the flow and temperature files (qwo and two) name
+    only the combined outflow column and end with a comma, which marks the unnamed columns of the
+    individual outlets that follow; these are named <column>_1, <column>_2, etc., counted from the
+    most common number of values in the data lines. The other headers name all the columns.
+
+    Some files interleave rows of another output, with a different number of values, such as the
+    rows of 4 values between the rows of 16 constituents in cwo_str1_seg75_wdo.csv. Only the rows
+    with one value per column are returned, and the number of other rows is printed.
+
+    :raises ValueError: If there is no JDAY header row, or none of the data lines has one value per column.
+    :return: The data column names and the data lines.
+    :rtype: tuple
+    """
+
+    with open(infile, 'r', encoding='latin-1') as f:
+        lines = f.readlines()
+
+    header_row = next((row for row, line in enumerate(lines) if line.lstrip().upper().startswith('JDAY')), None)
+    if header_row is None:
+        raise ValueError(f'No JDAY header row found in {infile}')
+
+    header = lines[header_row]
+    names = [name.strip() for name in header.split(',')[1:]]
+    names = [name for name in names if name]
+    rows = [line for line in lines[header_row + 1:] if line.strip()]
+    counts = [line.rstrip().rstrip(',').count(',') for line in rows]
+
+    match = WDO_FILE_PATTERN.match(os.path.basename(infile))
+    kind = match.group(1).lower() if match else None
+    if kind in WDO_OUTLET_KINDS and names and header.rstrip().endswith(',') and counts:
+        num_values = Counter(counts).most_common(1)[0][0]
+        names += [f'{names[-1]}_{i}' for i in range(1, num_values - len(names) + 1)]
+
+    data_rows = [line for line, count in zip(rows, counts) if count == len(names)]
+    if len(data_rows) < len(rows):
+        if not data_rows:
+            raise ValueError(f'None of the rows of {infile} has the {len(names)} values of the header')
+        other_counts = sorted(set(count for count in counts if count != len(names)))
+        print(f'Skipped {len(rows) - len(data_rows)} rows of {infile} with '
+              f'{", ".join(map(str, other_counts))} values instead of the {len(names)} values of the header')
+    return names, data_rows
+
+
+def read_wdo(infile: str, year: int = None, na_values=(WDO_SENTINEL,), dtype=np.float64) -> pd.DataFrame:
+    """
+    Read a CE-QUAL-W2 withdrawal output file (qwo_*, two_*, cwo_*, or dwo_*_wdo.csv).
+
+    Rows of another output that the model interleaved in the file, which have a different number
+    of values than the header has columns, are skipped (see `_wdo_rows()`).
+
+    :param infile: Path to the withdrawal output file.
+    :type infile: str
+    :param year: The start year of the simulation. If None, the index is the Julian day (JDAY).
+    :type year: int, optional
+    :param na_values: Sentinel values that are read as NaN. Defaults to the -99 that the model
+                      writes for outlets without flow.
+    :type na_values: list, optional
+    :param dtype: The dtype of the data columns, such as np.float32. Defaults to float64.
+    :type dtype: np.dtype, optional
+    :raises ValueError: If there is no JDAY header row, or none of the rows has one value per column.
+    :return: DataFrame of the withdrawal output, with one row per unique output time.
+    :rtype: pd.DataFrame
+    """
+
+    data_columns, data_rows = _wdo_rows(infile)
+    try:
+        df = pd.read_csv(io.StringIO(''.join(data_rows)), header=None, names=['JDAY', *data_columns],
+                         usecols=range(len(data_columns) + 1), index_col=0, skipinitialspace=True,
+                         na_values=list(na_values) if na_values else None,
+                         dtype={'JDAY': np.float64, **(_column_dtypes(data_columns, dtype) or {})})
+    except (ValueError, pd.errors.ParserError) as error:
+        raise IOError(f'Error reading {infile}') from error
+
+    # The model repeats the output time when a new outlet is switched on; keep the last row
+    df = df[~df.index.duplicated(keep='last')]
+    if year is not None:
+        df = dataframe_to_date_format(year, df)
+    df.attrs['Filename'] = infile
+    return df
+
+
+def find_wdo_families(model_path: str) -> dict:
+    """
+    Find the withdrawal output files of a model, grouped by outlet.
+
+    :param model_path: Path to the model directory.
+    :type model_path: str
+    :return: Dictionary of {family: {kind: path}}, where the family is the part of the file name
+             between the kind and '_wdo.csv', e.g. '75' or 'str1_seg75', and the kind is qwo,
+             two, cwo, or dwo.
+    :rtype: dict
+    """
+
+    families = {}
+    for filename in sorted(os.listdir(model_path)):
+        match = WDO_FILE_PATTERN.match(filename)
+        if match is not None:
+            kind, family = match.group(1).lower(), match.group(2)
+            families.setdefault(family, {})[kind] = os.path.join(model_path, filename)
+    return families
+
+
+def read_wdo_family(model_path: str, family: str, year: int = None, max_workers: int = None,
+                    na_values=(WDO_SENTINEL,), dtype=np.float64) -> pd.DataFrame:
+    """
+    Read all the withdrawal output files of one outlet into one aligned DataFrame.
+
+    The files are read in parallel threads. Their rows are aligned on the union of the output
+    times, with NaN where a file has no row, and copied once into a single array.
+
+    :param model_path: Path to the model directory.
+    :type model_path: str
+    :param family: The outlet, e.g. '75' for qwo_75_wdo.csv, two_75_wdo.csv, etc.
+    :type family: str
+    :param year: The start year of the simulation. If None, the index is the Julian day (JDAY).
+    :type year: int, optional
+    :param max_workers: The number of threads. Defaults to one per file.
+    :type max_workers: int, optional
+    :param na_values: Sentinel values that are read as NaN. Defaults to -99.
+    :type na_values: list, optional
+    :param dtype: The dtype of the data columns, such as np.float32. Defaults to float64.
+    :type dtype: np.dtype, optional
+    :raises ValueError: If no withdrawal output files were found for the outlet.
+    :return: DataFrame with MultiIndex columns (Kind, Variable).
+    :rtype: pd.DataFrame
+    """
+
+    files = find_wdo_families(model_path).get(family)
+    if not files:
+        raise ValueError(f'No withdrawal output files found for {family} in {model_path}')
+    kinds = [kind for kind in WDO_KINDS if kind in files]
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(kinds)) as executor:
+        dfs = list(executor.map(functools.partial(read_wdo, na_values=na_values, dtype=dtype),
+                                [files[kind] for kind in kinds]))
+
+    index = dfs[0].index
+    for df in dfs[1:]:
+        if not df.index.equals(index):
+            index = index.union(df.index)
+
+    columns = [(kind, column) for kind, df in zip(kinds, dfs) for column in df.columns]
+    values = np.full((len(index), len(columns)), np.nan, dtype=dtype)
+    start = 0
+    for df in dfs:
+        stop = start + len(df.columns)
+        if df.index.equals(index):
+            values[:, start:stop] = df.to_numpy()
+        else:
+            values[index.get_indexer(df.index), start:stop] = df.to_numpy()
+        start = stop
+
+    result = pd.DataFrame(values, index=index,
+                          columns=pd.MultiIndex.from_tuples(columns, names=['Kind', 'Variable']))
+    if year is not None:
+        result = dataframe_to_date_format(year, result)
+    result.attrs['Filename'] = [files[kind] for kind in kinds]
+    return result
+
+
+# Field width of fixed-width CE-QUAL-W2 input files (*.npt)
+NPT_FIELD_WIDTH = 8
+
+# Number of rows formatted and written at a time by the writers
+WRITE_BLOCK_ROWS = 65536
+
+# Fixed-width values are written with the requested decimals when these keep at least this many
+# significant digits; smaller values, and values too large for the field, use the most precise
+# format that fits
+NPT_SIGNIFICANT_DIGITS = 3
+
+
+def _format_each(values: np.ndarray, formats: List[str]) -> List[str]:
+    """Format each value with its own '%' format, with a single '%' operation."""
+    if len(values) == 0:
+        return []
+    return ('\n'.join(formats) % tuple(values.tolist())).split('\n')
+
+
+def _npt_fields(values: np.ndarray, width: int) -> List[str]:
+    """
+    Format values in fixed-width fields with the most precise format that fits: '%.Nf' with as
+    many decimals as fit (e.g., '-1303.20' or '-0.00035'), or '%.Ng' for values below 1e-4 or with
+    too many integer digits (e.g., '7.06e-08' or '1.23e+08').
+    """
+    negative = values < 0
+    magnitude = np.abs(values)
+    integer_length = np.array([len(text) for text in _format_each(values, ['%.0f'] * len(values))])
+    general = (integer_length > width) | ((magnitude > 0) & (magnitude < 1e-4))
+    digits = np.where(general, np.maximum(width - negative - 5, 1), np.maximum(width - integer_length - 1, 0))
+    kinds = np.where(general, 'g', 'f')
+    minimum_digits = np.where(general, 1, 0)
+
+    texts = _format_each(values, [f'%.{n}{kind}' for n, kind in zip(digits.tolist(), kinds.tolist())])
+    too_long = np.flatnonzero([len(text) > width for text in texts])
+    while len(too_long):
+        if (digits[too_long] == minimum_digits[too_long]).any():
+            value = values[too_long[digits[too_long] == minimum_digits[too_long]][0]]
+            raise ValueError(f'The value {value} cannot be written in a field of width {width}')
+        digits[too_long] -= 1
+        formats = [f'%.{n}{kind}' for n, kind in zip(digits[too_long].tolist(), kinds[too_long].tolist())]
+        for i, text in zip(too_long.tolist(), _format_each(values[too_long], formats)):
+            texts[i] = text
+        too_long = too_long[[len(texts[i]) > width for i in too_long.tolist()]]
+    return [text.rjust(width) for text in texts]
+
+
+def _npt_replacements(values: np.ndarray, width: int, precision: int) -> np.ndarray:
+    """
+    Find the values that do not fit a fixed-width field with `precision` decimals, or that would
+    keep fewer significant digits than `NPT_SIGNIFICANT_DIGITS`.
+    """
+    magnitude = np.abs(values)
+    limit = 10.0 ** (width - precision - (precision > 0) - (values < 0))
+    near_limit = np.flatnonzero(magnitude >= 0.9 * limit)
+    texts = _format_each(values[near_limit], [f'%.{precision}f'] * len(near_limit))
+    too_long = near_limit[[len(text) > width for text in texts]]
+    imprecise = ((magnitude > 0) & (magnitude < 10.0 ** (NPT_SIGNIFICANT_DIGITS - 1 - precision))
+                 & (np.round(values, precision) != values))
+    return np.union1d(np.flatnonzero(imprecise), too_long).astype(int)
+
+
+def _format_block(block: np.ndarray, formats: List[str], separator: str, replacements: dict) -> str:
+    """
+    Format a block of rows with a single '%' operation. `formats` has the '%' format of each
+    column, and `replacements` maps flat indices of `block` to the texts written instead of the
+    values.
+    """
+    value_formats = [fmt + separator for fmt in formats[:-1]] + [formats[-1] + '\n']
+    values = block.ravel().tolist()
+    if not replacements:
+        return (''.join(value_formats) * len(block)) % tuple(values)
+
+    text_formats = ['%s' + separator] * (len(formats) - 1) + ['%s\n']
+    field_formats = np.tile(np.array(value_formats, dtype=object), len(block))
+    for i, text in replacements.items():
+        values[i] = text
+        field_formats[i] = text_formats[i % len(formats)]
+    return ''.join(field_formats.tolist()) % tuple(values)
+
+
+def _time_series_columns(df: pd.DataFrame, year: int = None):
+    """Get the Julian days and the data columns (float64) of a time series DataFrame."""
+    if isinstance(df.index, pd.DatetimeIndex):
+        if year is None:
+            raise ValueError('The year is required to convert the date-time index to Julian days.')
+        jday = w2_datetime.datetime_to_day_of_year(year, df.index)
+    else:
+        jday = df.index.to_numpy(dtype=np.float64)
+    columns = [df[column].to_numpy(dtype=np.float64, na_value=np.nan) for column in df.columns]
+    return jday, columns
+
+
+def _column_precisions(df: pd.DataFrame, precision) -> List[int]:
+    """Get the number of decimals of each column from an int, a list, or a dictionary."""
+    if isinstance(precision, dict):
+        return [precision.get(column, 3) for column in df.columns]
+    if isinstance(precision, (list, tuple)):
+        return list(precision)
+    return [precision] * len(df.columns)
+
+
+def write_npt(df: pd.DataFrame, outfile: str, year: int = None, header: List[str] = None, precision=3,
+              jday_precision: int = 3, fill_value: float = None):
+    """
+    Write a time series in the fixed-width format of CE-QUAL-W2 input files (*.npt).
+
+    Each value is written in an 8-character field, with the Julian day in the first field, with
+    the requested number of decimals ('%8.3f'). Values that do not fit the field with these
+    decimals, or that would keep fewer than three significant digits, are written with the '%.Nf'
+    or '%.Ng' format that fits and loses the least precision, e.g. -1303.20, -0.00035, or
+    7.06e-08. CE-QUAL-W2 reads a blank field as zero, so missing values must be filled, or
+    written as an explicit fill value. The rows are written a block at a time. The DataFrame is
+    not modified.
+
+    :param df: The time series, with a date-time index or a Julian day index.
+    :type df: pd.DataFrame
+    :param outfile: The path to the output file.
+    :type outfile: str
+    :param year: The start year of the simulation. Required for a date-time index.
+    :type year: int, optional
+    :param header: The three header lines. Defaults to a title line with the file name, a blank
+                   line, and the column names in 8-character fields.
+    :type header: List[str], optional
+    :param precision: The number of decimals, for all columns (int), for each column (list), or
+                      by column name (dict). Defaults to 3.
+    :type precision: int, list, or dict
+    :param jday_precision: The number of decimals of the Julian day. Defaults to 3.
+    :type jday_precision: int, optional
+    :param fill_value: The value written for missing values. Defaults to None, which rejects
+                       missing values.
+    :type fill_value: float, optional
+    :raises ValueError: If a value is missing and there is no fill value, or is infinite.
+    """
+
+    width = NPT_FIELD_WIDTH
+    jday, columns = _time_series_columns(df, year)
+    precisions = _column_precisions(df, precision)
+    formats = [f'%{width}.{decimals}f' for decimals in [jday_precision, *precisions]]
+
+    for column, values in zip(df.columns, columns):
+        missing = np.isnan(values)
+        if missing.any() and fill_value is None:
+            raise ValueError(f'Column {column} has {int(missing.sum())} missing values, which CE-QUAL-W2 '
+                             f'would read as zero; fill the gaps or specify a fill value for {outfile}')
+        if np.isinf(values).any():
+            raise ValueError(f'Column {column} has infinite values, which cannot be written to {outfile}')
+    if fill_value is not None:
+        columns = [np.where(np.isnan(values), fill_value, values) for values in columns]
+
+    if header is None:
+        names = ['JDAY', *[str(column) for column in df.columns]]
+        header = [f'$ {os.path.basename(outfile)}', '',
+                  ''.join(name[:width].rjust(width) for name in names)]
+
+    with open(outfile, 'w', encoding='utf-8', newline='\n') as f:
+        f.write('\n'.join(header) + '\n')
+        for start in range(0, len(jday), WRITE_BLOCK_ROWS):
+            stop = min(start + WRITE_BLOCK_ROWS, len(jday))
+            block = np.column_stack([jday[start:stop], *[values[start:stop] for values in columns]])
+            replacements = {}
+            for j, column_precision in enumerate([jday_precision, *precisions]):
+                rows = _npt_replacements(block[:, j], width, column_precision)
+                if len(rows):
+                    texts = _npt_fields(block[rows, j], width)
+                    replacements.update(zip((rows * block.shape[1] + j).tolist(), texts))
+            f.write(_format_block(block, formats, '', replacements))
+
+
+def write_w2_csv(df: pd.DataFrame, outfile: str, year: int = None, header: str = None, precision=3,
+                 jday_precision: int = 3):
+    """
+    Write a time series in the CSV format of CE-QUAL-W2 input files.
+
+    The file has two title lines, a header line with JDAY and the column names, and one line per
+    time with a fixed number of decimals in each column, formatted like `DataFrame.to_csv()` with
+    a '%.3f' float format (e.g., small negative values are written as -0.000). Missing values are
+    written as empty fields. The rows are written a block at a time. The DataFrame is not
+    modified.
+
+    :param df: The time series, with a date-time index or a Julian day index.
+    :type df: pd.DataFrame
+    :param outfile: The path to the output file.
+    :type outfile: str
+    :param year: The start year of the simulation. Required for a date-time index.
+    :type year: int, optional
+    :param header: The text before the column names, including line breaks. Defaults to '$\\n\\n'.
+    :type header: str, optional
+    :param precision: The number of decimals, for all columns (int), for each column (list), or
+                      by column name (dict). Defaults to 3.
+    :type precision: int, list, or dict
+    :param jday_precision: The number of decimals of the Julian day. Defaults to 3.
+    :type jday_precision: int, optional
+    """
+
+    jday, columns = _time_series_columns(df, year)
+    precisions = _column_precisions(df, precision)
+    formats = [f'%.{decimals}f' for decimals in [jday_precision, *precisions]]
+
+    if not header:
+        header = '$\n\n'
+    column_names = ','.join(['JDAY', *[str(column) for column in df.columns]])
+
+    with open(outfile, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(header + column_names + '\n')
+        for start in range(0, len(jday), WRITE_BLOCK_ROWS):
+            stop = min(start + WRITE_BLOCK_ROWS, len(jday))
+            block = np.column_stack([jday[start:stop], *[values[start:stop] for values in columns]])
+            replacements = dict.fromkeys(np.flatnonzero(np.isnan(block)).tolist(), '')
+            f.write(_format_block(block, formats, ',', replacements))
+
+
 def read_plot_control(yaml_infile: str, index_name: str = 'item') -> pd.DataFrame:
     """
     Read CE-QUAL-W2 plot control file in YAML format.
@@ -0,0 +1,456 @@
+import os
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from . import w2_io
+from . import w2_control
+
+CFS_TO_CMS = 0.0283168
+FT_TO_M = 0.3048
+
+# USGS parameter codes: the name used in the CE-QUAL-W2 input files and the factor that converts
+# the USGS units to the units of CE-QUAL-W2. Other parameters keep their code and units.
+USGS_PARAMETER_NAMES = {
+    '00060': 'Q',      # discharge (cfs)
+    '00061': 'Q',      # instantaneous discharge (cfs)
+    '00010': 'T',      # water temperature (C)
+    '00065': 'GH',     # gage height (ft)
+    '00062': 'ELWS',   # reservoir elevation above datum (ft)
+    '00095': 'COND',   # specific conductance (uS/cm)
+    '00300': 'DO',     # dissolved oxygen (mg/L)
+    '00400': 'PH',     # pH
+    '63680': 'TURB',   # turbidity (FNU)
+}
+USGS_UNIT_FACTORS = {
+    '00060': CFS_TO_CMS,
+    '00061': CFS_TO_CMS,
+    '00065': FT_TO_M,
+    '00062': FT_TO_M,
+}
+# Water levels are not carried by the flow, so they cannot be computed for a lateral inflow
+LEVEL_PARAMETERS = ['00062', '00065']
+FLOW_PARAMETER = '00060'
+
+GAUGE_PAIR_COLUMNS = ['Downstream', 'Upstream', 'Parameters']
+INPUT_FILE_FORMATS = ['npt', 'csv']
+INPUT_MANIFEST_COLUMNS = ['Name', 'Parameter', 'Filename', 'Mean', 'Min', 'Max', 'Missing']
+
+
+def read_gauge_pairs(yaml_infile: str) -> pd.DataFrame:
+    """
+    Read a gauge pair control file in YAML format.
+
+    Each item is one CE-QUAL-W2 input to compute from USGS gauges, for example:
+
+        -   Name: skagit_lateral
+            Downstream: '12194000'
+            Upstream: ['12193400']
+            Parameters: ['00060', '00010']
+        -   Name: baker_inflow
+            Downstream: '12193400'
+            Parameters: ['00060', '00010']
+
+    An item with upstream gauges is a lateral inflow: the flow is the flow at the downstream gauge
+    minus the flows at the upstream gauges, and the other parameters are computed from the mass
+    balance. An item without upstream gauges converts the records of the downstream gauge.
+    `Parameters` are USGS parameter codes and default to discharge (00060). Quote the site
+    numbers so that the leading zeros are kept.
+
+    :param yaml_infile: Path to the YAML file.
+    :type yaml_infile: str
+    :return: DataFrame with one row per input, indexed by name.
+    :rtype: pd.DataFrame
+    """
+
+    control_df = w2_io.read_plot_control(yaml_infile, index_name='Name')
+    return _normalize_gauge_pairs(control_df)
+
+
+def _as_list(value) -> list:
+    """Convert a value of a gauge pair table (None, a string, or a list) to a list of strings."""
+    if value is None or (np.isscalar(value) and pd.isna(value)):
+        return []
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [str(item) for item in value]
+    return [str(value)]
+
+
+def _normalize_gauge_pairs(pairs) -> pd.DataFrame:
+    """Convert gauge pairs to a DataFrame indexed by name, with lists of sites and parameters."""
+    if not isinstance(pairs, pd.DataFrame):
+        pairs = pd.DataFrame(list(pairs)).set_index('Name')
+    pairs = pairs.copy()
+    for column in GAUGE_PAIR_COLUMNS:
+        if column not in pairs.columns:
+            pairs[column] = None
+    if pairs['Downstream'].isna().any():
+        raise ValueError('Each gauge pair requires a downstream gauge.')
+    pairs['Downstream'] = pairs['Downstream'].astype(str)
+    pairs['Upstream'] = [_as_list(value) for value in pairs['Upstream']]
+    pairs['Parameters'] = [_as_list(value) or [FLOW_PARAMETER] for value in pairs['Parameters']]
+
+    duplicates = pairs.index[pairs.index.duplicated()].unique()
+    if len(duplicates) > 0:
+        raise ValueError(f'Gauge pair names must be unique: {", ".join(map(str, duplicates))}')
+    for name, row in pairs.iterrows():
+        levels = set(row['Parameters']) & set(LEVEL_PARAMETERS)
+        if row['Upstream'] and levels:
+            raise ValueError(f'Gauge pair {name}: water levels ({", ".join(sorted(levels))}) cannot be '
+                             f'computed for a lateral inflow.')
+        # Each parameter is written to the file of its W2 name, e.g. 00060 and 00061 both to Q
+        w2_names = {}
+        for parameter in row['Parameters']:
+            w2_name = USGS_PARAMETER_NAMES.get(parameter, parameter)
+            if w2_name in w2_names:
+                raise ValueError(f'Gauge pair {name}: parameters {w2_names[w2_name]} and {parameter} would '
+                                 f'both be written to {name}_{w2_name}; request only one of them.')
+            w2_names[w2_name] = parameter
+    pairs.index.name = 'Name'
+    return pairs[GAUGE_PAIR_COLUMNS]
+
+
+def model_time_base(model_path: str = None, year: int = None, start: float = None, end: float = None,
+                    interval: float = 1.0 / 24) -> pd.DatetimeIndex:
+    """
+    Get the times at which the inputs of a model are written.
+
+    :param model_path: The model directory. The year, start, and end default to YEAR, TMSTRT, and
+                       TMEND of its control file.
+    :type model_path: str, optional
+    :param year: The start year of the simulation.
+    :type year: int, optional
+    :param start: The first Julian day.
+    :type start: float, optional
+    :param end: The last Julian day.
+    :type end: float, optional
+    :param interval: The time step, in days. Defaults to one hour.
+    :type interval: float, optional
+    :raises ValueError: If the year, start, or end are neither given nor in the control file.
+    :return: The times, in the time zone of the model.
+    :rtype: pd.DatetimeIndex
+    """
+
+    if model_path is not None and None in (year, start, end):
+        control_path = w2_control.find_w2_control(model_path)
+        if control_path is None:
+            raise ValueError(f'No control file found in {model_path}')
+        control = w2_control.read_w2_control(control_path)
+        year = control.year if year is None else year
+        start = control.tmstrt if start is None else start
+        end = control.tmend if end is None else end
+    if None in (year, start, end):
+        raise ValueError('The year, start, and end of the time base are required without a model directory.')
+
+    jday = np.arange(start, end + interval / 2, interval)
+    times = pd.Timestamp(year, 1, 1) + pd.to_timedelta(jday - 1.0, unit='D')
+    return pd.DatetimeIndex(times).round('s')
+
+
+def _parameter_column(df: pd.DataFrame, parameter: str):
+    """Find the column of a parameter, e.g. '00060' or '00060_Mean', in a USGS record."""
+    if parameter in df.columns:
+        return parameter
+    for column in df.columns:
+        if str(column).startswith(f'{parameter}_') and not str(column).endswith('_cd'):
+            return column
+    return None
+
+
+def _local_seconds(index: pd.DatetimeIndex, utc_offset: float) -> np.ndarray:
+    """Convert date-times to seconds, in the time zone of the model for time zone aware date-times."""
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None) + pd.Timedelta(hours=utc_offset)
+    return ((index - pd.Timestamp(1970, 1, 1)) / pd.Timedelta(seconds=1)).to_numpy(dtype=np.float64)
+
+
+def _interpolate(times: np.ndarray, values: np.ndarray, target: np.ndarray, max_gap: float) -> np.ndarray:
+    """Interpolate linearly in time, leaving NaN in gaps longer than max_gap (seconds)."""
+    valid = np.isfinite(values)
+    times, values = times[valid], values[valid]
+    if len(times) == 0:
+        return np.full(len(target), np.nan)
+    result = np.interp(target, times, values)
+    if max_gap is not None:
+        right = np.searchsorted(times, target, side='left')
+        after = times[np.minimum(right, len(times) - 1)]
+        before = times[np.maximum(right - 1, 0)]
+        # the gap around each target time; outside the record, the distance to the record
+        gap = np.where(right == 0, after - target,
+                       np.where(right == len(times), target - before, after - before))
+        exact = (right < len(times)) & (after == target)
+        result[~exact & (gap > max_gap)] = np.nan
+    return result
+
+
+def interpolate_records(records: dict, time_base: pd.DatetimeIndex, parameters, utc_offset: float = 0.0,
+                        max_gap: float = None) -> pd.DataFrame:
+    """
+    Interpolate the USGS records of many gauges onto the time base of a model.
+
+    The values are interpolated linearly in time, like `interpolate(method='time')`, for all the
+    gauges and parameters into one (time x gauge and parameter) array. Before the first and after
+    the last value of a record, the first and last values are held. USGS missing value sentinels
+    (-999999) are ignored.
+
+    :param records: The records, as {site: DataFrame}, such as those returned by dataretrieval or
+                    `usgs_retrieval.get_records()`, with a date-time index and columns named
+                    after the parameter codes, e.g. '00060' or '00060_Mean'.
+    :type records: dict
+    :param time_base: The model times, as returned by `model_time_base()`.
+    :type time_base: pd.DatetimeIndex
+    :param parameters: The USGS parameter codes, e.g. ['00060', '00010'].
+    :type parameters: list
+    :param utc_offset: The offset of the model time zone from UTC, in hours, e.g. -8 for Pacific
+                       Standard Time. It applies to time zone aware records; other records are
+                       assumed to be in the time zone of the model. Defaults to 0.
+    :type utc_offset: float, optional
+    :param max_gap: The longest gap to interpolate over, in days. Model times in longer gaps, or
+                    farther than this before or after the record, are NaN. Defaults to no limit.
+    :type max_gap: float, optional
+    :return: DataFrame indexed by the model times, with (site, parameter) columns, in USGS units.
+    :rtype: pd.DataFrame
+    """
+
+    target = _local_seconds(time_base, 0.0)
+    max_gap_seconds = None if max_gap is None else max_gap * 86400.0
+    columns, arrays = [], []
+    for site, df in records.items():
+        df = df[~df.index.duplicated(keep='last')].sort_index()
+        times = _local_seconds(df.index, utc_offset)
+        for parameter in parameters:
+            column = _parameter_column(df, parameter)
+            if column is None:
+                continue
+            values = df[column].to_numpy(dtype=np.float64, na_value=np.nan)
+            values = np.where(values == w2_io.USGS_SENTINEL, np.nan, values)
+            columns.append((str(site), parameter))
+            arrays.append(_interpolate(times, values, target, max_gap_seconds))
+
+    values = np.column_stack(arrays) if arrays else np.empty((len(time_base), 0))
+    index = pd.MultiIndex.from_tuples(columns, names=['Site', 'Parameter'])
+    return pd.DataFrame(values, index=time_base, columns=index, copy=False)
+
+
+def convert_units(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert USGS records from US customary units to the units of CE-QUAL-W2.
+
+    Discharge is converted from cfs to m^3/s, and gage height and elevation from ft to m (see
+    `USGS_UNIT_FACTORS`). The other parameters are not changed.
+
+    :param data: The records, with (site, parameter) columns, as returned by `interpolate_records()`.
+    :type data: pd.DataFrame
+    :return: The converted records.
+    :rtype: pd.DataFrame
+    """
+
+    parameters = data.columns.get_level_values('Parameter')
+    factors = np.array([USGS_UNIT_FACTORS.get(parameter, 1.0) for parameter in parameters])
+    return pd.DataFrame(data.to_numpy() * factors, index=data.index, columns=data.columns, copy=False)
+
+
+def _column_matrix(data: pd.DataFrame, sites, parameter: str) -> np.ndarray:
+    """Get the (time x site) values of one parameter, with NaN for missing gauges."""
+    positions = data.columns.get_indexer(pd.MultiIndex.from_product([sites, [parameter]]))
+    values = data.to_numpy()[:, np.maximum(positions, 0)]
+    return np.where(positions < 0, np.nan, values)
+
+
+def _weighted_sums(weights: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Multiply (time x site) values by (pair x site) weights, with NaN where a used value is missing."""
+    missing = np.isnan(values)
+    sums = np.where(missing, 0.0, values) @ weights.T
+    sums[(missing.astype(np.float64) @ np.abs(weights).T) > 0] = np.nan
+    return sums
+
+
+def gauge_pair_series(data: pd.DataFrame, pairs, flow_parameter: str = FLOW_PARAMETER) -> pd.DataFrame:
+    """
+    Compute the CE-QUAL-W2 input series of many gauge pairs.
+
+    For a pair with upstream gauges, the lateral flow is the downstream flow minus the sum of the
+    upstream flows, and each other parameter C is computed from the mass balance,
+    (Qd * Cd - sum(Qu * Cu)) / (Qd - sum(Qu)); where the lateral flow is not positive, the
+    downstream value is used. All the pairs are computed together with one matrix product per
+    parameter. For a pair without upstream gauges, the downstream series are used.
+
+    :param data: The interpolated records, with (site, parameter) columns, as returned by
+                 `interpolate_records()` and `convert_units()`.
+    :type data: pd.DataFrame
+    :param pairs: The gauge pairs, as returned by `read_gauge_pairs()` or as a list of
+                  dictionaries with the keys Name, Downstream, Upstream, and Parameters.
+    :type pairs: pd.DataFrame or list
+    :param flow_parameter: The parameter code of the flow. Defaults to 00060.
+    :type flow_parameter: str, optional
+    :return: DataFrame with (name, parameter) columns, in the order of the pairs.
+    :rtype: pd.DataFrame
+    """
+
+    pairs = _normalize_gauge_pairs(pairs)
+    series = {}
+
+    direct = pairs[pairs['Upstream'].str.len() == 0]
+    for name, row in direct.iterrows():
+        for parameter in row['Parameters']:
+            series[(name, parameter)] = _column_matrix(data, [row['Downstream']], parameter)[:, 0]
+
+    lateral = pairs[pairs['Upstream'].str.len() > 0]
+    if len(lateral) > 0:
+        sites = list(dict.fromkeys([*lateral['Downstream'], *[site for upstream in lateral['Upstream']
+                                                               for site in upstream]]))
+        position = {site: j for j, site in enumerate(sites)}
+        # +1 for the downstream gauge and -1 for the upstream gauges of each pair
+        weights = np.zeros((len(lateral), len(sites)))
+        for i, (downstream, upstream) in enumerate(zip(lateral['Downstream'], lateral['Upstream'])):
+            weights[i, [position[site] for site in upstream]] = -1.0
+            weights[i, position[downstream]] = 1.0
+
+        flows = _column_matrix(data, sites, flow_parameter)
+        lateral_flows = _weighted_sums(weights, flows)
+        downstream = [position[site] for site in lateral['Downstream']]
+        parameters = list(dict.fromkeys(p for ps in lateral['Parameters'] for p in ps if p != flow_parameter))
+        concentrations = {}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for parameter in parameters:
+                values = _column_matrix(data, sites, parameter)
+                mass = _weighted_sums(weights, flows * values)
+                concentrations[parameter] = np.where(lateral_flows > 0, mass / lateral_flows,
+                                                     values[:, downstream])
+
+        for i, (name, row) in enumerate(lateral.iterrows()):
+            for parameter in row['Parameters']:
+                if parameter == flow_parameter:
+                    series[(name, parameter)] = lateral_flows[:, i]
+                else:
+                    series[(name, parameter)] = concentrations[parameter][:, i]
+
+    order = [(name, parameter) for name, row in pairs.iterrows() for parameter in row['Parameters']]
+    columns = pd.MultiIndex.from_tuples(order, names=['Name', 'Parameter'])
+    values = np.column_stack([series[key] for key in order]) if order else np.empty((len(data), 0))
+    return pd.DataFrame(values, index=data.index, columns=columns, copy=False)
+
+
+def _input_filename(name: str, parameter: str, file_format: str) -> str:
+    """Get the file name of an input, e.g. skagit_lateral_Q.npt."""
+    return f'{name}_{USGS_PARAMETER_NAMES.get(parameter, parameter)}.{file_format}'
+
+
+def usgs_to_w2(records: dict, pairs, outdir: str, model_path: str = None, time_base: pd.DatetimeIndex = None,
+               year: int = None, interval: float = 1.0 / 24, utc_offset: float = 0.0, max_gap: float = None,
+               file_format: str = 'npt', precision=3, fill_value: float = None,
+               max_workers: int = None) -> pd.DataFrame:
+    """
+    Convert the USGS records of many gauge pairs to CE-QUAL-W2 input files.
+
+    The records are interpolated onto the model time base with `interpolate_records()`,
+    converted to the units of CE-QUAL-W2 with `convert_units()`, and combined into lateral
+    inflows with `gauge_pair_series()`. Each pair and parameter is written to its own input
+    file, named after the pair and the W2 name of the parameter, e.g. skagit_lateral_Q.npt and
+    skagit_lateral_T.npt, with `w2_io.write_npt()` or `w2_io.write_w2_csv()`.
+
+    :param records: The USGS records, as {site: DataFrame}.
+    :type records: dict
+    :param pairs: The gauge pairs, as returned by `read_gauge_pairs()`, or the path to a gauge
+                  pair control file.
+    :type pairs: pd.DataFrame, list, or str
+    :param outdir: The output directory.
+    :type outdir: str
+    :param model_path: The model directory, used for the default year and time base.
+    :type model_path: str, optional
+    :param time_base: The model times. Defaults to `model_time_base()` of the model directory.
+    :type time_base: pd.DatetimeIndex, optional
+    :param year: The start year of the simulation. Defaults to the year of the model or of the
+                 first time.
+    :type year: int, optional
+    :param interval: The time step of the default time base, in days. Defaults to one hour.
+    :type interval: float, optional
+    :param utc_offset: The offset of the model time zone from UTC, in hours.
+    :type utc_offset: float, optional
+    :param max_gap: The longest gap to interpolate over, in days. Defaults to no limit.
+    :type max_gap: float, optional
+    :param file_format: 'npt' for fixed-width files or 'csv'. Defaults to 'npt'.
+    :type file_format: str, optional
+    :param precision: The number of decimals, for all files (int) or by parameter code (dict).
+                      Defaults to 3.
+    :type precision: int or dict, optional
+    :param fill_value: The value written to npt files for model times without data, e.g. in gaps
+                       longer than `max_gap`. Defaults to None, which rejects missing values,
+                       because CE-QUAL-W2 reads blank fields as zero.
+    :type fill_value: float, optional
+    :param max_workers: The number of threads used to write the files.
+    :type max_workers: int, optional
+    :raises ValueError: If the file format is unknown, a gauge has no records or no records of a
+                        requested parameter, or an npt input has missing values and there is no
+                        fill value.
+    :return: The manifest, with the name, parameter, file name, mean, minimum, maximum, and number
+             of missing values of each input.
+    :rtype: pd.DataFrame
+    """
+
+    if file_format not in INPUT_FILE_FORMATS:
+        raise ValueError(f'Unknown file format {file_format}. Valid formats are {", ".join(INPUT_FILE_FORMATS)}.')
+    if isinstance(pairs, str):
+        pairs = read_gauge_pairs(pairs)
+    pairs = _normalize_gauge_pairs(pairs)
+    records = {str(site): df for site, df in records.items()}
+
+    sites = set(pairs['Downstream']).union(*pairs['Upstream'])
+    missing_sites = sorted(sites - set(records))
+    if missing_sites:
+        raise ValueError(f'No records for gauge(s) {", ".join(missing_sites)}')
+
+    if time_base is None:
+        time_base = model_time_base(model_path, year=year, interval=interval)
+    if year is None:
+        year = w2_control.get_model_year(model_path) if model_path is not None else None
+        year = time_base[0].year if year is None else year
+
+    parameters = list(dict.fromkeys(p for ps in pairs['Parameters'] for p in ps))
+    if FLOW_PARAMETER not in parameters and (pairs['Upstream'].str.len() > 0).any():
+        parameters.append(FLOW_PARAMETER)
+    data = interpolate_records({site: records[site] for site in sites}, time_base, parameters,
+                               utc_offset=utc_offset, max_gap=max_gap)
+
+    # A lateral inflow needs the flow and the parameter at all of its gauges
+    required = []
+    for _, row in pairs.iterrows():
+        if row['Upstream']:
+            required += [(site, parameter) for site in [row['Downstream'], *row['Upstream']]
+                         for parameter in [FLOW_PARAMETER, *row['Parameters']]]
+        else:
+            required += [(row['Downstream'], parameter) for parameter in row['Parameters']]
+    missing = [column for column in dict.fromkeys(required) if column not in data.columns]
+    if missing:
+        raise ValueError('No records of parameter(s) at gauge(s): '
+                         + ', '.join(f'{parameter} at {site}' for site, parameter in missing))
+    series = gauge_pair_series(convert_units(data), pairs)
+
+    os.makedirs(outdir, exist_ok=True)
+    if file_format == 'npt':
+        writer = functools.partial(w2_io.write_npt, fill_value=fill_value)
+    else:
+        writer = w2_io.write_w2_csv
+
+    def write(column):
+        name, parameter = column
+        outfile = os.path.join(outdir, _input_filename(name, parameter, file_format))
+        df = series[[column]]
+        df.columns = [USGS_PARAMETER_NAMES.get(parameter, parameter)]
+        decimals = precision.get(parameter, 3) if isinstance(precision, dict) else precision
+        writer(df, outfile, year=year, precision=decimals)
+        values = df.iloc[:, 0]
+        return [name, parameter, os.path.basename(outfile), values.mean(), values.min(), values.max(),
+                int(values.isna().sum())]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        manifest = list(executor.map(write, series.columns))
+    manifest = pd.DataFrame(manifest, columns=INPUT_MANIFEST_COLUMNS)
+
+    for _, row in manifest[manifest['Missing'] > 0].iterrows():
+        if file_format == 'npt':
+            print(f'Warning: {row["Filename"]} has {row["Missing"]} missing values, written as {fill_value}')
+        else:
+            print(f'Warning: {row["Filename"]} has {row["Missing"]} missing values, which CE-QUAL-W2 reads as zero')
+    return manifest
@@ -1,7 +1,11 @@
 import os
+import re
+from typing import List
 import pandas as pd
-import datetime
 import sqlite3
+from . import w2_io
+from . import w2_datetime
+from . import w2_statistics
 
 
 def generate_plots_report(*args, **kwargs) -> None:
@@ -135,6 +139,10 @@ def write_csv(df: pd.DataFrame, outfile: str, year: int, header: str = None, flo
     """
     Write a Pandas DataFrame to a CSV file with additional formatting options.
 
+    The date-time index is written as Julian days in the first column (JDAY). The DataFrame is
+    not modified. Fixed-point formats such as '%.3f' are written with `w2_io.write_w2_csv()` when
+    all the columns are floating point; other columns are written as pandas formats them.
+
     :param df: The DataFrame to be written to the CSV file.
     :type df: pandas.DataFrame
     :param outfile: The path to the output CSV file.
@@ -149,15 +157,50 @@ def write_csv(df: pd.DataFrame, outfile: str, year: int, header: str = None, flo
     :type float_format: str
     """
 
+    fixed_point = re.fullmatch(r'%\.(\d+)f', float_format or '')
+    all_float = all(pd.api.types.is_float_dtype(dtype) for dtype in df.dtypes)
+    if fixed_point and all_float:
+        precision = int(fixed_point.group(1))
+        w2_io.write_w2_csv(df, outfile, year=year, header=header, precision=precision,
+                           jday_precision=precision)
+        return
+
     # Convert date to Julian days (day of year)
-    diff = df.index - datetime.datetime(year, 1, 1) + datetime.timedelta(days=1)
-    jday = diff.days + diff.seconds / 3600.0 / 24.0
-    columns = ['JDAY'] + df.columns.to_list()  # This needs to be done before assigning jday
-    df['JDAY'] = jday
-    df = df[columns]
+    jday = w2_datetime.datetime_to_day_of_year(year, df.index)
+    df = df.reset_index(drop=True)
+    df.insert(0, 'JDAY', jday)
 
     if not header:
         header = '$\n\n'
     with open(outfile, 'w', encoding="utf-8") as f:
         f.write(header)
-        df.to_csv(f, header=True, index=False, float_format=float_format)
\ No newline at end of file
+        df.to_csv(f, header=True, index=False, float_format=float_format)
+
+
+def generate_statistics_report(data_frames: List[pd.DataFrame], outfile: str, title: str = None,
+                               precision: int = 2) -> None:
+    """
+    Write a Markdown report of the summary statistics of each data frame.
+
+    The statistics of all data frames are computed together with
+    `w2_statistics.summary_statistics()`, and one table is written per data frame, under a heading
+    with the data file name.
+
+    :param data_frames: The data frames to summarize.
+    :type data_frames: List[pd.DataFrame]
+    :param outfile: The path to the output Markdown file.
+    :type outfile: str
+    :param title: The title for the report. Defaults to 'Summary Statistics'.
+    :type title: str, optional
+    :param precision: The number of decimal places. Defaults to 2.
+    :type precision: int
+    """
+
+    summary = w2_statistics.summary_statistics(data_frames)
+
+    with open(outfile, 'w', encoding='utf-8') as f:
+        f.write(f'# {title or "Summary Statistics"}\n\n')
+        for i, df in enumerate(data_frames):
+            f.write(f'## {w2_statistics._source_name(df, i)}\n\n')
+            f.write(summary.to_markdown(source=i, precision=precision))
+            f.write('\n')
@@ -0,0 +1,432 @@
+import os
+import shutil
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from . import w2_io
+from . import w2_control
+
+SCENARIO_OPERATIONS = ['scale', 'offset', 'shift', 'replace']
+SCENARIO_COLUMNS = ['Filename', 'Operation', 'Value', 'Columns', 'Start', 'End']
+MANIFEST_FILE = 'scenario_manifest.csv'
+MANIFEST_COLUMNS = ['Scenario', 'Filename', 'Column', 'Changes', 'BaseMean', 'ScenarioMean',
+                    'MaxAbsChange', 'ChangedValues']
+
+# Number of data lines used to find the number of decimals of each column of a base file
+DECIMAL_SAMPLE_LINES = 100
+# Largest number of decimals kept for values with more decimals than the sample lines
+MAX_DECIMALS = 6
+
+
+def read_scenario_control(yaml_infile: str) -> pd.DataFrame:
+    """
+    Read a scenario control file in YAML format.
+
+    The scenario control file uses the same layout as the plot and scoring control files. Each
+    item is one change to one input file, and a scenario is the list of items with its name, for
+    example:
+
+        -   Scenario: flow_plus10
+            Filename: 2006_MahoningR_Qtr.npt
+            Operation: scale
+            Value: 1.1
+        -   Scenario: warm_2C
+            Filename: 2006_Met.npt
+            Operation: offset
+            Value: 2.0
+            Columns: [0, 1]
+            Start: 152
+            End: 244
+
+    The operations are:
+        - scale: multiply the values by Value
+        - offset: add Value to the values
+        - shift: delay the series by Value days (negative values advance it)
+        - replace: set the values to Value
+
+    `Columns` are column names or positions (0 for the first data column) and default to all the
+    data columns. `Start` and `End` limit the change to a window of Julian days; they do not
+    apply to shifts.
+
+    :param yaml_infile: Path to the YAML file.
+    :type yaml_infile: str
+    :return: DataFrame with one row per change, indexed by scenario name.
+    :rtype: pd.DataFrame
+    """
+
+    control_df = w2_io.read_plot_control(yaml_infile, index_name='Scenario')
+    return _normalize_scenarios(control_df)
+
+
+def _normalize_scenarios(scenarios: pd.DataFrame) -> pd.DataFrame:
+    """Add the optional columns of a scenario table and check the operations."""
+    scenarios = scenarios.copy()
+    for column in SCENARIO_COLUMNS:
+        if column not in scenarios.columns:
+            scenarios[column] = None
+    scenarios['Operation'] = scenarios['Operation'].str.lower()
+    unknown = set(scenarios['Operation']) - set(SCENARIO_OPERATIONS)
+    if unknown:
+        raise ValueError(f'Unknown scenario operation(s): {", ".join(sorted(map(str, unknown)))}. '
+                         f'Valid operations are {", ".join(SCENARIO_OPERATIONS)}.')
+    shifts = scenarios['Operation'] == 'shift'
+    if (shifts & (scenarios['Start'].notna() | scenarios['End'].notna())).any():
+        raise ValueError('Shifts apply to the whole series; remove Start and End from the shift items.')
+    scenarios.index.name = 'Scenario'
+    return scenarios[SCENARIO_COLUMNS]
+
+
+def scenario_grid(filename: str, operation: str, values, columns=None, start: float = None,
+                  end: float = None, prefix: str = None) -> pd.DataFrame:
+    """
+    Build a sweep of scenarios that apply one operation to one file with different values.
+
+    For example, `scenario_grid('2006_MahoningR_Qtr.npt', 'scale', [0.8, 0.9, 1.1, 1.2])` builds
+    four scenarios named 2006_MahoningR_Qtr_scale_0.8, etc. Sweeps can be combined with
+    `pd.concat()`.
+
+    :param filename: The input file, relative to the model directory.
+    :type filename: str
+    :param operation: The operation (scale, offset, shift, or replace).
+    :type operation: str
+    :param values: The value of each scenario.
+    :type values: array-like
+    :param columns: Column names or positions. Defaults to all the data columns.
+    :type columns: list, optional
+    :param start: First Julian day of the window. Defaults to the start of the series.
+    :type start: float, optional
+    :param end: Last Julian day of the window. Defaults to the end of the series.
+    :type end: float, optional
+    :param prefix: The start of the scenario names. Defaults to the file name and the operation.
+    :type prefix: str, optional
+    :return: Scenario table, as returned by `read_scenario_control()`.
+    :rtype: pd.DataFrame
+    """
+
+    if prefix is None:
+        prefix = f'{os.path.splitext(os.path.basename(filename))[0]}_{operation}'
+    values = list(values)
+    scenarios = pd.DataFrame({
+        'Filename': filename,
+        'Operation': operation,
+        'Value': values,
+        'Columns': [columns] * len(values),
+        'Start': start,
+        'End': end,
+    }, index=pd.Index([f'{prefix}_{value:g}' for value in values], name='Scenario'))
+    return _normalize_scenarios(scenarios)
+
+
+class BaseFile:
+    """
+    A time series input file that is the base of scenario variants
+
+    The file is read once. The header lines and the number of decimals of each column are kept,
+    so that the variants are written in the same format as the base file.
+    """
+
+    def __init__(self, infile: str):
+        self.infile = infile
+        self.is_csv = infile.lower().endswith('.csv')
+        skiprows = w2_io.get_header_row_number(infile) + 1
+        with open(infile, 'r', encoding='latin-1') as f:
+            self.header = [f.readline().rstrip('\r\n') for _ in range(skiprows)]
+            sample = [f.readline().rstrip('\r\n') for _ in range(DECIMAL_SAMPLE_LINES)]
+        sample = [line for line in sample if line.strip()]
+        if sample and ',' in sample[0]:
+            self.is_csv = True
+
+        num_columns = w2_control._count_data_columns(infile)
+        header_columns = w2_io.get_data_columns(infile)
+        if len(header_columns) == num_columns and all(header_columns):
+            self.columns = header_columns
+        else:
+            self.columns = [f'C{j + 1}' for j in range(num_columns)]
+
+        df = w2_io.read_npt_opt(infile, self.columns, skiprows=skiprows)
+        self.jday = df.index.to_numpy(dtype=np.float64)
+        self.values = df.to_numpy(dtype=np.float64)
+        self.decimals = self._sample_decimals(sample, num_columns + 1)
+        self.decimals[0] = self._value_decimals(self.jday, self.decimals[0])
+        for j in range(num_columns):
+            self.decimals[j + 1] = self._value_decimals(self.values[:, j], self.decimals[j + 1])
+
+    def __repr__(self):
+        return f'BaseFile({os.path.basename(self.infile)}, {len(self.jday)} rows, {len(self.columns)} columns)'
+
+    def _sample_decimals(self, lines, num_fields: int):
+        """Find the largest number of decimals of each field (day and data columns) in sample lines."""
+        decimals = np.zeros(num_fields, dtype=int)
+        for line in lines:
+            if self.is_csv:
+                fields = line.strip().strip(',').split(',')
+            else:
+                fields = w2_io.split_fixed_width_line(line, w2_io.NPT_FIELD_WIDTH)
+            for j, field in enumerate(fields[:num_fields]):
+                field = field.strip()
+                if '.' in field and 'e' not in field.lower():
+                    decimals[j] = max(decimals[j], len(field) - field.index('.') - 1)
+        return decimals
+
+    @staticmethod
+    def _value_decimals(values: np.ndarray, decimals: int) -> int:
+        """
+        Increase the sampled number of decimals of a column until it represents all of its values,
+        so that values further down the file (e.g., days written as 92.0833) are not rounded.
+        """
+        values = values[np.isfinite(values)]
+        tolerance = 1e-9 * np.maximum(np.abs(values), 1.0)
+        while decimals < MAX_DECIMALS and (np.abs(np.round(values, decimals) - values) > tolerance).any():
+            decimals += 1
+        return decimals
+
+    def column_positions(self, columns) -> np.ndarray:
+        """
+        Get the positions of columns given by name or position.
+
+        :param columns: Column names or positions (0 for the first data column). None selects
+                        all the data columns.
+        :raises ValueError: If a column is not in the file.
+        :return: The column positions.
+        :rtype: np.ndarray
+        """
+
+        if columns is None or (np.isscalar(columns) and pd.isna(columns)):
+            return np.arange(len(self.columns))
+        if np.isscalar(columns):
+            columns = [columns]
+        positions = []
+        for column in columns:
+            if isinstance(column, (int, np.integer)):
+                if not 0 <= column < len(self.columns):
+                    raise ValueError(f'Column {column} is out of range for {self.infile}, '
+                                     f'which has {len(self.columns)} data columns')
+                positions.append(int(column))
+            elif column in self.columns:
+                positions.append(self.columns.index(column))
+            else:
+                raise ValueError(f'Column {column} not found in {self.infile}. '
+                                 f'The columns are {", ".join(self.columns)}.')
+        return np.array(positions, dtype=int)
+
+    def window(self, start, end) -> np.ndarray:
+        """Get the row positions in a window of Julian days (inclusive); None means no limit."""
+        selected = np.ones(len(self.jday), dtype=bool)
+        if start is not None and not pd.isna(start):
+            selected &= self.jday >= start
+        if end is not None and not pd.isna(end):
+            selected &= self.jday <= end
+        return np.flatnonzero(selected)
+
+    def write(self, values: np.ndarray, outfile: str, precision=None):
+        """
+        Write a variant of the file with the header and format of the base file.
+
+        :param values: The data values (rows x columns).
+        :type values: np.ndarray
+        :param outfile: The path to the output file.
+        :type outfile: str
+        :param precision: The number of decimals of the data columns. Defaults to the decimals of
+                          each column in the base file.
+        :type precision: int, list, or dict, optional
+        """
+
+        if precision is None:
+            precision = [int(d) for d in self.decimals[1:]]
+        df = pd.DataFrame(values, index=pd.Index(self.jday, name='JDAY'), columns=self.columns, copy=False)
+        jday_precision = int(self.decimals[0])
+        if self.is_csv:
+            header = '\n'.join(self.header[:-1]) + '\n'
+            w2_io.write_w2_csv(df, outfile, header=header, precision=precision, jday_precision=jday_precision)
+        else:
+            w2_io.write_npt(df, outfile, header=self.header, precision=precision, jday_precision=jday_precision)
+
+
+def _shift_series(jday: np.ndarray, values: np.ndarray, lags: np.ndarray) -> np.ndarray:
+    """
+    Delay each column of a time series by a number of days, with linear interpolation.
+
+    :param jday: The Julian days (T).
+    :param values: The base values (T x C).
+    :param lags: The delay of each variant and column, in days (N x C).
+    :return: The shifted values of all the variants (N x T x C). Values before the start of the
+             series are held at the first value, and values after the end at the last value.
+    """
+    if len(jday) < 2:
+        return np.broadcast_to(values, (len(lags), *values.shape)).copy()
+    positions = jday[np.newaxis, :, np.newaxis] - lags[:, np.newaxis, :]
+    lower = np.clip(np.searchsorted(jday, positions, side='right') - 1, 0, len(jday) - 2)
+    upper = lower + 1
+    weight = np.clip((positions - jday[lower]) / (jday[upper] - jday[lower]), 0.0, 1.0)
+    columns = np.arange(values.shape[1])[np.newaxis, np.newaxis, :]
+    return values[lower, columns] * (1.0 - weight) + values[upper, columns] * weight
+
+
+def apply_scenarios(base: BaseFile, changes: pd.DataFrame) -> tuple:
+    """
+    Compute the variants of a base file for several scenarios at once.
+
+    The changes of each scenario are applied in order, except that shifts are applied first.
+    Changes with the same step number, operation, columns, and window in different scenarios
+    are applied to all those variants in one array operation, so a sweep of N values costs about
+    as much as one change to an array N times larger.
+
+    :param base: The base file.
+    :type base: BaseFile
+    :param changes: The changes to this file, indexed by scenario name, as returned by
+                    `read_scenario_control()`.
+    :type changes: pd.DataFrame
+    :return: The scenario names (N) and the values of the variants (N x rows x columns).
+    :rtype: tuple
+    """
+
+    names = list(dict.fromkeys(changes.index))
+    variant = {name: i for i, name in enumerate(names)}
+
+    lags = np.zeros((len(names), len(base.columns)))
+    for name, change in changes[changes['Operation'] == 'shift'].iterrows():
+        lags[variant[name], base.column_positions(change['Columns'])] += float(change['Value'])
+    if lags.any():
+        values = _shift_series(base.jday, base.values, lags)
+    else:
+        values = np.broadcast_to(base.values, (len(names), *base.values.shape)).copy()
+
+    # Group the changes by their step within each scenario and by what they change
+    steps = changes[changes['Operation'] != 'shift'].copy()
+    steps['Step'] = steps.groupby(level=0, sort=False).cumcount()
+    steps['Variant'] = [variant[name] for name in steps.index]
+    steps['Key'] = [str(key) for key in zip(steps['Operation'], steps['Columns'].map(str),
+                                            steps['Start'], steps['End'])]
+    for (_, _), group in steps.groupby(['Step', 'Key'], sort=True):
+        first = group.iloc[0]
+        rows = base.window(first['Start'], first['End'])
+        columns = base.column_positions(first['Columns'])
+        selection = np.ix_(group['Variant'].to_numpy(), rows, columns)
+        amounts = group['Value'].to_numpy(dtype=np.float64)[:, np.newaxis, np.newaxis]
+        if first['Operation'] == 'scale':
+            values[selection] *= amounts
+        elif first['Operation'] == 'offset':
+            values[selection] += amounts
+        elif first['Operation'] == 'replace':
+            values[selection] = np.broadcast_to(amounts, (len(group), len(rows), len(columns)))
+
+    return names, values
+
+
+def _describe_changes(changes: pd.DataFrame, base: BaseFile, position: int) -> str:
+    """Describe the changes of one scenario to one column, e.g. 'scale 1.1; offset 2 [152-244]'."""
+    descriptions = []
+    for _, change in changes.iterrows():
+        if position not in base.column_positions(change['Columns']):
+            continue
+        text = f'{change["Operation"]} {change["Value"]:g}'
+        if pd.notna(change['Start']) or pd.notna(change['End']):
+            start = '' if pd.isna(change['Start']) else f'{change["Start"]:g}'
+            end = '' if pd.isna(change['End']) else f'{change["End"]:g}'
+            text += f' [{start}-{end}]'
+        descriptions.append(text)
+    return '; '.join(descriptions)
+
+
+def _summarize_variants(filename: str, base: BaseFile, names, values: np.ndarray,
+                        changes: pd.DataFrame) -> pd.DataFrame:
+    """Summarize the changes of each variant and column of a file for the manifest."""
+    changed = ~np.isclose(values, base.values[np.newaxis], equal_nan=True)
+    with warnings.catch_warnings():
+        # Columns without finite values have no mean
+        warnings.simplefilter('ignore', RuntimeWarning)
+        base_mean = np.nanmean(base.values, axis=0)
+        scenario_mean = np.nanmean(values, axis=1)
+        max_change = np.nanmax(np.abs(values - base.values[np.newaxis]), axis=1)
+
+    records = []
+    for i, name in enumerate(names):
+        scenario_changes = changes.loc[[name]]
+        for position, column in enumerate(base.columns):
+            description = _describe_changes(scenario_changes, base, position)
+            if not description:
+                continue
+            records.append([name, filename, column, description, base_mean[position],
+                            scenario_mean[i, position], max_change[i, position],
+                            int(changed[i, :, position].sum())])
+    return pd.DataFrame(records, columns=MANIFEST_COLUMNS)
+
+
+def generate_scenarios(model_path: str, scenarios, outdir: str, precision=None, copy_model: bool = True,
+                       max_workers: int = None) -> pd.DataFrame:
+    """
+    Write a model directory for each scenario, with perturbed boundary condition files.
+
+    Each input file that is changed by any scenario is read once. The variants of the file for
+    all the scenarios are computed together with `apply_scenarios()`, and the scenario
+    directories are written in parallel threads. The other files in the top level of the model
+    directory are copied to each scenario directory, unless `copy_model` is False.
+
+    A manifest of what changed (scenario_manifest.csv) is written to the output directory, with
+    one row per scenario, file, and changed column: the changes, the mean of the base and
+    scenario values, the largest absolute change, and the number of values that changed.
+
+    :param model_path: Path to the base model directory.
+    :type model_path: str
+    :param scenarios: The scenario table, as returned by `read_scenario_control()` or
+                      `scenario_grid()`, or the path to a scenario control file.
+    :type scenarios: pd.DataFrame or str
+    :param outdir: The output directory. Each scenario is written to a subdirectory named after
+                   the scenario.
+    :type outdir: str
+    :param precision: The number of decimals of the data columns. Defaults to the decimals of
+                      each column in the base file.
+    :type precision: int, list, or dict, optional
+    :param copy_model: Copy the unchanged files of the model directory. Defaults to True.
+    :type copy_model: bool, optional
+    :param max_workers: The number of threads. Defaults to the ThreadPoolExecutor default.
+    :type max_workers: int, optional
+    :raises IOError: If a changed input file does not exist.
+    :return: The manifest.
+    :rtype: pd.DataFrame
+    """
+
+    if isinstance(scenarios, str):
+        scenarios = read_scenario_control(scenarios)
+    else:
+        scenarios = _normalize_scenarios(scenarios)
+
+    names = list(dict.fromkeys(scenarios.index))
+    directories = {name: os.path.join(outdir, str(name)) for name in names}
+    for directory in directories.values():
+        os.makedirs(directory, exist_ok=True)
+
+    tasks = []
+    summaries = []
+    for filename, changes in scenarios.groupby('Filename', sort=False):
+        infile = os.path.join(model_path, filename)
+        if not os.path.isfile(infile):
+            raise IOError(f'Input file not found: {infile}')
+        base = BaseFile(infile)
+        variant_names, values = apply_scenarios(base, changes)
+        summaries.append(_summarize_variants(filename, base, variant_names, values, changes))
+        for name, variant_values in zip(variant_names, values):
+            outfile = os.path.join(directories[name], filename)
+            tasks.append((base.write, (variant_values, outfile, precision)))
+
+    if copy_model:
+        changed_files = {name: set(scenarios.loc[[name], 'Filename']) for name in names}
+        for filename in sorted(os.listdir(model_path)):
+            infile = os.path.join(model_path, filename)
+            if not os.path.isfile(infile):
+                continue
+            for name in names:
+                if filename in changed_files[name]:
+                    continue
+                tasks.append((shutil.copy2, (infile, os.path.join(directories[name], filename))))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(function, *args) for function, args in tasks]
+        for future in futures:
+            future.result()
+
+    manifest = pd.concat(summaries, ignore_index=True) if summaries else pd.DataFrame(columns=MANIFEST_COLUMNS)
+    manifest.insert(1, 'Directory', manifest['Scenario'].map(directories))
+    manifest.to_csv(os.path.join(outdir, MANIFEST_FILE), index=False)
+    return manifest
@@ -0,0 +1,281 @@
+import os
+import glob
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+import pandas as pd
+from . import w2_io
+from . import w2_control
+from . import w2_shared
+from . import w2_statistics
+
+
+def read_scoring_control(yaml_infile: str, model_path: str = None) -> pd.DataFrame:
+    """
+    Read a CE-QUAL-W2 scoring control file in YAML format.
+
+    The scoring control file uses the same layout as the plot control files. Each item pairs a
+    model output column with an observed time series, for example:
+
+        -   item: T_SEG37
+            Filename: tsr_1_seg37.csv
+            Column: T2(C)
+            Observed: observed/12193400_temperature.csv
+            ObservedColumn: Temperature (C)
+            Tolerance: 30min
+
+    `Filename` may be a glob pattern, such as `two_*_wdo.csv`, in which case the item is expanded
+    to one row per matching file in `model_path`, named `<item>:<filename>`. `ObservedColumn`
+    defaults to the first column of the observed file and `Tolerance` defaults to no limit.
+
+    :param yaml_infile: Path to the YAML file.
+    :type yaml_infile: str
+    :param model_path: Path to the model directory, used to expand glob patterns.
+    :type model_path: str, optional
+    :return: DataFrame containing one row per model/observation pair.
+    :rtype: pd.DataFrame
+    """
+
+    control_df = w2_io.read_plot_control(yaml_infile)
+    for column in ['ObservedColumn', 'Tolerance']:
+        if column not in control_df.columns:
+            control_df[column] = None
+
+    if model_path is None:
+        return control_df
+
+    rows = []
+    for item, params in control_df.iterrows():
+        filename = params['Filename']
+        if glob.has_magic(filename):
+            matches = sorted(glob.glob(os.path.join(model_path, filename)))
+            for match in matches:
+                row = params.copy()
+                row['Filename'] = os.path.basename(match)
+                row.name = f'{item}:{row["Filename"]}'
+                rows.append(row)
+        else:
+            rows.append(params)
+
+    expanded_df = pd.DataFrame(rows)
+    expanded_df.index.name = control_df.index.name
+    return expanded_df
+
+
+def read_observed(infile: str) -> pd.DataFrame:
+    """
+    Read an observed time series file.
+
+    CSV files must have the date-time in the first column. SQLite files are read with
+    `w2_io.read_sqlite()`.
+
+    :param infile: Path to the observed data file (*.csv or *.db).
+    :type infile: str
+    :return: DataFrame of the observed data, with a datetime index.
+    :rtype: pd.DataFrame
+    """
+
+    if infile.lower().endswith('.db'):
+        return w2_io.read_sqlite(infile)
+    df = pd.read_csv(infile, index_col=0, parse_dates=True)
+    df.index.name = 'Date'
+    df.attrs['Filename'] = infile
+    return df
+
+
+def read_model_file(infile: str, year: int) -> pd.DataFrame:
+    """
+    Read a CE-QUAL-W2 model output file, taking the column names from its header.
+
+    :param infile: Path to the model file (*.csv, *.npt, or *.opt).
+    :type infile: str
+    :param year: The start year of the simulation.
+    :type year: int
+    :return: DataFrame of the model output, with a datetime index.
+    :rtype: pd.DataFrame
+    """
+
+    data_columns = w2_io.get_data_columns(infile)
+    skiprows = w2_io.get_header_row_number(infile) + 1
+    return w2_io.read(infile, year, data_columns, skiprows=skiprows)
+
+
+def score_file(model_file: str, year: int, pairs: pd.DataFrame, observed_path: str = None,
+               shared_observed: dict = None) -> pd.DataFrame:
+    """
+    Score all the model/observation pairs that share one model file.
+
+    The model file is read once and each observed file once; the skill metrics of all pairs are
+    then computed in one batched call per tolerance.
+
+    :param model_file: Path to the model file.
+    :type model_file: str
+    :param year: The start year of the simulation.
+    :type year: int
+    :param pairs: The scoring control rows for this model file.
+    :type pairs: pd.DataFrame
+    :param observed_path: Directory for relative observed file paths. Defaults to the directory
+                          of the model file.
+    :type observed_path: str, optional
+    :param shared_observed: Observed data already published to shared memory, as a dictionary of
+                            {observed file path: `SharedDataFrame.descriptor`}. These files are
+                            attached instead of read.
+    :type shared_observed: dict, optional
+    :return: DataFrame with one row per pair and one column per skill metric.
+    :rtype: pd.DataFrame
+    """
+
+    if observed_path is None:
+        observed_path = os.path.dirname(model_file)
+    if shared_observed is None:
+        shared_observed = {}
+
+    model_df = read_model_file(model_file, year)
+    observed_dfs = {}
+    results = []
+
+    for tolerance, group in pairs.groupby(pairs['Tolerance'].fillna('').astype(str), sort=False):
+        series_pairs = {}
+        for item, params in group.iterrows():
+            observed_file = os.path.join(observed_path, params['Observed'])
+            if observed_file not in observed_dfs:
+                if observed_file in shared_observed:
+                    observed_dfs[observed_file] = w2_shared.attach_dataframe(shared_observed[observed_file])
+                else:
+                    observed_dfs[observed_file] = read_observed(observed_file)
+            observed_df = observed_dfs[observed_file]
+            observed_column = params['ObservedColumn']
+            if pd.isna(observed_column):
+                observed_column = observed_df.columns[0]
+            series_pairs[item] = (model_df[params['Column']], observed_df[observed_column])
+        results.append(w2_statistics.evaluate_skill(series_pairs, tolerance=tolerance or None))
+
+    scores = pd.concat(results)
+    scores.index.name = pairs.index.name
+    return scores
+
+
+def _score_file_task(args):
+    """Unpack the arguments of `score_file()` for a process pool."""
+    return score_file(*args)
+
+
+def write_scores(scores: pd.DataFrame, outfile: str, table: str = 'scores'):
+    """
+    Write a skill score table to SQLite (*.db) or CSV (any other extension).
+
+    Scores are appended to an existing SQLite table, so that the results of several model runs
+    can be collected in one database and ranked with SQL queries.
+
+    :param scores: The skill score table.
+    :type scores: pd.DataFrame
+    :param outfile: The path to the output file.
+    :type outfile: str
+    :param table: The SQLite table name. Defaults to 'scores'.
+    :type table: str
+    """
+
+    if outfile.lower().endswith('.db'):
+        with sqlite3.connect(outfile) as db:
+            scores.to_sql(table, db, if_exists='append', index=False)
+    else:
+        scores.to_csv(outfile, index=False)
+
+
+def score_model(scoring_control_yaml: str, model_path: str, year: int = None, outfile: str = None,
+                observed_path: str = None, processes: int = None) -> pd.DataFrame:
+    """
+    Compute skill metrics for every model/observation pair in a scoring control file.
+
+    The pairs are grouped by model file and each model file is scored in a separate worker
+    process. Observed files that are compared with more than one model file are read once and
+    published to shared memory, where the workers attach to them without copying. Only the
+    columns that the pairs compare are published. The results are combined into one tidy table
+    with one row per pair, and the run name (the model directory name) in the first column.
+
+    :param scoring_control_yaml: Path to the scoring control YAML file.
+    :type scoring_control_yaml: str
+    :param model_path: Path to the model directory.
+    :type model_path: str
+    :param year: Start year of the simulation. Defaults to the year in the model's control file.
+    :type year: int, optional
+    :param outfile: Path to the output SQLite (*.db) or CSV file. If None, no file is written.
+    :type outfile: str, optional
+    :param observed_path: Directory for relative observed file paths. Defaults to the model path.
+    :type observed_path: str, optional
+    :param processes: The number of worker processes. Defaults to the number of CPUs.
+    :type processes: int, optional
+    :return: The skill score table.
+    :rtype: pd.DataFrame
+    """
+
+    if observed_path is None:
+        observed_path = model_path
+    if year is None:
+        year = w2_control.get_model_year(model_path)
+        if year is None:
+            raise ValueError(f'No control file found for {model_path}; specify the start year')
+
+    control_df = read_scoring_control(scoring_control_yaml, model_path=model_path)
+    groups = list(control_df.groupby('Filename', sort=False))
+
+    if processes == 1 or len(groups) <= 1:
+        results = [score_file(os.path.join(model_path, filename), year, pairs, observed_path)
+                   for filename, pairs in groups]
+    else:
+        # Publish the observed files used by several model files once
+        observed_counts = control_df.drop_duplicates(['Filename', 'Observed'])['Observed'].value_counts()
+        published = {}
+        try:
+            for observed in observed_counts.index[observed_counts > 1]:
+                observed_file = os.path.join(observed_path, observed)
+                observed_df = read_observed(observed_file)
+                # Resolve the default column first; only the compared columns are published
+                rows = control_df['Observed'] == observed
+                observed_columns = control_df.loc[rows, 'ObservedColumn'].fillna(observed_df.columns[0])
+                control_df.loc[rows, 'ObservedColumn'] = observed_columns
+                published[observed_file] = w2_shared.publish_dataframe(observed_df[observed_columns.unique().tolist()])
+            shared_observed = {observed_file: shared.descriptor for observed_file, shared in published.items()}
+            tasks = [(os.path.join(model_path, filename), year, pairs, observed_path, shared_observed)
+                     for filename, pairs in control_df.groupby('Filename', sort=False)]
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                results = list(executor.map(_score_file_task, tasks))
+        finally:
+            for shared in published.values():
+                shared.unlink()
+
+    scores = pd.concat(results) if results else pd.DataFrame(columns=w2_statistics.SKILL_METRICS)
+    scores = control_df[['Filename', 'Column', 'Observed']].join(scores, how='right')
+    scores = scores.reset_index()
+    scores.insert(0, 'Run', os.path.basename(os.path.normpath(model_path)))
+
+    if outfile:
+        write_scores(scores, outfile)
+
+    return scores
+
+
+def main(argv: List[str] = None):
+    """Command line entry point: python -m cequalw2.w2_scoring control.yaml model_path [year]"""
+    parser = argparse.ArgumentParser(description='Score CE-QUAL-W2 model output against observations.')
+    parser.add_argument('scoring_control_yaml', help='Scoring control file (YAML)')
+    parser.add_argument('model_path', help='Model directory')
+    parser.add_argument('year', type=int, nargs='?', default=None,
+                        help='Start year of the simulation (default: read from w2_con)')
+    parser.add_argument('-o', '--outfile', default='scores.csv',
+                        help='Output file (*.db for SQLite, otherwise CSV)')
+    parser.add_argument('--observed-path', default=None,
+                        help='Directory for relative observed file paths')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='Number of worker processes')
+    args = parser.parse_args(argv)
+
+    scores = score_model(args.scoring_control_yaml, args.model_path, args.year,
+                         outfile=args.outfile, observed_path=args.observed_path,
+                         processes=args.processes)
+    print(scores.to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+# Byte alignment of each array in a shared memory block
+ALIGNMENT = 64
+
+# Shared memory blocks attached by this process, by name. The blocks must stay open while
+# DataFrames that use their memory are alive.
+_attached = {}
+
+
+def _aligned(offset: int) -> int:
+    """Round a byte offset up to the next multiple of ALIGNMENT."""
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class SharedDataFrame:
+    """
+    A DataFrame published to a shared memory block
+
+    The index and the columns are copied once into one block of shared memory. The small,
+    picklable `descriptor` is sent to worker processes, which call `attach_dataframe()` to
+    wrap the same memory in a DataFrame without copying. The publishing process owns the block
+    and must call `unlink()` (or use the object as a context manager) when the workers are done.
+
+    Only numeric and datetime columns and indexes are supported.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        if isinstance(df.index, pd.DatetimeIndex):
+            index = df.index.asi8
+            index_kind = f'datetime64[{df.index.unit}]'
+        else:
+            index = df.index.to_numpy()
+            index_kind = 'array'
+        arrays = [index] + [df[column].to_numpy() for column in df.columns]
+        for column, values in zip([df.index.name or 'index', *df.columns], arrays):
+            if values.dtype.kind not in 'biufM':
+                raise ValueError(f'Column {column} cannot be shared: unsupported dtype {values.dtype}')
+
+        offsets = []
+        size = 0
+        for values in arrays:
+            size = _aligned(size)
+            offsets.append(size)
+            size += values.nbytes
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for values, offset in zip(arrays, offsets):
+            target = np.ndarray(values.shape, dtype=values.dtype, buffer=self.shm.buf, offset=offset)
+            target[...] = values
+
+        self.descriptor = {
+            'name': self.shm.name,
+            'length': len(df),
+            'index_name': df.index.name,
+            'index_kind': index_kind,
+            'arrays': [(values.dtype.str, offset) for values, offset in zip(arrays, offsets)],
+            'columns': list(df.columns),
+            'attrs': dict(df.attrs),
+        }
+
+    def __repr__(self):
+        return f'SharedDataFrame({self.name}, {self.descriptor["length"]} rows, ' \
+               f'{len(self.descriptor["columns"])} columns)'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.unlink()
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def unlink(self):
+        """Release the shared memory block. DataFrames attached in other processes stay valid
+        until those processes release the block."""
+        self.shm.close()
+        self.shm.unlink()
+
+
+def publish_dataframe(df: pd.DataFrame) -> SharedDataFrame:
+    """
+    Copy a DataFrame into shared memory, once, for use by worker processes.
+
+    :param df: The DataFrame, with numeric or datetime columns.
+    :type df: pd.DataFrame
+    :raises ValueError: If a column has an unsupported dtype, such as strings.
+    :return: The shared DataFrame. Send its `descriptor` to the workers.
+    :rtype: SharedDataFrame
+    """
+
+    return SharedDataFrame(df)
+
+
+def attach_dataframe(descriptor: dict) -> pd.DataFrame:
+    """
+    Wrap a DataFrame published with `publish_dataframe()` without copying its data.
+
+    The block is attached once per process and kept open for the life of the process, so that
+    the returned DataFrames stay valid. The columns are read-only.
+
+    Worker processes must be started with `multiprocessing` (or `concurrent.futures`), which
+    shares the publishing process's resource tracker; the block is then released only when the
+    publisher unlinks it.
+
+    :param descriptor: The `descriptor` of a `SharedDataFrame`.
+    :type descriptor: dict
+    :return: The DataFrame, backed by the shared memory block.
+    :rtype: pd.DataFrame
+    """
+
+    name = descriptor['name']
+    shm = _attached.get(name)
+    if shm is None:
+        shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = shm
+
+    length = descriptor['length']
+    arrays = []
+    for dtype, offset in descriptor['arrays']:
+        values = np.ndarray((length,), dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        values.flags.writeable = False
+        arrays.append(values)
+
+    if descriptor['index_kind'].startswith('datetime64'):
+        index = pd.DatetimeIndex(arrays[0].view(descriptor['index_kind']), name=descriptor['index_name'])
+    else:
+        index = pd.Index(arrays[0], name=descriptor['index_name'])
+
+    df = pd.DataFrame(dict(enumerate(arrays[1:])), index=index, copy=False)
+    df.columns = descriptor['columns']
+    df.attrs.update(descriptor['attrs'])
+    return df
+
+
+def detach_dataframes():
+    """
+    Close the shared memory blocks attached by this process.
+
+    All DataFrames returned by `attach_dataframe()` in this process must have been deleted.
+    """
+
+    while _attached:
+        _, shm = _attached.popitem()
+        shm.close()
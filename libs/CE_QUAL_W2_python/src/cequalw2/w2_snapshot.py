@@ -0,0 +1,609 @@
+import os
+import re
+import mmap
+from typing import List
+import numpy as np
+import pandas as pd
+import h5py
+
+BLOCK_MARKER = b'CE-QUAL-W2 VERSION'
+JDAY_MARKER = b'[JDAY]'
+PAGE_MARKER = '1'
+# Letter codes of profile table cells, such as the limiting factors P, N, Si, and L
+SNAPSHOT_CODE_DTYPE = 'S4'
+
+DAYS_HOURS_PATTERN = re.compile(r'(-?\d+)\s+days\s+(-?[\d.]*)\s+hours')
+PROFILE_TITLE_PATTERN = re.compile(r'Julian (?:day =|Date)\s+(-?\d+)\s+days\s+(-?[\d.]*)\s+hours\s+(.*\S)')
+# A scalar parameter line: a label, a code in brackets, and the values, e.g. '   Inflow [QIN] =  1.02 m^3/sec'
+PARAMETER_PATTERN = re.compile(r'^\s*(.*?)\s*\[([A-Z0-9_,]+)\]\s*=\s*(.*)')
+# A layer range, e.g. '10-10' for the layers of an inflow
+RANGE_PATTERN = re.compile(r'^\d+-\d+$')
+# A Fortran real with a three-digit exponent and no E, e.g. '0.61823343-316'
+FORTRAN_EXPONENT_PATTERN = re.compile(r'^([-+]?\d*\.\d+)([-+]\d{3})$')
+VARIABLE_CODE_PATTERN = re.compile(r'\[([A-Za-z0-9_]+)\]')
+# A profile table cell: an optional letter code and a number, e.g. '12.34' or 'P  1.0000' in the
+# algal limiting factor tables
+PROFILE_CELL_PATTERN = re.compile(r'^([A-Za-z]*)\s*(-?(?:\d+\.?\d*|\.\d+)(?:[Ee][-+]?\d+)?)$')
+
+
+def _days_hours_to_jday(days: str, hours: str) -> float:
+    """Convert the 'N days H hours' notation of the snapshot file to a Julian day."""
+    return float(days) + (float(hours) if hours.strip('.') else 0.0) / 24.0
+
+
+def _variable_key(title: str) -> str:
+    """
+    Get a short key for a profile variable title.
+
+    The code in brackets is used if present, e.g. 'Temperature [T1], <o/>C' becomes 'T1'.
+    Otherwise, the name before the units is used, e.g. 'TDS, g/m^3' becomes 'TDS'.
+    """
+    match = VARIABLE_CODE_PATTERN.search(title)
+    if match:
+        return match.group(1)
+    return title.split(',')[0].strip().replace('/', '_')
+
+
+def _variable_units(title: str) -> str:
+    """Get the units of a profile variable title, e.g. 'g/m^3' for 'TDS, g/m^3'."""
+    if ',' in title:
+        return title.rsplit(',', 1)[1].strip()
+    return ''
+
+
+def _parse_value_token(token: str):
+    """Parse one value of a parameter: a number, or a layer range such as '10-10', which is kept as text."""
+    try:
+        return float(token)
+    except ValueError:
+        pass
+    fortran = FORTRAN_EXPONENT_PATTERN.match(token)
+    if fortran:
+        return float(f'{fortran.group(1)}E{fortran.group(2)}')
+    if RANGE_PATTERN.match(token):
+        return token
+    return None
+
+
+def _parse_values(text: str) -> list:
+    """
+    Parse the values of a parameter, e.g. [1.08, 0.14] for '1.08 0.14 m^3/sec' or ['10-10'] for
+    '10-10'. The values end at the first token that is neither a number nor a layer range, such as
+    the units.
+    """
+    values = []
+    for token in text.split():
+        value = _parse_value_token(token)
+        if value is None:
+            break
+        values.append(value)
+    return values
+
+
+def _is_continuation(line: str) -> bool:
+    """Check whether a line continues the values of the previous parameter, e.g. the 13th to 24th outlets."""
+    tokens = line.split()
+    return len(tokens) > 0 and all(_parse_value_token(token) is not None for token in tokens)
+
+
+def _parameter_array(values: list) -> np.ndarray:
+    """Convert the values of a parameter to a float array, or to a string array if any value is text."""
+    if all(isinstance(value, float) for value in values):
+        return np.array(values, dtype=np.float64)
+    return np.array([value if isinstance(value, str) else f'{value:g}' for value in values], dtype=str)
+
+
+def _parse_profile(lines: List[str], start: int):
+    """
+    Parse a profile table that starts at the ' Layer  Depth' header line.
+
+    The values are right-aligned under the segment numbers of the header. A value may be preceded
+    by a letter code, such as the limiting factor (P, N, Si, or L) in the algal limiting factor
+    tables. Blank fields (layers below the bottom of a segment) and fields that cannot be parsed
+    are returned as NaN, with an empty code.
+
+    :raises ValueError: If none of the non-blank fields of the table can be parsed.
+    :return: The segment numbers, the layer numbers, the layer depths, the values (layers x
+             segments), the codes (layers x segments), and the index of the first line after
+             the table.
+    """
+    header = lines[start]
+    segment_matches = list(re.finditer(r'\d+', header))
+    segments = [int(match.group()) for match in segment_matches]
+    field_ends = [match.end() for match in segment_matches]
+    field_starts = [header.index('Depth') + len('Depth')] + field_ends[:-1]
+
+    layers = []
+    depths = []
+    values = []
+    codes = []
+    parsed = 0
+    unparsed = []
+    i = start + 1
+    while i < len(lines):
+        line = lines[i]
+        fields = line[:field_starts[0]].split()
+        if len(fields) != 2 or line.startswith(PAGE_MARKER):
+            break
+        try:
+            layer = int(fields[0])
+            depth = float(fields[1])
+        except ValueError:
+            break
+        row = []
+        row_codes = []
+        for field_start, field_end in zip(field_starts, field_ends):
+            cell = line[field_start:field_end].strip()
+            match = PROFILE_CELL_PATTERN.match(cell)
+            if match:
+                row_codes.append(match.group(1))
+                row.append(float(match.group(2)))
+                parsed += 1
+            else:
+                if cell:
+                    unparsed.append(cell)
+                row_codes.append('')
+                row.append(np.nan)
+        layers.append(layer)
+        depths.append(depth)
+        values.append(row)
+        codes.append(row_codes)
+        i += 1
+
+    if unparsed and parsed == 0:
+        raise ValueError(f'Could not parse the values of the profile table with the header '
+                         f'{header.strip()!r}, e.g. {unparsed[0]!r}')
+    return segments, layers, depths, values, codes, i
+
+
+class SnapshotBlock:
+    """
+    One timestep of a CE-QUAL-W2 snapshot (snp*.opt) file
+
+    The scalar parameters are stored in `parameters` by their label and code, such as
+    'Timestep [DLT]', 'Inflow [QIN]', or 'Total outflow [QOUT]', as arrays of all the values
+    printed with that label, in order (for example, one inflow per branch, or one outflow per
+    outlet, including the values wrapped on the following lines). Times such as '0 days 0.00
+    hours' are converted to Julian days. Layer ranges such as '10-10' and values that are not
+    numbers, such as the Gregorian date, are kept as strings. The
+    profiles are stored in `profiles` as DataFrames indexed by layer, with a Depth column and one
+    column per snapshot segment. The full titles of the profile variables are in `titles`. For
+    tables with letter codes, such as the limiting factor of the algal limiting factor tables,
+    the codes are stored in `codes` as DataFrames of strings with the same layout, without the
+    Depth column.
+    """
+
+    def __init__(self, jday: float, parameters: dict, profiles: dict, titles: dict, codes: dict = None):
+        self.jday = jday
+        self.parameters = parameters
+        self.profiles = profiles
+        self.titles = titles
+        self.codes = {} if codes is None else codes
+
+    def __repr__(self):
+        return f'SnapshotBlock(jday={self.jday}, profiles={list(self.profiles)})'
+
+    @property
+    def variables(self) -> List[str]:
+        """The keys of the profile variables, e.g. 'T1' or 'TDS'."""
+        return list(self.profiles)
+
+    @classmethod
+    def parse(cls, text: str):
+        """
+        Parse the text of one timestep.
+
+        :param text: The text of one timestep, starting at the CE-QUAL-W2 VERSION line.
+        :type text: str
+        :return: The parsed timestep.
+        :rtype: SnapshotBlock
+        """
+        lines = text.splitlines()
+        jday = np.nan
+        parameters = {}
+        profiles = {}
+        titles = {}
+        codes = {}
+        title = None
+        i = 0
+
+        while i < len(lines):
+            line = lines[i]
+            profile_title = PROFILE_TITLE_PATTERN.search(line)
+            if profile_title:
+                title = profile_title.group(3).strip()
+            elif title is not None and line.startswith(' Layer') and 'Depth' in line:
+                segments, layers, depths, values, table_codes, i = _parse_profile(lines, i)
+                key = _variable_key(title)
+                index = pd.Index(layers, name='Layer')
+                profile = pd.DataFrame(values, index=index, columns=segments)
+                profile.insert(0, 'Depth', depths)
+                profile_codes = pd.DataFrame(table_codes, index=index, columns=segments)
+                has_codes = (profile_codes != '').to_numpy().any()
+                if key in profiles:
+                    # Wide tables are continued on the next page with the remaining segments
+                    profile = profiles[key].join(profile.drop(columns='Depth'), how='outer')
+                    if key in codes or has_codes:
+                        previous = codes.get(key, pd.DataFrame('', index=profiles[key].index,
+                                                               columns=profiles[key].columns[1:]))
+                        profile_codes = previous.join(profile_codes, how='outer').fillna('')
+                        has_codes = True
+                profiles[key] = profile
+                titles[key] = title
+                if has_codes:
+                    codes[key] = profile_codes
+                continue
+            else:
+                parameter = PARAMETER_PATTERN.search(line)
+                if parameter:
+                    label, name, value = parameter.groups()
+                    days_hours = DAYS_HOURS_PATTERN.search(value)
+                    if name == 'JDAY':
+                        if days_hours:
+                            jday = _days_hours_to_jday(*days_hours.groups())
+                    else:
+                        if days_hours:
+                            values = [_days_hours_to_jday(*days_hours.groups())]
+                        else:
+                            values = _parse_values(value)
+                            # Long lists of values are wrapped on the following lines
+                            while i + 1 < len(lines) and _is_continuation(lines[i + 1]):
+                                i += 1
+                                values += _parse_values(lines[i])
+                            if not values and value.strip():
+                                values = [value.strip()]
+                        key = f'{" ".join(label.split())} [{name}]'.strip()
+                        parameters.setdefault(key, []).extend(values)
+            i += 1
+
+        parameters = {key: _parameter_array(values) for key, values in parameters.items()}
+        return cls(jday, parameters, profiles, titles, codes)
+
+
+class SnapshotFile:
+    """
+    CE-QUAL-W2 snapshot (snp*.opt) file with an index of the timestep blocks
+
+    The file is scanned once when opened, recording the byte offset, length, and Julian day of
+    each timestep. Blocks are parsed on demand and cached, so that only the requested timesteps
+    are ever parsed.
+    """
+
+    def __init__(self, infile: str):
+        self.infile = infile
+        self.index = index_snapshot(infile)
+        self._blocks = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __repr__(self):
+        return f'SnapshotFile({self.infile!r}, {len(self)} timesteps)'
+
+    @property
+    def jday(self) -> np.ndarray:
+        """The Julian days of the timesteps."""
+        return self.index['JDAY'].to_numpy()
+
+    def block(self, position: int) -> SnapshotBlock:
+        """
+        Get a timestep by position, parsing it if it has not been parsed yet.
+
+        :param position: The position of the timestep in the file, starting at 0.
+        :type position: int
+        :return: The parsed timestep.
+        :rtype: SnapshotBlock
+        """
+        if position < 0:
+            position += len(self)
+        if position not in self._blocks:
+            offset, length = self.index.iloc[position][['Offset', 'Length']].astype(int)
+            with open(self.infile, 'rb') as f:
+                f.seek(offset)
+                text = f.read(length).decode('latin-1')
+            self._blocks[position] = SnapshotBlock.parse(text)
+        return self._blocks[position]
+
+    def at(self, jday: float) -> SnapshotBlock:
+        """
+        Get the timestep nearest to a Julian day.
+
+        :param jday: The Julian day.
+        :type jday: float
+        :return: The parsed timestep.
+        :rtype: SnapshotBlock
+        """
+        return self.block(int(np.nanargmin(np.abs(self.jday - jday))))
+
+    def blocks(self):
+        """Iterate over all timesteps, in order."""
+        for position in range(len(self)):
+            yield self.block(position)
+
+
+def index_snapshot(infile: str) -> pd.DataFrame:
+    """
+    Index the timesteps of a CE-QUAL-W2 snapshot file in one pass.
+
+    The file is memory mapped and searched for the CE-QUAL-W2 VERSION line that starts each
+    timestep and the [JDAY] line within it. No other text is parsed.
+
+    :param infile: Path to the snapshot file (snp*.opt).
+    :type infile: str
+    :return: DataFrame with one row per timestep and the columns JDAY, Offset, and Length
+             (in bytes).
+    :rtype: pd.DataFrame
+    """
+
+    records = []
+    if os.path.getsize(infile) == 0:
+        return pd.DataFrame(records, columns=['JDAY', 'Offset', 'Length'])
+
+    with open(infile, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = mm.size()
+        offsets = []
+        position = 0 if mm[:len(BLOCK_MARKER)] == BLOCK_MARKER else mm.find(b'\n' + BLOCK_MARKER)
+        while position >= 0:
+            if mm[position:position + 1] == b'\n':
+                position += 1
+            offsets.append(position)
+            position = mm.find(b'\n' + BLOCK_MARKER, position + 1)
+
+        ends = offsets[1:] + [size]
+        for start, end in zip(offsets, ends):
+            jday = np.nan
+            jday_position = mm.find(JDAY_MARKER, start, end)
+            if jday_position >= 0:
+                line_end = mm.find(b'\n', jday_position, end)
+                line = mm[jday_position:line_end if line_end >= 0 else end].decode('latin-1')
+                days_hours = DAYS_HOURS_PATTERN.search(line)
+                if days_hours:
+                    jday = _days_hours_to_jday(*days_hours.groups())
+            records.append([jday, start, end - start])
+
+    return pd.DataFrame(records, columns=['JDAY', 'Offset', 'Length'])
+
+
+def read_snapshot(infile: str) -> SnapshotFile:
+    """
+    Open a CE-QUAL-W2 snapshot file for lazy reading.
+
+    :param infile: Path to the snapshot file (snp*.opt).
+    :type infile: str
+    :return: The indexed snapshot file.
+    :rtype: SnapshotFile
+    """
+
+    return SnapshotFile(infile)
+
+
+def write_snapshot_store(infile: str, outfile: str, overwrite: bool = True, dtype=np.float64):
+    """
+    Convert a CE-QUAL-W2 snapshot file to a compact HDF5 store.
+
+    Each profile variable is written as a compressed array with the dimensions (time, layer,
+    segment), chunked by timestep, so that a profile or a single time series can be read
+    without loading the rest of the file. The store also contains the JDAY, Layer, and Segment
+    coordinates, the layer depths (time, layer), and the scalar parameters, as (time) arrays for
+    parameters with one value and (time x value) arrays for parameters with several values, such
+    as one inflow per branch. Parameters with text values, such as layer ranges, are stored as
+    byte strings. The letter codes of tables such as the algal limiting factors are
+    stored as (time, layer, segment) string arrays in the codes group. The variable titles and
+    units are stored as attributes.
+
+    :param infile: Path to the snapshot file (snp*.opt).
+    :type infile: str
+    :param outfile: Path to the HDF5 output file.
+    :type outfile: str
+    :param overwrite: Whether to replace an existing output file. Defaults to True.
+    :type overwrite: bool, optional
+    :param dtype: The dtype of the profile and parameter values, such as np.float32, which halves
+                  the size of the store. Defaults to float64.
+    :type dtype: np.dtype, optional
+    """
+
+    snapshot = read_snapshot(infile)
+    blocks = list(snapshot.blocks())
+
+    titles = {}
+    segments = set()
+    layers = set()
+    code_keys = []
+    parameter_sizes = {}
+    text_lengths = {}
+    for block in blocks:
+        for key, profile in block.profiles.items():
+            titles.setdefault(key, block.titles[key])
+            segments.update(column for column in profile.columns if column != 'Depth')
+            layers.update(profile.index)
+        for key in block.codes:
+            if key not in code_keys:
+                code_keys.append(key)
+        for key, values in block.parameters.items():
+            parameter_sizes[key] = max(parameter_sizes.get(key, 0), len(values))
+            if values.dtype.kind == 'U':
+                text_lengths[key] = max(text_lengths.get(key, 1), values.dtype.itemsize // 4)
+    segments = np.array(sorted(segments), dtype=int)
+    layers = np.array(sorted(layers), dtype=int)
+
+    num_times = len(blocks)
+    shape = (num_times, len(layers), len(segments))
+    data = {key: np.full(shape, np.nan, dtype=dtype) for key in titles}
+    depths = np.full(shape[:2], np.nan)
+    codes = {key: np.zeros(shape, dtype=SNAPSHOT_CODE_DTYPE) for key in code_keys}
+    parameters = {key: np.zeros((num_times, size), dtype=f'S{text_lengths[key]}') if key in text_lengths
+                  else np.full((num_times, size), np.nan, dtype=dtype) for key, size in parameter_sizes.items()}
+
+    for t, block in enumerate(blocks):
+        for key, profile in block.profiles.items():
+            layer_index = np.searchsorted(layers, profile.index.to_numpy())
+            columns = [column for column in profile.columns if column != 'Depth']
+            segment_index = np.searchsorted(segments, np.array(columns, dtype=int))
+            data[key][t, layer_index[:, None], segment_index[None, :]] = profile[columns].to_numpy()
+            depths[t, layer_index] = profile['Depth'].to_numpy()
+            if key in block.codes:
+                codes[key][t, layer_index[:, None], segment_index[None, :]] = block.codes[key][columns].to_numpy()
+        for key, values in block.parameters.items():
+            if key in text_lengths:
+                values = np.char.encode(values.astype(str), 'latin-1')
+            parameters[key][t, :len(values)] = values
+
+    if overwrite and os.path.exists(outfile):
+        os.remove(outfile)
+
+    with h5py.File(outfile, 'a') as f:
+        f.attrs['Filename'] = os.path.basename(infile)
+        f.create_dataset('JDAY', data=np.array([block.jday for block in blocks]))
+        f.create_dataset('Layer', data=layers)
+        f.create_dataset('Segment', data=segments)
+        f.create_dataset('Depth', data=depths)
+        chunks = (1, max(len(layers), 1), max(len(segments), 1))
+        for key, values in data.items():
+            dataset = f.create_dataset(f'profiles/{key}', data=values, chunks=chunks,
+                                       compression='gzip', shuffle=True)
+            dataset.attrs['title'] = titles[key]
+            dataset.attrs['units'] = _variable_units(titles[key])
+        for key, values in codes.items():
+            f.create_dataset(f'codes/{key}', data=values, chunks=chunks, compression='gzip')
+        for key, values in parameters.items():
+            # parameters with one value per timestep are stored as (time) arrays
+            dataset = f.create_dataset(f'parameters/{key.replace("/", "_")}',
+                                       data=values[:, 0] if values.shape[1] == 1 else values)
+            dataset.attrs['label'] = key
+
+
+class SnapshotStore:
+    """
+    Read access to a snapshot HDF5 store written by `write_snapshot_store()`
+
+    The coordinates are loaded when the store is opened. Profile and time series queries read
+    only the requested slice of the data.
+    """
+
+    def __init__(self, infile: str):
+        self.infile = infile
+        with h5py.File(infile, 'r') as f:
+            self.jday = f['JDAY'][:]
+            self.layers = f['Layer'][:]
+            self.segments = f['Segment'][:]
+            self.variables = list(f['profiles'].keys()) if 'profiles' in f else []
+            parameters = f['parameters'] if 'parameters' in f else {}
+            self._parameter_paths = {parameters[name].attrs.get('label', name): f'parameters/{name}'
+                                     for name in parameters}
+            self.parameter_names = list(self._parameter_paths)
+            self.code_variables = list(f['codes'].keys()) if 'codes' in f else []
+            self.titles = {key: f[f'profiles/{key}'].attrs['title'] for key in self.variables}
+
+    def __repr__(self):
+        return f'SnapshotStore({self.infile!r}, {len(self.jday)} timesteps)'
+
+    def _time_index(self, jday: float) -> int:
+        """Get the position of the timestep nearest to a Julian day."""
+        return int(np.nanargmin(np.abs(self.jday - jday)))
+
+    def _segment_index(self, segment: int) -> int:
+        """Get the position of a segment number."""
+        positions = np.flatnonzero(self.segments == segment)
+        if len(positions) == 0:
+            raise ValueError(f'Segment {segment} is not in the snapshot store. '
+                             f'Valid segments are {list(self.segments)}.')
+        return int(positions[0])
+
+    def profile(self, variable: str, jday: float) -> pd.DataFrame:
+        """
+        Read the profiles of a variable at the timestep nearest to a Julian day.
+
+        :param variable: The variable key, e.g. 'T1' or 'TDS'.
+        :type variable: str
+        :param jday: The Julian day.
+        :type jday: float
+        :return: DataFrame indexed by layer, with a Depth column and one column per segment.
+        :rtype: pd.DataFrame
+        """
+        t = self._time_index(jday)
+        with h5py.File(self.infile, 'r') as f:
+            values = f[f'profiles/{variable}'][t]
+            depths = f['Depth'][t]
+        profile = pd.DataFrame(values, index=pd.Index(self.layers, name='Layer'), columns=self.segments)
+        profile.insert(0, 'Depth', depths)
+        return profile.dropna(how='all', subset=list(self.segments))
+
+    def time_series(self, variable: str, segment: int, layer: int = None) -> pd.Series:
+        """
+        Read the time series of a variable in one segment.
+
+        :param variable: The variable key, e.g. 'T1' or 'TDS'.
+        :type variable: str
+        :param segment: The segment number.
+        :type segment: int
+        :param layer: The layer number. Defaults to the surface layer (the top layer with data
+                      at each timestep).
+        :type layer: int, optional
+        :return: Series indexed by JDAY.
+        :rtype: pd.Series
+        """
+        s = self._segment_index(segment)
+        with h5py.File(self.infile, 'r') as f:
+            if layer is None:
+                values = f[f'profiles/{variable}'][:, :, s]
+                valid = ~np.isnan(values)
+                top = np.where(valid.any(axis=1), valid.argmax(axis=1), 0)
+                series = values[np.arange(len(values)), top]
+                series[~valid.any(axis=1)] = np.nan
+            else:
+                if layer not in self.layers:
+                    raise ValueError(f'Layer {layer} is not in the snapshot store.')
+                k = int(np.searchsorted(self.layers, layer))
+                series = f[f'profiles/{variable}'][:, k, s]
+        return pd.Series(series, index=pd.Index(self.jday, name='JDAY'), name=variable)
+
+    def codes(self, variable: str, jday: float) -> pd.DataFrame:
+        """
+        Read the letter codes of a variable, such as the algal limiting factors, at the timestep
+        nearest to a Julian day.
+
+        :param variable: The variable key, e.g. 'Algal group 1 limiting factor'.
+        :type variable: str
+        :param jday: The Julian day.
+        :type jday: float
+        :return: DataFrame of codes indexed by layer, with one column per segment. Cells without
+                 a code are empty strings.
+        :rtype: pd.DataFrame
+        """
+        if variable not in self.code_variables:
+            raise ValueError(f'Variable {variable} has no codes in the snapshot store.')
+        t = self._time_index(jday)
+        with h5py.File(self.infile, 'r') as f:
+            values = f[f'codes/{variable}'][t].astype(str)
+        return pd.DataFrame(values, index=pd.Index(self.layers, name='Layer'), columns=self.segments)
+
+    def parameter(self, name: str):
+        """
+        Read the time series of a scalar parameter.
+
+        :param name: The label and code of the parameter, e.g. 'Timestep [DLT]' or 'Total outflow
+                     [QOUT]', or only the code, e.g. 'DLT', if one parameter has that code.
+        :type name: str
+        :raises ValueError: If the parameter is not in the store, or the code belongs to several
+                            parameters, such as 'QOUT'.
+        :return: Series indexed by JDAY for parameters with one value, or DataFrame with one
+                 column per value (1, 2, ...) for parameters with several values, such as
+                 'Inflow [QIN]' with one inflow per branch. Values missing at a timestep are NaN,
+                 or empty strings for text values.
+        :rtype: pd.Series or pd.DataFrame
+        """
+        key = name
+        if key not in self._parameter_paths:
+            matches = [label for label in self._parameter_paths if label.endswith(f'[{name}]')]
+            if len(matches) != 1:
+                problem = 'is ambiguous' if matches else 'is not in the snapshot store'
+                raise ValueError(f'Parameter {name} {problem}. Use one of {matches or self.parameter_names}.')
+            key = matches[0]
+        with h5py.File(self.infile, 'r') as f:
+            values = f[self._parameter_paths[key]][:]
+        if values.dtype.kind == 'S':
+            values = np.char.decode(values, 'latin-1')
+        index = pd.Index(self.jday, name='JDAY')
+        if values.ndim == 2:
+            return pd.DataFrame(values, index=index, columns=np.arange(1, values.shape[1] + 1))
+        return pd.Series(values, index=index, name=key)
@@ -1 +1,435 @@
-from . import w2_io
+import os
+from typing import List, Sequence, Union
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_PERCENTILES = (0.25, 0.5, 0.75)
+
+
+class SummaryStatistics:
+    """
+    Descriptive statistics for the data columns of one or more CE-QUAL-W2 data frames.
+
+    The statistics are stored in a single two-dimensional array with one row per statistic
+    (count, mean, std, min, percentiles, max) and one column per data column. The `sources`,
+    `positions`, and `columns` lists identify the data frame (by name and by position) and the
+    column that each array column came from, so the same object can be used to fill the ClearView
+    tables and the docx and Markdown reports.
+    """
+
+    def __init__(self, values: np.ndarray, statistics: List[str], sources: List[str],
+                 positions: List[int], columns: List[str]):
+        self.values = values
+        self.statistics = statistics
+        self.sources = sources
+        self.positions = positions
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.statistics)
+
+    def source_names(self) -> List[str]:
+        """
+        Get the unique source names, in the order the data frames were given.
+
+        :return: The source names.
+        :rtype: List[str]
+        """
+
+        return list(dict.fromkeys(self.sources))
+
+    def _select(self, source: Union[str, int, None]) -> np.ndarray:
+        """Get the array column indices that belong to a source (all columns if None)."""
+        if source is None:
+            return np.arange(len(self.columns))
+        if isinstance(source, (int, np.integer)):
+            return np.flatnonzero(np.asarray(self.positions) == source)
+        return np.flatnonzero(np.asarray(self.sources, dtype=object) == source)
+
+    def to_frame(self, source: Union[str, int, None] = None) -> pd.DataFrame:
+        """
+        Convert the statistics to a data frame laid out like `pd.DataFrame.describe()`.
+
+        :param source: The source name or data frame position to select. If None, all columns are
+                       returned, with a (source, column) MultiIndex when there is more than one
+                       source.
+        :type source: str, int, or None
+        :return: Data frame with one row per statistic and one column per data column.
+        :rtype: pd.DataFrame
+        """
+
+        indices = self._select(source)
+        if source is None and len(self.source_names()) > 1:
+            columns = pd.MultiIndex.from_arrays([[self.sources[i] for i in indices],
+                                                 [self.columns[i] for i in indices]])
+        else:
+            columns = [self.columns[i] for i in indices]
+        df = pd.DataFrame(self.values[:, indices], index=self.statistics, columns=columns)
+        df.index.name = 'Statistic'
+        return df
+
+    def format_values(self, source: Union[str, int, None] = None, precision: int = 2) -> np.ndarray:
+        """
+        Format the statistics as strings for display in tables.
+
+        Counts are formatted as integers and all other statistics are formatted with the given
+        number of decimal places. Missing values are formatted as empty strings.
+
+        :param source: The source name or data frame position to select. If None, all columns
+                       are formatted.
+        :type source: str, int, or None
+        :param precision: The number of decimal places. Defaults to 2.
+        :type precision: int
+        :return: Array of strings with one row per statistic and one column per data column.
+        :rtype: np.ndarray
+        """
+
+        values = self.values[:, self._select(source)]
+        text = np.char.mod(f'%.{precision}f', values).astype(object)
+        if 'count' in self.statistics:
+            row = self.statistics.index('count')
+            text[row] = np.char.mod('%d', values[row]).astype(object)
+        text[np.isnan(values)] = ''
+        return text
+
+    def to_markdown(self, source: Union[str, int, None] = None, precision: int = 2) -> str:
+        """
+        Format the statistics as a Markdown table.
+
+        :param source: The source name or data frame position to select. If None, all columns
+                       are included.
+        :type source: str, int, or None
+        :param precision: The number of decimal places. Defaults to 2.
+        :type precision: int
+        :return: The Markdown table.
+        :rtype: str
+        """
+
+        indices = self._select(source)
+        text = self.format_values(source=source, precision=precision)
+        lines = ['| Statistic | ' + ' | '.join(self.columns[i] for i in indices) + ' |',
+                 '|:--|' + '--:|' * len(indices)]
+        for statistic, row in zip(self.statistics, text):
+            lines.append(f'| {statistic} | ' + ' | '.join(row) + ' |')
+        return '\n'.join(lines) + '\n'
+
+
+def _percentile_label(percentile: float) -> str:
+    """Label a percentile the same way as `pd.DataFrame.describe()`, e.g., 0.25 -> '25%'."""
+    return f'{100 * percentile:g}%'
+
+
+def _source_name(df: pd.DataFrame, position: int) -> str:
+    """Name a data frame by its file name, if known, or by its position."""
+    file_path = df.attrs.get('Filename', None)
+    if file_path:
+        return os.path.basename(file_path)
+    return f'DataFrame {position + 1}'
+
+
+def summary_statistics(data_frames: Union[pd.DataFrame, Sequence[pd.DataFrame]],
+                       percentiles: Sequence[float] = DEFAULT_PERCENTILES) -> SummaryStatistics:
+    """
+    Compute descriptive statistics for many data frames in one vectorized pass.
+
+    The numeric columns of all data frames are packed into one NaN-padded array, which is sorted
+    once. The minimum, maximum, and percentiles (linear interpolation, as in pandas) are taken
+    from the sorted array, and the count, mean, and sample standard deviation ignore NaN values.
+
+    :param data_frames: A data frame or a list of data frames.
+    :type data_frames: pd.DataFrame or Sequence[pd.DataFrame]
+    :param percentiles: The percentiles to compute, between 0 and 1.
+                        Defaults to (0.25, 0.5, 0.75).
+    :type percentiles: Sequence[float]
+    :return: The summary statistics of every numeric column.
+    :rtype: SummaryStatistics
+    """
+
+    if isinstance(data_frames, pd.DataFrame):
+        data_frames = [data_frames]
+
+    percentiles = np.asarray(sorted(percentiles), dtype=np.float64)
+    if np.any((percentiles < 0) | (percentiles > 1)):
+        raise ValueError('Percentiles must be between 0 and 1.')
+
+    statistics = ['count', 'mean', 'std', 'min',
+                  *[_percentile_label(p) for p in percentiles], 'max']
+
+    # Pack the numeric columns of all data frames into one array, padding with NaN
+    numeric_frames = [df.select_dtypes(include='number') for df in data_frames]
+    num_rows = max((len(df) for df in numeric_frames), default=0)
+    num_columns = sum(df.shape[1] for df in numeric_frames)
+    # Single-precision data are packed as float32 and accumulated in float64
+    dtype = np.float32 if all(df.dtypes.eq(np.float32).all() for df in numeric_frames) else np.float64
+    data = np.full((num_rows, num_columns), np.nan, dtype=dtype)
+    sources = []
+    positions = []
+    columns = []
+    start = 0
+    for i, df in enumerate(numeric_frames):
+        stop = start + df.shape[1]
+        data[:len(df), start:stop] = df.to_numpy(dtype=dtype, na_value=np.nan)
+        sources.extend([_source_name(data_frames[i], i)] * df.shape[1])
+        positions.extend([i] * df.shape[1])
+        columns.extend(str(col) for col in df.columns)
+        start = stop
+
+    values = np.full((len(statistics), num_columns), np.nan)
+    if num_columns == 0:
+        return SummaryStatistics(values, statistics, sources, positions, columns)
+
+    # Sorting places NaN values at the end of each column
+    data.sort(axis=0)
+    count = np.count_nonzero(~np.isnan(data), axis=0)
+    valid = count > 0
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(data, axis=0, dtype=np.float64) / count
+        sum_squares = np.nansum((data - mean) ** 2, axis=0, dtype=np.float64)
+        std = np.sqrt(sum_squares / (count - 1))
+    std[count < 2] = np.nan
+
+    # Interpolate the percentiles between the bracketing sorted values
+    last = np.maximum(count - 1, 0)
+    ranks = percentiles[:, np.newaxis] * last
+    lower = np.floor(ranks).astype(np.intp)
+    upper = np.minimum(lower + 1, last)
+    fraction = ranks - lower
+    lower_values = np.take_along_axis(data, lower, axis=0)
+    upper_values = np.take_along_axis(data, upper, axis=0)
+    quantiles = lower_values + (upper_values - lower_values) * fraction
+
+    values[0] = count
+    values[1] = mean
+    values[2] = std
+    values[3] = data[0]
+    values[4:4 + len(percentiles)] = quantiles
+    values[-1] = np.take_along_axis(data, last[np.newaxis, :], axis=0)[0]
+    values[1:, ~valid] = np.nan
+
+    return SummaryStatistics(values, statistics, sources, positions, columns)
+
+
+SKILL_METRICS = ['N', 'ME', 'MAE', 'RMSE', 'NSE', 'KGE', 'R2', 'PBIAS']
+
+
+def align_series(model: pd.Series, observed: pd.Series, tolerance: Union[str, pd.Timedelta] = None,
+                 direction: str = 'nearest') -> pd.DataFrame:
+    """
+    Align model output with observed data on the observation time base.
+
+    Each observation is paired with the nearest model value in time using `pd.merge_asof`,
+    which requires only one pass over the two sorted time indexes. Observations without a model
+    value within the tolerance are dropped, as are missing values.
+
+    :param model: The model time series, with a datetime index.
+    :type model: pd.Series
+    :param observed: The observed time series, with a datetime index.
+    :type observed: pd.Series
+    :param tolerance: The maximum time difference between paired values, e.g., '30min'.
+                      If None, any time difference is accepted.
+    :type tolerance: str or pd.Timedelta, optional
+    :param direction: The merge_asof search direction: 'nearest', 'backward', or 'forward'.
+                      Defaults to 'nearest'.
+    :type direction: str
+    :return: Data frame indexed by the observation times, with Model and Observed columns.
+    :rtype: pd.DataFrame
+    """
+
+    if tolerance is not None:
+        tolerance = pd.Timedelta(tolerance)
+
+    left = pd.DataFrame({'Observed': observed.to_numpy(dtype=np.float64)},
+                        index=pd.DatetimeIndex(observed.index, name='Date'))
+    right = pd.DataFrame({'Model': model.to_numpy(dtype=np.float64)},
+                         index=pd.DatetimeIndex(model.index, name='Date'))
+    left = left[left.index.notna()].sort_index()
+    right = right[right.index.notna() & ~np.isnan(right['Model'].to_numpy())].sort_index()
+
+    aligned = pd.merge_asof(left, right, left_index=True, right_index=True,
+                            tolerance=tolerance, direction=direction)
+    return aligned[['Model', 'Observed']].dropna()
+
+
+class SkillAccumulator:
+    """
+    Streaming accumulator of model-vs-observation skill metrics for many pairs at once.
+
+    Each call to `update()` takes a chunk of paired model and observed values, with one column
+    per model/observation pair, and merges the chunk's means and co-moments into the running
+    totals (Chan et al. parallel update), so the results do not depend on how the data were
+    chunked. NaN values in either array are ignored pair by pair.
+    """
+
+    def __init__(self, num_pairs: int):
+        self.count = np.zeros(num_pairs)
+        self.mean_model = np.zeros(num_pairs)
+        self.mean_observed = np.zeros(num_pairs)
+        self.m2_model = np.zeros(num_pairs)
+        self.m2_observed = np.zeros(num_pairs)
+        self.comoment = np.zeros(num_pairs)
+        self.sum_abs_error = np.zeros(num_pairs)
+
+    def update(self, model: np.ndarray, observed: np.ndarray, pairs: Sequence[int] = None):
+        """
+        Add a chunk of paired values.
+
+        :param model: Model values, with shape (timesteps,) or (timesteps, pairs).
+        :type model: np.ndarray
+        :param observed: Observed values, with the same shape as `model`.
+        :type observed: np.ndarray
+        :param pairs: The positions of the pairs that the chunk columns belong to.
+                      Defaults to all pairs.
+        :type pairs: Sequence[int], optional
+        """
+
+        model = np.asarray(model, dtype=np.float64)
+        observed = np.asarray(observed, dtype=np.float64)
+        if model.shape != observed.shape:
+            raise ValueError('The model and observed arrays must have the same shape.')
+        if model.ndim == 1:
+            model = model[:, np.newaxis]
+            observed = observed[:, np.newaxis]
+
+        valid = ~(np.isnan(model) | np.isnan(observed))
+        model = np.where(valid, model, 0.0)
+        observed = np.where(valid, observed, 0.0)
+
+        count = valid.sum(axis=0).astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_model = np.where(count > 0, model.sum(axis=0) / count, 0.0)
+            mean_observed = np.where(count > 0, observed.sum(axis=0) / count, 0.0)
+        dm = np.where(valid, model - mean_model, 0.0)
+        do = np.where(valid, observed - mean_observed, 0.0)
+        m2_model = np.einsum('ij,ij->j', dm, dm)
+        m2_observed = np.einsum('ij,ij->j', do, do)
+        comoment = np.einsum('ij,ij->j', dm, do)
+        sum_abs_error = np.abs(model - observed).sum(axis=0)
+
+        # Merge the chunk into the running totals
+        pairs = slice(None) if pairs is None else np.asarray(pairs, dtype=np.intp)
+        previous = self.count[pairs]
+        total = previous + count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            weight = np.where(total > 0, previous * count / total, 0.0)
+            fraction = np.where(total > 0, count / total, 0.0)
+        delta_model = mean_model - self.mean_model[pairs]
+        delta_observed = mean_observed - self.mean_observed[pairs]
+        self.mean_model[pairs] += delta_model * fraction
+        self.mean_observed[pairs] += delta_observed * fraction
+        self.m2_model[pairs] += m2_model + delta_model ** 2 * weight
+        self.m2_observed[pairs] += m2_observed + delta_observed ** 2 * weight
+        self.comoment[pairs] += comoment + delta_model * delta_observed * weight
+        self.sum_abs_error[pairs] += sum_abs_error
+        self.count[pairs] = total
+
+    def result(self, names: Sequence[str] = None) -> pd.DataFrame:
+        """
+        Compute the skill metrics from the accumulated values.
+
+        The metrics are the number of pairs (N), mean error (ME), mean absolute error (MAE),
+        root mean square error (RMSE), Nash-Sutcliffe efficiency (NSE), Kling-Gupta efficiency
+        (KGE), coefficient of determination (R2), and percent bias (PBIAS). Errors are model
+        minus observed.
+
+        :param names: Names of the model/observation pairs, used as the index.
+        :type names: Sequence[str], optional
+        :return: Data frame with one row per pair and one column per metric.
+        :rtype: pd.DataFrame
+        """
+
+        n = self.count
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_error = self.mean_model - self.mean_observed
+            # Sum of squared errors from the means and co-moments
+            sse = self.m2_model + self.m2_observed - 2 * self.comoment + n * mean_error ** 2
+            r = self.comoment / np.sqrt(self.m2_model * self.m2_observed)
+            alpha = np.sqrt(self.m2_model / self.m2_observed)
+            beta = self.mean_model / self.mean_observed
+            metrics = {
+                'N': n.astype(np.int64),
+                'ME': mean_error,
+                'MAE': self.sum_abs_error / n,
+                'RMSE': np.sqrt(np.maximum(sse, 0.0) / n),
+                'NSE': 1 - sse / self.m2_observed,
+                'KGE': 1 - np.sqrt((r - 1) ** 2 + (alpha - 1) ** 2 + (beta - 1) ** 2),
+                'R2': r ** 2,
+                'PBIAS': 100 * mean_error / self.mean_observed,
+            }
+        df = pd.DataFrame(metrics, index=names)
+        df.loc[n == 0, SKILL_METRICS[1:]] = np.nan
+        return df
+
+
+def skill_metrics(model: np.ndarray, observed: np.ndarray, names: Sequence[str] = None) -> pd.DataFrame:
+    """
+    Compute skill metrics for one or more model/observation pairs of aligned arrays.
+
+    :param model: Model values, with shape (timesteps,) or (timesteps, pairs).
+    :type model: np.ndarray
+    :param observed: Observed values, with the same shape as `model`.
+    :type observed: np.ndarray
+    :param names: Names of the model/observation pairs, used as the index.
+    :type names: Sequence[str], optional
+    :return: Data frame with one row per pair and one column per metric (see `SKILL_METRICS`).
+    :rtype: pd.DataFrame
+    """
+
+    model = np.asarray(model, dtype=np.float64)
+    accumulator = SkillAccumulator(1 if model.ndim == 1 else model.shape[1])
+    accumulator.update(model, observed)
+    return accumulator.result(names)
+
+
+def evaluate_skill(pairs: dict, tolerance: Union[str, pd.Timedelta] = None,
+                   direction: str = 'nearest') -> pd.DataFrame:
+    """
+    Evaluate skill metrics for many model/observation pairs in one batched call.
+
+    Each pair is aligned with `align_series()`, the aligned values are packed into one NaN-padded
+    array (timesteps x pairs), and all metrics are computed in one vectorized pass.
+
+    :param pairs: Dictionary mapping a pair name to a (model, observed) tuple of time series.
+                  A value may also be an iterable of (model, observed) chunks, which are aligned
+                  and accumulated chunk by chunk.
+    :type pairs: dict
+    :param tolerance: The maximum time difference between paired values, e.g., '30min'.
+    :type tolerance: str or pd.Timedelta, optional
+    :param direction: The merge_asof search direction. Defaults to 'nearest'.
+    :type direction: str
+    :return: Data frame with one row per pair and one column per metric (see `SKILL_METRICS`).
+    :rtype: pd.DataFrame
+    """
+
+    names = list(pairs.keys())
+    aligned = []
+    chunked = {}
+    for i, name in enumerate(names):
+        value = pairs[name]
+        if isinstance(value, tuple) and len(value) == 2 and isinstance(value[0], pd.Series):
+            aligned.append(align_series(value[0], value[1], tolerance=tolerance,
+                                        direction=direction))
+        else:
+            aligned.append(None)
+            chunked[i] = value
+
+    num_rows = max((len(df) for df in aligned if df is not None), default=0)
+    model = np.full((num_rows, len(names)), np.nan)
+    observed = np.full((num_rows, len(names)), np.nan)
+    for i, df in enumerate(aligned):
+        if df is not None:
+            model[:len(df), i] = df['Model'].to_numpy()
+            observed[:len(df), i] = df['Observed'].to_numpy()
+
+    accumulator = SkillAccumulator(len(names))
+    accumulator.update(model, observed)
+
+    # Accumulate chunked pairs one chunk at a time
+    for i, chunks in chunked.items():
+        for model_chunk, observed_chunk in chunks:
+            df = align_series(model_chunk, observed_chunk, tolerance=tolerance,
+                              direction=direction)
+            accumulator.update(df[['Model']].to_numpy(), df[['Observed']].to_numpy(), pairs=[i])
+
+    return accumulator.result(names)
@@ -9,6 +9,8 @@ from typing import List
 from collections import OrderedDict
 import holoviews as hv
 from bokeh.models import HoverTool, DatetimeTickFormatter
+from . import w2_io
+from . import w2_control
 warnings.filterwarnings("ignore")
 
 plt.style.use('seaborn')
@@ -342,16 +344,20 @@ def multi_plot(df: pd.DataFrame, **kwargs) -> plt.Figure:
 #     return myplot
 
 
-def plot_all_files(plot_control_yaml: str, model_path: str, year: int, filetype: str = 'png',
+def plot_all_files(plot_control_yaml: str, model_path: str, year: int = None, filetype: str = 'png',
                    VERBOSE: bool = False):
     """
     Plot all files specified in the plot control YAML file.
 
-    :param plot_control_yaml: Path to the plot control YAML file.
+    If no plot control file is given, the plot control table is generated from the model's
+    control file (w2_con.npt or w2_con.csv) with `w2_control.generate_plot_control()`.
+
+    :param plot_control_yaml: Path to the plot control YAML file, or None to generate the plot
+                              control table from the model's control file.
     :type plot_control_yaml: str
     :param model_path: Path to the model files directory.
     :type model_path: str
-    :param year: Start year of the simulation.
+    :param year: Start year of the simulation. Defaults to the year in the model's control file.
     :type year: int
     :param filetype: Filetype for saving the plots (e.g., 'png', 'pdf', 'svg'). Defaults to 'png'.
     :type filetype: str
@@ -359,8 +365,18 @@ def plot_all_files(plot_control_yaml: str, model_path: str, year: int, filetype:
     :type VERBOSE: bool
     """
 
-    # Read the plot control file
-    control_df = read_plot_control(plot_control_yaml)
+    # Read or generate the plot control file
+    if plot_control_yaml is None or year is None:
+        control_file_path = w2_control.find_w2_control(model_path)
+        if control_file_path is None:
+            raise ValueError(f'No control file found for {model_path}')
+    if plot_control_yaml is None:
+        control_df = w2_control.generate_plot_control(control_file_path)
+        model_path = os.path.dirname(control_file_path)
+    else:
+        control_df = w2_io.read_plot_control(plot_control_yaml)
+    if year is None:
+        year = w2_control.read_w2_control(control_file_path).year
 
     # Iterate over the data frame, plot each file, and save
     # an image file next to each data file in the model
@@ -376,7 +392,7 @@ def plot_all_files(plot_control_yaml: str, model_path: str, year: int, filetype:
         inpath = os.path.join(model_path, filename)
         if VERBOSE:
             print(f'Reading {inpath}')
-        df = read(inpath, year, columns)
+        df = w2_io.read(inpath, year, columns)
 
         # Plot the data
         plots = []
@@ -4,6 +4,7 @@ from typing import List
 from docx.shared import Pt, Inches, Cm
 from typing import List
 import pandas as pd
+import cequalw2 as w2
 
 
 def change_orientation(document, orientation: str):
@@ -132,12 +133,12 @@ def generate_report(data_frames: List[pd.DataFrame], **kwargs) -> docx.Document:
     doc.add_heading("Data Summary", level=1)
     doc.add_paragraph("Summary Statistics:")
 
-    for df in data_frames:
-        # Compute summary statistics for the current dataframe
-        summary_statistics = df.describe().to_dict()
-        col1 = df.columns[0]
-        dict1 = summary_statistics[col1]
-        keys = dict1.keys()
+    # Compute summary statistics for all data frames at once
+    summary = w2.summary_statistics(data_frames)
+
+    for i, df in enumerate(data_frames):
+        cell_text = summary.format_values(source=i, precision=1)
+        columns = summary.to_frame(source=i).columns
 
         # Add sub-heading for data filename
         file_path = df.attrs['Filename']
@@ -145,7 +146,7 @@ def generate_report(data_frames: List[pd.DataFrame], **kwargs) -> docx.Document:
         doc.add_heading(filename, level=2)
 
         # Create a table for summary statistics
-        table = doc.add_table(rows=1, cols=len(df.columns) + 1)
+        table = doc.add_table(rows=1, cols=len(columns) + 1)
         # table.autofit = True
         table.style = "Table Grid"
 
@@ -154,25 +155,24 @@ def generate_report(data_frames: List[pd.DataFrame], **kwargs) -> docx.Document:
         cell = table_header_cells[0]
         cell.text = "Statistic"
         format_cell(cell, table_font_size=table_font_size, bold=True, alignment='left')
-        for j, col in enumerate(df.columns):
+        for j, col in enumerate(columns):
             cell = table_header_cells[j + 1]
             cell.text = col
             format_cell(cell, table_font_size=table_font_size, bold=True, alignment='center')
 
         # Populate tabble
-        for i, key in enumerate(keys):
+        for key, row_text in zip(summary.statistics, cell_text):
             row = table.add_row().cells
             cell = row[0]
             cell.text = key
             format_cell(cell, table_font_size=table_font_size, bold=False, alignment='left')
-            for j, col in enumerate(df.columns):
-                d = summary_statistics[col][key]
+            for j, value_text in enumerate(row_text):
                 cell = row[j + 1]
-                cell.text = f'{d:.1f}'
+                cell.text = value_text
                 format_cell(cell, table_font_size=table_font_size, bold=False, alignment='right')
 
         widths = [Inches(0.1)]
-        for col in df.columns:
+        for col in columns:
             widths.append(Inches(0.1))
         set_col_widths(table, widths)
 
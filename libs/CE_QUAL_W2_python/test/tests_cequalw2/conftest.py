@@ -0,0 +1,26 @@
+# Test configuration of the cequalw2 package
+
+import os
+import sys
+import types
+
+import pytest
+
+TEST_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_PATH = os.path.join(os.path.dirname(TEST_PATH), 'src')
+sys.path.insert(0, SRC_PATH)
+
+try:
+    import cequalw2  # noqa: F401
+except OSError:
+    # The package __init__ imports the plotting modules, which use a matplotlib style that newer
+    # matplotlib versions removed; the modules under test are loaded without the __init__
+    package = types.ModuleType('cequalw2')
+    package.__path__ = [os.path.join(SRC_PATH, 'cequalw2')]
+    sys.modules['cequalw2'] = package
+
+
+@pytest.fixture
+def model_path():
+    """The BerlinMilton2006 model directory of the test data."""
+    return os.path.join(TEST_PATH, 'data', 'BerlinMilton2006')
@@ -0,0 +1,48 @@
+# Tests of the bathymetry reader and storage computations
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cequalw2 import w2_bathymetry
+
+
+@pytest.fixture
+def bathymetry(model_path):
+    return w2_bathymetry.read_bathymetry(os.path.join(model_path, 'bathym_Berlin_add.npt'))
+
+
+def test_read_bathymetry(bathymetry):
+    assert (bathymetry.num_layers, bathymetry.num_segments) == (43, 55)
+    assert bathymetry.widths.shape == (43, 55)
+    assert bathymetry.curve_elevations[0] == 0.0
+    np.testing.assert_allclose(bathymetry.curve_elevations[-1], bathymetry.h[:-1].sum())
+    assert np.all(np.diff(bathymetry.curve_volumes) >= 0)
+    np.testing.assert_allclose(bathymetry.curve_volumes[-1], bathymetry.cell_volumes[:-1].sum())
+
+
+def test_elevations_outside_the_grid_are_nan_everywhere(bathymetry):
+    top = bathymetry.curve_elevations[-1]
+    elevation = np.array([-1.0, 0.0, 5.3, top, top + 1.0, np.nan])
+    result = w2_bathymetry.storage(bathymetry, elevation)
+
+    np.testing.assert_allclose(bathymetry.volume(elevation), result['Volume'])
+    np.testing.assert_allclose(bathymetry.area(elevation), result['Area'])
+    assert bathymetry.in_range(elevation).tolist() == [False, True, True, True, False, False]
+    assert result['Volume'].isna().tolist() == [True, False, False, False, True, True]
+    assert np.isnan(bathymetry.volume(-1.0))
+
+
+def test_model_storage_by_segment(model_path):
+    bathymetry = w2_bathymetry.read_model_bathymetry(os.path.join(model_path, 'w2_con.npt'))
+    assert [b.ebot for b in bathymetry] == [289.41, 265.63]
+
+    levels = w2_bathymetry.read_water_levels(os.path.join(model_path, 'wl.opt'))
+    by_segment = w2_bathymetry.segment_storage(bathymetry[0], levels)
+    whole = w2_bathymetry.storage(bathymetry[0], pd.Series(levels[7]))
+    assert by_segment.index.equals(levels.index)
+    # the water surface is nearly level on the first day
+    np.testing.assert_allclose(by_segment['Volume'].iloc[0], whole['Volume'].iloc[0], rtol=1e-3)
+    np.testing.assert_allclose(by_segment['Area'].iloc[0], whole['Area'].iloc[0])
@@ -0,0 +1,59 @@
+# Tests of the memory-mapped column cache
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cequalw2 import w2_cache
+from cequalw2 import w2_io
+
+
+@pytest.fixture
+def infile(model_path, tmp_path):
+    """A copy of a model input file, so that the cache is written under the temporary directory."""
+    path = str(tmp_path / '2006_DeerCrk_Qin.npt')
+    shutil.copy(os.path.join(model_path, '2006_DeerCrk_Qin.npt'), path)
+    return path
+
+
+def test_cached_read_matches_read(infile):
+    expected = w2_io.read(infile, 2006, w2_io.get_data_columns(infile),
+                          skiprows=w2_io.get_header_row_number(infile) + 1)
+    first = w2_cache.cached_read(infile, 2006)
+    second = w2_cache.cached_read(infile, 2006)
+
+    assert first.attrs['Filename'] == second.attrs['Filename']
+    np.testing.assert_array_equal(second.index, expected.index)
+    np.testing.assert_array_equal(second.to_numpy(), expected.to_numpy())
+
+
+def test_read_options_have_separate_entries(infile):
+    single = w2_cache.cached_read(infile, 2006, dtype=np.float32)
+    double = w2_cache.cached_read(infile, 2006, dtype=np.float64)
+    assert single.attrs['Filename'] != double.attrs['Filename']
+
+    # both entries stay valid, and the arrays of the first are not replaced by the second read
+    assert w2_cache.cached_read(infile, 2006, dtype=np.float32).attrs['Filename'] == single.attrs['Filename']
+    assert single.dtypes.eq(np.float32).all()
+    np.testing.assert_allclose(single.to_numpy(), double.to_numpy(), rtol=1e-6)
+
+
+def test_changed_file_replaces_its_entry(tmp_path):
+    infile = str(tmp_path / 'flow.npt')
+    df = pd.DataFrame({'Q': [1.0, 2.0, 3.0]}, index=pd.Index([1.0, 2.0, 3.0], name='JDAY'))
+    w2_io.write_npt(df, infile)
+    first = w2_cache.cached_read(infile, None)
+    assert first['Q'].tolist() == [1.0, 2.0, 3.0]
+
+    w2_io.write_npt(df * 2, infile)
+    os.utime(infile, ns=(0, os.stat(infile).st_mtime_ns + 10 ** 9))
+    second = w2_cache.cached_read(infile, None)
+    assert second['Q'].tolist() == [2.0, 4.0, 6.0]
+    assert second.attrs['Filename'] == first.attrs['Filename']
+
+    cache_dir = w2_cache.default_cache_directory(infile)
+    w2_cache.clear_cache(cache_dir)
+    assert not os.path.isdir(cache_dir)
@@ -0,0 +1,83 @@
+# Tests of the ensemble comparison
+
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from cequalw2 import w2_compare
+
+SELECTOR = 'tsr_1_seg37.csv:T2(C)'
+
+
+@pytest.fixture
+def run_dirs(model_path, tmp_path):
+    """Three runs: the test model, a run that stopped early, and a run with other temperatures."""
+    paths = {}
+    for run, source in [('base', 'tsr_1_seg37.csv'), ('short', 'tsr_1_seg37.csv'), ('other', 'tsr_2_seg75.csv')]:
+        path = tmp_path / run
+        os.makedirs(path)
+        shutil.copy(os.path.join(model_path, 'w2_con.npt'), path)
+        shutil.copy(os.path.join(model_path, source), path / 'tsr_1_seg37.csv')
+        shutil.copy(os.path.join(model_path, 'two_37_wdo.csv'), path)
+        paths[run] = str(path)
+    with open(tmp_path / 'short' / 'tsr_1_seg37.csv') as f:
+        lines = f.readlines()
+    with open(tmp_path / 'short' / 'tsr_1_seg37.csv', 'w') as f:
+        f.writelines(lines[:400])
+    return paths
+
+
+def test_parse_selector():
+    assert w2_compare.parse_selector('tsr_1_seg37.csv: T2(C)') == ('tsr_1_seg37.csv', 'T2(C)')
+    assert w2_compare.parse_selector('two_37_wdo.csv:T(C)') == ('two_37_wdo.csv', 'T(C)')
+    for selector in ['tsr_1_seg37.csv', ':T2(C)', 'tsr_1_seg37.csv:']:
+        with pytest.raises(ValueError, match='Invalid variable selector'):
+            w2_compare.parse_selector(selector)
+
+
+@pytest.mark.parametrize('selector', [SELECTOR, 'two_37_wdo.csv:T(C)'])
+def test_load_run_column(run_dirs, selector):
+    cached = w2_compare.load_run_column(run_dirs['base'], selector, 2006)
+    parsed = w2_compare.load_run_column(run_dirs['base'], selector, 2006, use_cache=False)
+    assert cached.name == 'base'
+    assert cached.index.is_unique
+    np.testing.assert_array_equal(cached.index, parsed.index)
+    np.testing.assert_allclose(cached.to_numpy(), parsed.to_numpy())
+
+    float32 = w2_compare.load_run_column(run_dirs['base'], selector, 2006, use_cache=False, dtype=np.float32)
+    assert float32.dtype == np.float32
+    for use_cache in [True, False]:
+        with pytest.raises(ValueError, match='not found'):
+            w2_compare.load_run_column(run_dirs['base'], selector.split(':')[0] + ':missing', 2006,
+                                       use_cache=use_cache)
+
+
+def test_compare_runs(run_dirs):
+    runs, envelope = w2_compare.compare_runs(list(run_dirs.values()), SELECTOR, max_workers=3)
+    base = w2_compare.load_run_column(run_dirs['base'], SELECTOR, 2006)
+    other = w2_compare.load_run_column(run_dirs['other'], SELECTOR, 2006)
+
+    assert runs.columns.tolist() == ['base', 'short', 'other']
+    assert runs.index.equals(base.index.union(other.index))
+    assert runs.attrs['Selector'] == SELECTOR
+    np.testing.assert_array_equal(runs['base'].dropna().to_numpy(), base.to_numpy())
+    # the short run has no values after it stopped
+    short = runs['short']
+    assert short.notna().sum() < base.size and short.loc[short.last_valid_index():].iloc[1:].isna().all()
+
+    values = runs.to_numpy()
+    np.testing.assert_array_equal(envelope['Count'], np.isfinite(values).sum(axis=1))
+    rows = envelope['Count'] > 0
+    np.testing.assert_allclose(envelope['Mean'][rows], np.nanmean(values[rows.to_numpy()], axis=1))
+    assert envelope['Std'][envelope['Count'] == 1].isna().all()
+    assert (envelope['Min'][rows] <= envelope['P50'][rows]).all()
+    assert (envelope['P50'][rows] <= envelope['Max'][rows]).all()
+    assert envelope.columns.tolist() == ['Count', 'Min', 'Max', 'Mean', 'Std', 'P5', 'P25', 'P50', 'P75', 'P95']
+
+    runs, envelope = w2_compare.compare_runs({'a': run_dirs['base']}, SELECTOR, percentiles=[])
+    assert runs.columns.tolist() == ['a']
+    assert envelope['Std'].isna().all() and 'P50' not in envelope
+    with pytest.raises(ValueError, match='No run directories'):
+        w2_compare.load_runs([], SELECTOR)
@@ -0,0 +1,72 @@
+# Tests of the control file parser
+
+import os
+import shutil
+
+import pytest
+
+from cequalw2 import w2_control
+
+
+@pytest.fixture
+def control(model_path):
+    return w2_control.read_w2_control(os.path.join(model_path, 'w2_con.npt'))
+
+
+def test_read_w2_control(control):
+    assert (control.year, control.tmstrt, control.tmend) == (2006, 1.0, 366.0)
+    assert (control.num_waterbodies, control.num_branches, control.num_segments, control.num_layers) == (2, 5, 76, 43)
+    assert control.values('US') == [2, 40, 46, 51, 57]
+    assert control.branches.loc['BR2', 'DHS'] == 20
+    assert control.waterbodies['EBOT'].tolist() == [289.41, 265.63]
+    assert control.active_constituents[:3] == ['TDS', 'G1_SO4', 'G2_Cl']
+    assert control.get('UNDEFINED', 'default') == 'default'
+
+
+def test_file_names(control):
+    assert control.file_names('BTHFN') == ['bathym_Berlin_add.npt', 'bathym_Milton_add.npt']
+    assert control.file_names('METFN') == ['2006_Met.npt', '2006_Met1.npt']
+    assert len(control.file_names('QINFN')) == 4
+
+
+def test_read_w2_control_is_cached_until_the_file_changes(model_path, tmp_path):
+    path = str(tmp_path / 'w2_con.npt')
+    shutil.copy(os.path.join(model_path, 'w2_con.npt'), path)
+    first = w2_control.read_w2_control(path)
+    assert w2_control.read_w2_control(path) is first
+    assert w2_control.get_model_year(str(tmp_path)) == 2006
+
+    with open(path, 'a') as f:
+        f.write('\n')
+    assert w2_control.read_w2_control(path) is not first
+    # output directories find the control file of their parent
+    assert w2_control.find_w2_control(str(tmp_path / 'outputs')) == path
+
+
+def test_generate_plot_control(model_path):
+    control_df = w2_control.generate_plot_control(os.path.join(model_path, 'w2_con.npt'))
+
+    assert control_df.loc['MET_WB1', 'Filename'] == '2006_Met.npt'
+    assert control_df.loc['MET_WB1', 'Columns'][0] == 'Air Temperature'
+    assert control_df.loc['MET_WB1', 'PlotType'] == 'subplots'
+    assert control_df.loc['QIN_BR1', 'Columns'] == ['Inflow (QIN)']
+    assert control_df.loc['QIN_BR1', 'PlotType'] == 'combined'
+    assert all(os.path.isfile(os.path.join(model_path, filename)) for filename in control_df['Filename'])
+
+    # each call returns its own copy, including the lists of columns
+    control_df.loc['QIN_BR1', 'Columns'].append('changed')
+    assert w2_control.generate_plot_control(os.path.join(model_path, 'w2_con.npt')).loc['QIN_BR1', 'Columns'] == \
+        ['Inflow (QIN)']
+
+
+def test_generate_plot_control_tracks_input_files(model_path, tmp_path, capsys):
+    path = str(tmp_path / 'w2_con.npt')
+    shutil.copy(os.path.join(model_path, 'w2_con.npt'), path)
+    shutil.copy(os.path.join(model_path, '2006_DeerCrk_Qin.npt'), tmp_path)
+
+    first = w2_control.generate_plot_control(path)
+    assert first.index.tolist() == ['QIN_BR1']
+    assert 'Skipping 2006_Met.npt: file not found' in capsys.readouterr().out
+
+    shutil.copy(os.path.join(model_path, '2006_Met.npt'), tmp_path)
+    assert w2_control.generate_plot_control(path).index.tolist() == ['MET_WB1', 'QIN_BR1']
@@ -0,0 +1,47 @@
+# Tests of the warning and error log readers
+
+import os
+
+import numpy as np
+
+from cequalw2 import w2_diagnostics
+
+
+def test_negative_depth_reports_are_counted_once(model_path):
+    df = w2_diagnostics.read_diagnostics(os.path.join(model_path, 'w2.wrn'))
+    negative_depth = df[df['Category'] == 'negative_depth']
+
+    assert len(negative_depth) == 748
+    first = negative_depth.iloc[0]
+    assert (first['Line'], first['JDAY'], first['Segment'], first['Value']) == (3, 1.108, 11, -0.097)
+    assert 'time step reduced' in first['Message']
+    assert not negative_depth['Message'].str.startswith('time step reduced').any()
+    assert (df['Category'] == 'timestep').sum() == 750
+
+
+def test_messages_keep_the_segment_of_their_context(tmp_path):
+    infile = str(tmp_path / 'w2.wrn')
+    with open(infile, 'w') as f:
+        f.write('Computational warning at Julian day = 2.500 at segment 7\n'
+                '  time step reduced to 1.500 s on day 2.510 at iteration 3\n'
+                'Computational warning at Julian day = 3.000\n'
+                ' timestep = .450 sec: DLT<DLTMIN set DLT=DLTMIN\n')
+
+    df = w2_diagnostics.read_diagnostics(infile)
+    assert df['Category'].tolist() == ['timestep', 'timestep']
+    assert df['JDAY'].tolist() == [2.51, 3.0]
+    assert df['Segment'].iloc[0] == 7
+    assert df['Segment'].isna().iloc[1]
+    assert df['Value'].iloc[0] == 1.5
+
+
+def test_model_diagnostics_summary(model_path):
+    df = w2_diagnostics.read_model_diagnostics(model_path)
+    assert set(df['File']) == {'pre.wrn', 'w2.wrn'}
+    assert (df.loc[df['File'] == 'pre.wrn', 'Category'] == 'constituent').sum() == 118
+
+    summary = w2_diagnostics.summarize_diagnostics(df, interval=None)
+    counts = summary.groupby('Category')['Count'].sum()
+    assert counts['negative_depth'] == 749
+    assert np.isclose(summary.loc[summary['Category'] == 'negative_depth', 'MinValue'].min(),
+                      df.loc[df['Category'] == 'negative_depth', 'Value'].min())
@@ -0,0 +1,79 @@
+# Tests of the local ensemble runner
+
+import os
+import shutil
+import sys
+
+import h5py
+import pandas as pd
+import pytest
+
+from cequalw2 import w2_ensemble
+
+# A stand-in for the model: it writes the outputs of the test model, with or without warnings,
+# or fails, as told by the file mode.txt in the run directory
+STAND_IN_MODEL = '''\
+import shutil, sys
+mode = open('mode.txt').read().strip()
+if mode == 'fail':
+    sys.exit(2)
+shutil.copy(sys.argv[1], '.')
+if mode == 'warn':
+    shutil.copy(sys.argv[2], '.')
+'''
+
+
+@pytest.fixture
+def model_dir(model_path, tmp_path):
+    """A base model directory with an input file, an old output file, and the run mode."""
+    path = tmp_path / 'base'
+    os.makedirs(path)
+    for filename in ['w2_con.npt', '2006_Met.npt', 'tsr_1_seg37.csv']:
+        shutil.copy(os.path.join(model_path, filename), path)
+    (path / 'mode.txt').write_text('ok')
+    for mode in ['warn', 'fail']:
+        (tmp_path / f'{mode}.txt').write_text(mode)
+    (tmp_path / 'model.py').write_text(STAND_IN_MODEL)
+    return path
+
+
+def test_clone_model(model_dir, tmp_path):
+    run_path = tmp_path / 'run'
+    counts = w2_ensemble.clone_model(str(model_dir), str(run_path), overrides={'mode.txt': str(tmp_path / 'warn.txt')})
+
+    assert sorted(os.listdir(run_path)) == ['2006_Met.npt', 'mode.txt', 'w2_con.npt']
+    assert counts['copy'] >= 1 and sum(counts.values()) == 3
+    assert (run_path / 'mode.txt').read_text() == 'warn'
+    assert (model_dir / 'mode.txt').read_text() == 'ok'
+
+    counts = w2_ensemble.clone_model(str(model_dir), str(run_path), mode='copy')
+    assert counts == {'copy': 3}
+    assert (run_path / 'mode.txt').read_text() == 'ok'
+    with pytest.raises(ValueError, match='Invalid clone mode'):
+        w2_ensemble.clone_model(str(model_dir), str(run_path), mode='symlink')
+
+
+def test_run_ensemble(model_path, model_dir, tmp_path):
+    workdir = tmp_path / 'work'
+    command = [sys.executable, str(tmp_path / 'model.py'), os.path.join(model_path, 'tsr_1_seg37.csv'),
+               os.path.join(model_path, 'w2.wrn')]
+    ensemble = w2_ensemble.Ensemble(str(model_dir), str(workdir), command=command, max_concurrent=2)
+    assert ensemble.year == 2006
+    ensemble.add_run('ok')
+    ensemble.add_run('warn', {'mode.txt': str(tmp_path / 'warn.txt')})
+    ensemble.add_run('fail', {'mode.txt': str(tmp_path / 'fail.txt')})
+    with pytest.raises(ValueError, match='already added'):
+        ensemble.add_run('ok')
+
+    status = ensemble.run().set_index('Run')
+    assert status.loc[['ok', 'warn', 'fail'], 'Status'].tolist() == ['completed', 'warnings', 'failed']
+    assert status.loc['fail', 'ReturnCode'] == 2
+    assert status.loc['warn', 'Warnings'] > 0
+    written = pd.read_csv(workdir / w2_ensemble.RUN_STATUS_FILE).set_index('Run')
+    assert written['Status'].to_dict() == status['Status'].to_dict()
+
+    with h5py.File(ensemble.store, 'r') as f:
+        assert sorted(f) == ['ok', 'warn']
+        assert list(f['ok']) == ['tsr_1_seg37']
+    # finished runs are not executed again
+    assert len(ensemble.run()) == 3
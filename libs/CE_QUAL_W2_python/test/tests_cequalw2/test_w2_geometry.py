@@ -0,0 +1,51 @@
+# Tests of the segment spatial index
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cequalw2 import w2_geometry
+
+
+@pytest.fixture
+def index():
+    """Two segments whose polygons meet closer to the second segment center than to the first."""
+    centers = pd.DataFrame({'Segment': [2, 3], 'Branch': [1, 1], 'Distance': [0.0, 10.0], 'X': [0.0, 10.0],
+                            'Y': [0.0, 0.0], 'UTMZone': [17, 17], 'BottomElevation': [300.0, 299.0]})
+    vertices = np.array([[[-5, -5], [7, -5], [7, 5], [-5, 5], [-5, -5]],
+                         [[7, -5], [15, -5], [15, 5], [7, 5], [7, -5]]], dtype=float)
+    return w2_geometry.SegmentIndex(centers, np.array([2, 3]), vertices)
+
+
+def test_build_segment_index(model_path):
+    index = w2_geometry.build_segment_index(model_path)
+    segments, branches, vertices = w2_geometry.read_polygons(f'{model_path}/Polygon.bln')
+
+    assert len(index.segments) == 66
+    assert vertices.shape == (66, 5, 2)
+    assert (segments[:3].tolist(), branches[0]) == ([2, 3, 4], 1)
+    # points at the segment centers are assigned to their own segment, except the head of branch 2
+    # (segment 40), whose polygon has zero width and whose center lies in the polygon of segment 37
+    located = index.locate(index.centers['X'], index.centers['Y'])
+    moved = located['Segment'].to_numpy() != index.segments
+    assert index.segments[moved].tolist() == [40]
+    assert located.loc[moved, 'Segment'].tolist() == [37]
+
+
+def test_polygons_take_precedence_over_distance(index):
+    located = index.locate([6.0, 12.0, 30.0], [0.0, 1.0, 0.0])
+    assert located['Segment'].tolist() == [2, 3, 3]
+    assert located['InPolygon'].tolist() == [True, True, False]
+    np.testing.assert_allclose(located['Distance'], [6.0, np.hypot(2.0, 1.0), 20.0])
+
+    limited = index.locate([6.0, 30.0], [0.0, 0.0], max_distance=10.0)
+    assert limited['Segment'].iloc[0] == 2
+    assert pd.isna(limited['Segment'].iloc[1])
+
+
+def test_locate_observations(index):
+    observations = pd.DataFrame({'Site': ['a', 'b'], 'X': [1.0, 14.0], 'Y': [0.0, 0.0]}, index=[5, 7])
+    located = w2_geometry.locate_observations(observations, index)
+    assert located.index.tolist() == [5, 7]
+    assert located['Site'].tolist() == ['a', 'b']
+    assert located['Segment'].tolist() == [2, 3]
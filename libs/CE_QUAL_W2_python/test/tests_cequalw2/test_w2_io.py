@@ -0,0 +1,133 @@
+# Tests of the w2_io readers and writers
+
+import os
+import sqlite3
+
+import h5py
+import numpy as np
+import pandas as pd
+import pytest
+
+from cequalw2 import w2_io
+
+
+def test_read_wdo_keeps_all_header_columns_of_interleaved_file(model_path, capsys):
+    df = w2_io.read_wdo(os.path.join(model_path, 'cwo_str1_seg75_wdo.csv'))
+
+    assert list(df.columns) == ['TDS', 'G1_SO4', 'G2_Cl', 'ISS1', 'PO4', 'NH4', 'NO3', 'FE', 'LDOM', 'RDOM',
+                                'LPOM', 'RPOM', 'BG', 'DIAT', 'OTH', 'DO']
+    # the rows of 4 values between the rows of 16 constituents are skipped
+    assert df.loc[1.0, 'TDS'] == 190.0
+    assert df.loc[1.0, 'DO'] == 11.0
+    assert df.index.is_unique
+    assert 'Skipped' in capsys.readouterr().out
+
+
+def test_read_wdo_names_outlet_columns_of_flow_and_temperature_files(model_path):
+    combined = w2_io.read_wdo(os.path.join(model_path, 'two_75_wdo.csv'))
+    assert list(combined.columns) == ['T(C)', 'T(C)_1', 'T(C)_2']
+
+    # the header has no trailing comma, so the interleaved rows of 16 values add no columns
+    single = w2_io.read_wdo(os.path.join(model_path, 'two_str1_seg75_wdo.csv'))
+    assert list(single.columns) == ['T(C)']
+    assert single.iloc[0, 0] == pytest.approx(1.40)
+
+
+def test_read_wdo_rejects_rows_without_the_header_columns(tmp_path):
+    infile = tmp_path / 'cwo_1_wdo.csv'
+    infile.write_text('$Concentration file for segment 1\n\nJDAY,TDS,DO,\n1.000,1.0,\n1.042,2.0,\n')
+    with pytest.raises(ValueError):
+        w2_io.read_wdo(str(infile))
+
+
+def test_read_wdo_family_aligns_the_kinds(model_path):
+    df = w2_io.read_wdo_family(model_path, '37', dtype=np.float32)
+    assert list(df.columns.get_level_values('Kind').unique()) == ['qwo', 'two', 'cwo', 'dwo']
+    assert df[('cwo', 'DO')].dtype == np.float32
+    assert df.index.is_monotonic_increasing
+
+
+def test_read_sqlite_masks_sentinels(tmp_path):
+    infile = str(tmp_path / 'observed.db')
+    with sqlite3.connect(infile) as db:
+        db.execute('create table flow (Date text, Q real, Count integer)')
+        db.executemany('insert into flow values (?, ?, ?)',
+                       [('2006-01-01 00:00', 1.5, 3), ('2006-01-01 01:00', -999999.0, -999999)])
+
+    df = w2_io.read_sqlite(infile, na_values=[w2_io.USGS_SENTINEL])
+    assert df['Q'].tolist()[0] == 1.5
+    assert df[['Q', 'Count']].iloc[1].isna().all()
+
+
+def test_read_hdf_masks_sentinels(tmp_path):
+    infile = str(tmp_path / 'series.h5')
+    with h5py.File(infile, 'w') as f:
+        f.create_dataset('run/Date', data=[b'2006-01-01 00:00', b'2006-01-01 01:00'])
+        f.create_dataset('run/T', data=np.array([1.5, -99.0]))
+
+    df = w2_io.read_hdf('run', infile, ['T'], na_values=[-99], dtype=np.float32)
+    assert df['T'].dtype == np.float32
+    assert df['T'].iloc[0] == 1.5
+    assert np.isnan(df['T'].iloc[1])
+
+
+def test_write_npt_round_trip_keeps_precision(tmp_path):
+    values = [-0.00035, -1303.2, 12345678.0, 0.0, 21.25, 7.06e-08, 123456789.0, 9999.9996, 0.012345]
+    df = pd.DataFrame({'Q': values}, index=pd.Index(np.arange(len(values)) + 1.5, name='JDAY'))
+    outfile = str(tmp_path / 'q.npt')
+    w2_io.write_npt(df, outfile)
+
+    lines = open(outfile).read().splitlines()
+    assert all(len(line) == 16 for line in lines[3:])
+    assert lines[4][8:] == '-1303.20'
+    result = w2_io.read(outfile, None, ['Q'])
+    np.testing.assert_allclose(result.index, df.index)
+    np.testing.assert_allclose(result['Q'], values, rtol=5e-3)
+
+
+def test_write_npt_rejects_or_fills_missing_values(tmp_path):
+    df = pd.DataFrame({'T': [10.0, np.nan, 12.0]}, index=pd.Index([1.0, 2.0, 3.0], name='JDAY'))
+    outfile = str(tmp_path / 't.npt')
+    with pytest.raises(ValueError, match='missing values'):
+        w2_io.write_npt(df, outfile)
+
+    w2_io.write_npt(df, outfile, fill_value=-99.0)
+    assert open(outfile).read().splitlines()[4] == '   2.000 -99.000'
+    assert np.isnan(df['T'].iloc[1])
+
+
+def test_write_w2_csv_matches_pandas(tmp_path):
+    df = pd.DataFrame({'A': [-0.0001, np.nan, 2.0, 1303.2], 'B': [1.0, 2.5, -3.25, 4.0]},
+                      index=pd.Index([1.0, 1.5, 2.0, 2.5], name='JDAY'))
+    outfile = str(tmp_path / 'fast.csv')
+    w2_io.write_w2_csv(df, outfile)
+
+    expected = '$\n\n' + df.to_csv(float_format='%.3f', lineterminator='\n')
+    assert open(outfile).read() == expected
+
+
+def test_float32_readers_keep_the_date_index(model_path):
+    for filename in ['2006_Met.npt', 'tsr_1_seg37.csv']:
+        infile = os.path.join(model_path, filename)
+        columns = w2_io.get_data_columns(infile)
+        skiprows = w2_io.get_header_row_number(infile) + 1
+        double = w2_io.read(infile, 2006, columns, skiprows=skiprows)
+        single = w2_io.read(infile, 2006, columns, skiprows=skiprows, dtype=np.float32)
+
+        assert single.dtypes.eq(np.float32).all()
+        assert single.index.equals(double.index)
+        np.testing.assert_allclose(single.to_numpy(dtype=float), double.to_numpy(dtype=float), rtol=1e-6)
+
+
+def test_write_hdf_stores_float32(model_path, tmp_path):
+    infile = os.path.join(model_path, 'tsr_1_seg37.csv')
+    df = w2_io.read(infile, 2006, w2_io.get_data_columns(infile), skiprows=w2_io.get_header_row_number(infile) + 1)
+    df = df[['ELWS(m)', 'T2(C)']]
+    outfile = str(tmp_path / 'tsr.h5')
+    w2_io.write_hdf(df, 'tsr', outfile, dtype=np.float32)
+
+    with h5py.File(outfile, 'r') as f:
+        assert f['tsr/T2(C)'].dtype == np.float32
+    result = w2_io.read_hdf('tsr', outfile, ['ELWS(m)', 'T2(C)'])
+    assert result['T2(C)'].dtype == np.float32
+    np.testing.assert_allclose(result.to_numpy(dtype=float), df.to_numpy(), rtol=1e-6)
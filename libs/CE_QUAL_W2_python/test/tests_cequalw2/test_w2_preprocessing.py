@@ -0,0 +1,58 @@
+# Tests of the USGS-to-W2 input converter
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cequalw2 import w2_io, w2_preprocessing
+
+TIME_BASE = pd.date_range('2006-01-01', periods=25, freq='h')
+
+
+def _record(flow, temperature=None):
+    """A 15-minute USGS record with constant values, in the time zone of the model."""
+    index = pd.date_range('2006-01-01', '2006-01-02 06:00', freq='15min')
+    df = pd.DataFrame({'00060_Mean': flow}, index=index)
+    if temperature is not None:
+        df['00010_Mean'] = temperature
+    return df
+
+
+@pytest.fixture
+def records():
+    return {'12194000': _record(100.0, 10.0), '12193400': _record(60.0, 5.0)}
+
+
+def test_usgs_to_w2_writes_lateral_inflow(records, tmp_path):
+    pairs = [{'Name': 'lateral', 'Downstream': '12194000', 'Upstream': ['12193400'], 'Parameters': ['00060', '00010']},
+             {'Name': 'upstream', 'Downstream': '12193400', 'Parameters': ['00060']}]
+    manifest = w2_preprocessing.usgs_to_w2(records, pairs, str(tmp_path), time_base=TIME_BASE, year=2006)
+
+    assert manifest['Filename'].tolist() == ['lateral_Q.npt', 'lateral_T.npt', 'upstream_Q.npt']
+    assert (manifest['Missing'] == 0).all()
+    flow = w2_io.read(str(tmp_path / 'lateral_Q.npt'), 2006, ['Q'])
+    np.testing.assert_allclose(flow['Q'], 40.0 * w2_preprocessing.CFS_TO_CMS, atol=1e-3)
+    # (100 * 10 - 60 * 5) / 40
+    temperature = w2_io.read(str(tmp_path / 'lateral_T.npt'), 2006, ['T'])
+    np.testing.assert_allclose(temperature['T'], 17.5)
+
+
+def test_parameters_with_the_same_w2_name_are_rejected(records, tmp_path):
+    pairs = [{'Name': 'up', 'Downstream': '12193400', 'Parameters': ['00060', '00061']}]
+    with pytest.raises(ValueError, match='00061'):
+        w2_preprocessing.usgs_to_w2(records, pairs, str(tmp_path), time_base=TIME_BASE, year=2006)
+    assert os.listdir(tmp_path) == []
+
+
+def test_parameters_missing_from_the_records_are_rejected(records, tmp_path):
+    pairs = [{'Name': 'up', 'Downstream': '12193400', 'Parameters': ['00060', '00300']}]
+    with pytest.raises(ValueError, match='00300 at 12193400'):
+        w2_preprocessing.usgs_to_w2(records, pairs, str(tmp_path), time_base=TIME_BASE, year=2006)
+
+    # a lateral inflow needs the temperature at the upstream gauge too
+    records['12193400'] = records['12193400'].drop(columns='00010_Mean')
+    pairs = [{'Name': 'lateral', 'Downstream': '12194000', 'Upstream': ['12193400'], 'Parameters': ['00010']}]
+    with pytest.raises(ValueError, match='00010 at 12193400'):
+        w2_preprocessing.usgs_to_w2(records, pairs, str(tmp_path), time_base=TIME_BASE, year=2006)
@@ -0,0 +1,96 @@
+# Tests of the scenario generator
+
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cequalw2 import w2_io
+from cequalw2 import w2_scenario
+
+SCENARIO_CONTROL = '''\
+-   Scenario: wet
+    Filename: 2006_MahoningR_Qtr.npt
+    Operation: Scale
+    Value: 1.5
+-   Scenario: warm
+    Filename: 2006_Met.npt
+    Operation: offset
+    Value: 2.0
+    Columns: [0, 1]
+    Start: 152
+    End: 244
+-   Scenario: warm
+    Filename: 2006_MahoningR_Qtr.npt
+    Operation: shift
+    Value: 1.0
+'''
+
+
+@pytest.fixture
+def model_dir(model_path, tmp_path):
+    path = tmp_path / 'base'
+    os.makedirs(path)
+    for filename in ['w2_con.npt', '2006_MahoningR_Qtr.npt', '2006_Met.npt']:
+        shutil.copy(os.path.join(model_path, filename), path)
+    (tmp_path / 'scenarios.yaml').write_text(SCENARIO_CONTROL)
+    return path
+
+
+def _read(infile):
+    return w2_io.read_npt_opt(infile, w2_scenario.BaseFile(infile).columns,
+                              skiprows=w2_io.get_header_row_number(infile) + 1)
+
+
+def test_read_scenario_control(model_dir):
+    scenarios = w2_scenario.read_scenario_control(str(model_dir.parent / 'scenarios.yaml'))
+    assert scenarios.index.tolist() == ['wet', 'warm', 'warm']
+    assert scenarios['Operation'].tolist() == ['scale', 'offset', 'shift']
+    assert list(scenarios.columns) == w2_scenario.SCENARIO_COLUMNS
+
+    grid = w2_scenario.scenario_grid('2006_Met.npt', 'offset', [-1.0, 1.0], columns=['C1'])
+    assert grid.index.tolist() == ['2006_Met_offset_-1', '2006_Met_offset_1']
+    with pytest.raises(ValueError, match='Unknown scenario operation'):
+        w2_scenario.scenario_grid('2006_Met.npt', 'square', [1.0])
+    with pytest.raises(ValueError, match='Shifts'):
+        w2_scenario.scenario_grid('2006_Met.npt', 'shift', [1.0], start=10)
+
+
+def test_apply_scenarios(model_dir):
+    base = w2_scenario.BaseFile(str(model_dir / '2006_Met.npt'))
+    grid = pd.concat([w2_scenario.scenario_grid('2006_Met.npt', 'scale', [0.5, 2.0], columns=[2], end=10),
+                      w2_scenario.scenario_grid('2006_Met.npt', 'replace', [0.0], columns=['C5'])])
+    names, values = w2_scenario.apply_scenarios(base, grid)
+
+    assert names == ['2006_Met_scale_0.5', '2006_Met_scale_2', '2006_Met_replace_0']
+    window = base.jday <= 10
+    np.testing.assert_allclose(values[1, window, 2], base.values[window, 2] * 2.0)
+    np.testing.assert_array_equal(values[1, ~window, 2], base.values[~window, 2])
+    np.testing.assert_array_equal(values[0, :, :2], base.values[:, :2])
+    assert (values[2, :, 4] == 0.0).all()
+    with pytest.raises(ValueError, match='not found'):
+        base.column_positions(['missing'])
+
+
+def test_generate_scenarios(model_dir, tmp_path):
+    outdir = tmp_path / 'scenarios'
+    manifest = w2_scenario.generate_scenarios(str(model_dir), str(model_dir.parent / 'scenarios.yaml'), str(outdir))
+
+    assert sorted(os.listdir(outdir / 'wet')) == sorted(os.listdir(model_dir))
+    base = _read(str(model_dir / '2006_MahoningR_Qtr.npt'))
+    wet = _read(str(outdir / 'wet' / '2006_MahoningR_Qtr.npt'))
+    np.testing.assert_allclose(wet.index, base.index)
+    np.testing.assert_allclose(wet.to_numpy(), base.to_numpy() * 1.5, atol=0.005)
+    with open(model_dir / '2006_MahoningR_Qtr.npt') as f, open(outdir / 'wet' / '2006_MahoningR_Qtr.npt') as g:
+        assert [f.readline() for _ in range(4)][:3] == [g.readline() for _ in range(4)][:3]
+
+    # the warm scenario delays the flows by one day and warms the air in the summer
+    warm_flow = _read(str(outdir / 'warm' / '2006_MahoningR_Qtr.npt'))
+    days = np.array([100.0, 200.0, 300.0])
+    np.testing.assert_allclose(np.interp(days, warm_flow.index, warm_flow['C1']),
+                               np.interp(days - 1.0, base.index, base['C1']), atol=0.01)
+    warm = manifest[(manifest['Scenario'] == 'warm') & (manifest['Column'] == 'C1')]
+    assert sorted(warm['Changes']) == ['offset 2 [152-244]', 'shift 1']
+    assert os.path.isfile(outdir / w2_scenario.MANIFEST_FILE)
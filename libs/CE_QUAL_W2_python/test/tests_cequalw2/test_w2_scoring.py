@@ -0,0 +1,67 @@
+# Tests of the batch skill scoring
+
+import os
+import shutil
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cequalw2 import w2_scoring
+
+SCORING_CONTROL = '''\
+-   item: T37
+    Filename: tsr_1_seg37.csv
+    Column: T2(C)
+    Observed: observed/temperature.csv
+    Tolerance: 30min
+-   item: T
+    Filename: tsr_*.csv
+    Column: T2(C)
+    Observed: observed/temperature.csv
+    ObservedColumn: Shifted
+'''
+
+
+@pytest.fixture
+def model_dir(model_path, tmp_path):
+    """A model directory with two time series outputs and an observed file taken from the first."""
+    for filename in ['w2_con.npt', 'tsr_1_seg37.csv', 'tsr_2_seg75.csv']:
+        shutil.copy(os.path.join(model_path, filename), tmp_path)
+    model = w2_scoring.read_model_file(str(tmp_path / 'tsr_1_seg37.csv'), 2006)['T2(C)'].iloc[::10]
+    os.makedirs(tmp_path / 'observed')
+    observed = pd.DataFrame({'Temperature': model.to_numpy(), 'Shifted': model.to_numpy() + 1.0},
+                            index=pd.Index(model.index, name='Date'))
+    observed.to_csv(tmp_path / 'observed' / 'temperature.csv')
+    (tmp_path / 'scoring.yaml').write_text(SCORING_CONTROL)
+    return tmp_path
+
+
+def test_read_scoring_control_expands_patterns(model_dir):
+    control_df = w2_scoring.read_scoring_control(str(model_dir / 'scoring.yaml'), model_path=str(model_dir))
+    assert control_df.index.tolist() == ['T37', 'T:tsr_1_seg37.csv', 'T:tsr_2_seg75.csv']
+    assert control_df['Filename'].tolist() == ['tsr_1_seg37.csv', 'tsr_1_seg37.csv', 'tsr_2_seg75.csv']
+    assert pd.isna(control_df.loc['T37', 'ObservedColumn'])
+
+
+def test_score_model(model_dir):
+    outfile = str(model_dir / 'scores.db')
+    scores = w2_scoring.score_model(str(model_dir / 'scoring.yaml'), str(model_dir), outfile=outfile, processes=1)
+    scores = scores.set_index('item')
+
+    assert (scores['Run'] == model_dir.name).all()
+    assert scores.loc['T37', 'N'] == 87
+    assert scores.loc['T37', 'RMSE'] == 0.0
+    np.testing.assert_allclose(scores.loc['T:tsr_1_seg37.csv', ['ME', 'RMSE']].to_numpy(dtype=float), [-1.0, 1.0])
+    assert scores.loc['T:tsr_2_seg75.csv', 'N'] == 87
+
+    with sqlite3.connect(outfile) as db:
+        assert pd.read_sql('select count(*) as n from scores', db)['n'].iloc[0] == 3
+
+
+def test_score_model_in_worker_processes(model_dir):
+    # the observed file is compared with both model files, so it is published to shared memory
+    serial = w2_scoring.score_model(str(model_dir / 'scoring.yaml'), str(model_dir), processes=1)
+    parallel = w2_scoring.score_model(str(model_dir / 'scoring.yaml'), str(model_dir), processes=2)
+    pd.testing.assert_frame_equal(parallel, serial)
@@ -0,0 +1,47 @@
+# Tests of the shared-memory DataFrame transport
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cequalw2 import w2_shared
+
+
+def _column_sums(descriptor):
+    """Attach a shared DataFrame in a worker process and sum its columns."""
+    df = w2_shared.attach_dataframe(descriptor)
+    return df.index[-1], df.sum().to_dict()
+
+
+@pytest.fixture
+def df():
+    index = pd.date_range('2006-01-01', periods=1000, freq='h', name='Date')
+    return pd.DataFrame({'T': np.linspace(0.0, 20.0, 1000), 'Q': np.arange(1000, dtype=np.int64),
+                         'DO': np.ones(1000, dtype=np.float32)}, index=index)
+
+
+def test_attach_without_copying(df):
+    with w2_shared.publish_dataframe(df) as shared:
+        attached = w2_shared.attach_dataframe(shared.descriptor)
+        pd.testing.assert_frame_equal(attached, df, check_freq=False)
+        with pytest.raises(ValueError):
+            attached['T'].to_numpy()[0] = 1.0
+        del attached
+        w2_shared.detach_dataframes()
+
+
+def test_attach_in_worker_processes(df):
+    df.attrs['Filename'] = 'observed.csv'
+    with w2_shared.publish_dataframe(df) as shared:
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(_column_sums, [shared.descriptor] * 4))
+    for last, sums in results:
+        assert last == df.index[-1]
+        assert sums == pytest.approx(df.sum().to_dict())
+
+
+def test_unsupported_columns_are_rejected(df):
+    with pytest.raises(ValueError, match='Site'):
+        w2_shared.publish_dataframe(df.assign(Site='a'))
@@ -0,0 +1,74 @@
+# Tests of the snapshot file reader and the HDF5 snapshot store
+
+import os
+
+import numpy as np
+import pytest
+
+from cequalw2 import w2_snapshot
+
+
+@pytest.fixture
+def snapshot(model_path):
+    return w2_snapshot.read_snapshot(os.path.join(model_path, 'snp1.opt'))
+
+
+def test_read_snapshot_indexes_timesteps(snapshot):
+    assert len(snapshot) == 7
+    np.testing.assert_array_equal(snapshot.jday, [1, 11, 21, 31, 41, 51, 61])
+    assert snapshot.at(20.0).jday == 21.0
+
+
+def test_parameters_keep_wrapped_values_and_labels(snapshot):
+    parameters = snapshot.block(0).parameters
+
+    # 33 outlets, wrapped on three lines
+    np.testing.assert_array_equal(parameters['Layer [KOUT]'], np.arange(10, 43))
+    outflows = parameters['Outflow (m^3/sec) [QOUT]']
+    assert len(outflows) == 33
+    assert (outflows[0], outflows[-1]) == (0.48, 0.02)
+    # the total outflow has the same code but is kept apart
+    np.testing.assert_array_equal(parameters['Total outflow [QOUT]'], [4.39])
+
+    np.testing.assert_array_equal(parameters['Inflow [QIN]'], [1.02, 0.41, 0.26, 0.68])
+    assert parameters['Layer [KQIN]'].tolist() == ['10-10', '10-10', '12-12', '12-12']
+    assert parameters['Gregorian date [GDAY]'].tolist() == ['January 1, 2006']
+    # Fortran reals with a three-digit exponent and no E
+    assert parameters['Spatially integrated mass [CMBRS]'][0] == pytest.approx(0.61823343e-316)
+
+
+def test_profiles_and_limiting_factor_codes(snapshot):
+    block = snapshot.block(0)
+    assert block.profiles['T1'].loc[10, 37] == 1.4
+    assert block.profiles['T1'].loc[10, 'Depth'] == 0.38
+    assert block.codes['Algal group 1 limiting factor'].loc[10, 37] == 'P'
+    assert block.profiles['Algal group 1 limiting factor'].loc[10, 37] == 1.0
+
+
+def test_snapshot_store_round_trip(model_path, snapshot, tmp_path):
+    outfile = str(tmp_path / 'snp1.h5')
+    w2_snapshot.write_snapshot_store(os.path.join(model_path, 'snp1.opt'), outfile)
+    store = w2_snapshot.SnapshotStore(outfile)
+
+    np.testing.assert_array_equal(store.jday, snapshot.jday)
+    assert store.profile('T1', 1.0).loc[10, 37] == 1.4
+    assert store.codes('Algal group 1 limiting factor', 1.0).loc[10, 37] == 'P'
+    assert store.time_series('T1', 37).index[0] == 1.0
+
+    assert store.parameter('DLT').iloc[0] == 500.0
+    assert store.parameter('KQIN').iloc[0].tolist() == ['10-10', '10-10', '12-12', '12-12']
+    outflows = store.parameter('Outflow (m^3/sec) [QOUT]')
+    assert outflows.iloc[0].count() == 33
+    with pytest.raises(ValueError):
+        store.parameter('QOUT')
+
+
+def test_snapshot_store_float32(model_path, tmp_path):
+    outfile = str(tmp_path / 'snp1.h5')
+    w2_snapshot.write_snapshot_store(os.path.join(model_path, 'snp1.opt'), outfile, dtype=np.float32)
+    store = w2_snapshot.SnapshotStore(outfile)
+
+    profile = store.profile('T1', 1.0)
+    assert profile[37].dtype == np.float32
+    assert profile.loc[10, 37] == np.float32(1.4)
+    assert store.jday.dtype == np.float64
@@ -0,0 +1,117 @@
+# Tests of the summary statistics
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cequalw2 import w2_io
+from cequalw2 import w2_statistics
+
+MET_COLUMNS = ['TAIR', 'TDEW', 'WIND', 'PHI', 'CLOUD', 'SRO', 'EXTRA']
+
+
+@pytest.fixture
+def met(model_path):
+    infile = os.path.join(model_path, '2006_Met.npt')
+    return w2_io.read(infile, 2006, MET_COLUMNS, skiprows=w2_io.get_header_row_number(infile) + 1)
+
+
+def test_summary_statistics_match_describe(met):
+    shorter = met.iloc[:1000, :2].copy()
+    shorter.iloc[::3, 0] = np.nan
+    shorter.attrs = {}
+    statistics = w2_statistics.summary_statistics([met, shorter], percentiles=[0.1, 0.5, 0.9])
+
+    assert statistics.source_names() == ['2006_Met.npt', 'DataFrame 2']
+    pd.testing.assert_frame_equal(statistics.to_frame(0), met.describe(percentiles=[0.1, 0.5, 0.9]),
+                                  check_names=False, check_dtype=False)
+    pd.testing.assert_frame_equal(statistics.to_frame('DataFrame 2'),
+                                  shorter.describe(percentiles=[0.1, 0.5, 0.9]),
+                                  check_names=False, check_dtype=False)
+    assert statistics.to_frame().columns.nlevels == 2
+
+
+def test_summary_statistics_of_float32_data(met):
+    single = met.astype(np.float32)
+    statistics = w2_statistics.summary_statistics(single)
+    np.testing.assert_allclose(statistics.to_frame().to_numpy(), met.describe().to_numpy(), rtol=1e-5)
+
+
+def test_formatted_statistics():
+    df = pd.DataFrame({'A': [1.0, 2.0, 4.0], 'B': [np.nan, np.nan, np.nan]})
+    statistics = w2_statistics.summary_statistics(df)
+
+    text = statistics.format_values(precision=1)
+    assert text[:, 0].tolist() == ['3', '2.3', '1.5', '1.0', '1.5', '2.0', '3.0', '4.0']
+    assert text[0, 1] == '0'
+    assert text[1:, 1].tolist() == [''] * 7
+    markdown = statistics.to_markdown(precision=1).splitlines()
+    assert markdown[0] == '| Statistic | A | B |'
+    assert markdown[3] == '| mean | 2.3 |  |'
+
+    with pytest.raises(ValueError):
+        w2_statistics.summary_statistics(df, percentiles=[1.5])
+
+
+def _direct_metrics(model, observed):
+    """Skill metrics computed directly from their definitions."""
+    error = model - observed
+    r = np.corrcoef(model, observed)[0, 1]
+    alpha = model.std() / observed.std()
+    beta = model.mean() / observed.mean()
+    return {
+        'N': len(model),
+        'ME': error.mean(),
+        'MAE': np.abs(error).mean(),
+        'RMSE': np.sqrt((error ** 2).mean()),
+        'NSE': 1 - (error ** 2).sum() / ((observed - observed.mean()) ** 2).sum(),
+        'KGE': 1 - np.sqrt((r - 1) ** 2 + (alpha - 1) ** 2 + (beta - 1) ** 2),
+        'R2': r ** 2,
+        'PBIAS': 100 * error.sum() / observed.sum(),
+    }
+
+
+def test_skill_metrics_match_definitions():
+    rng = np.random.default_rng(1)
+    observed = 10 + rng.normal(size=(500, 2))
+    model = observed + rng.normal(0.5, 0.3, size=(500, 2))
+    model[::7, 1] = np.nan
+
+    df = w2_statistics.skill_metrics(model, observed, names=['a', 'b'])
+    assert list(df.columns) == w2_statistics.SKILL_METRICS
+    for i, name in enumerate(['a', 'b']):
+        valid = ~np.isnan(model[:, i])
+        expected = _direct_metrics(model[valid, i], observed[valid, i])
+        np.testing.assert_allclose(df.loc[name].to_numpy(dtype=float), list(expected.values()), rtol=1e-10)
+
+
+def test_chunked_accumulation_matches_one_pass():
+    rng = np.random.default_rng(2)
+    observed = rng.gamma(2.0, size=(1000, 3))
+    model = observed * 1.1 + rng.normal(size=(1000, 3))
+
+    accumulator = w2_statistics.SkillAccumulator(3)
+    for start in range(0, 1000, 137):
+        accumulator.update(model[start:start + 137], observed[start:start + 137])
+    pd.testing.assert_frame_equal(accumulator.result(), w2_statistics.skill_metrics(model, observed),
+                                  rtol=1e-10)
+
+
+def test_evaluate_skill_aligns_on_observation_times():
+    times = pd.date_range('2006-01-01', periods=96, freq='h')
+    model = pd.Series(np.arange(96.0), index=times)
+    observed = pd.Series([10.0, 20.0, 30.0, 40.0], index=times[[10, 20, 30, 40]] + pd.Timedelta('10min'))
+
+    aligned = w2_statistics.align_series(model, observed, tolerance='15min')
+    assert aligned['Model'].tolist() == [10.0, 20.0, 30.0, 40.0]
+
+    chunks = [(model.iloc[:25], observed.iloc[:2]), (model.iloc[25:], observed.iloc[2:])]
+    df = w2_statistics.evaluate_skill({'whole': (model, observed), 'chunked': chunks,
+                                       'late': (model, observed.shift(freq='10D'))}, tolerance='15min')
+    assert df.loc['whole', 'N'] == 4
+    assert df.loc['whole', 'RMSE'] == 0.0
+    assert df.loc['chunked', 'N'] == 4
+    assert df.loc['late', 'N'] == 0
+    assert np.isnan(df.loc['late', 'RMSE'])